@@ -12,14 +12,20 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
-import cloudinary
-import cloudinary.api
-import cloudinary.uploader
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .banco import configurar_banco
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Variáveis do arquivo .env (DATABASE_URL, credenciais do Cloudinary...), se ele existir
+if (BASE_DIR / '.env').exists():
+    from dotenv import load_dotenv
+    load_dotenv(BASE_DIR / '.env')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -45,24 +51,29 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'ecommerce',
-    'cloudinary_storage', # Adicionado para o Cloudinary
-    'cloudinary', # Adicionado para o Cloudinary
 ]
 
 AUTH_USER_MODEL = 'ecommerce.CustomUser'
 
 MIDDLEWARE = [
+    'ecommerce.perfil.PerfilMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'ecommerce.clientes.ClienteMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
 
+# Fração das requisições medidas pelo PerfilMiddleware (0 desliga; 1 mede todas)
+PERFIL_AMOSTRAGEM = float(os.getenv('PERFIL_AMOSTRAGEM', 0))
+# Quantas requisições recentes são guardadas por URL para as métricas
+PERFIL_JANELA = int(os.getenv('PERFIL_JANELA', 500))
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -79,18 +90,58 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'
+
+# Usa as views async da loja (ecommerce/views_async.py); ligue ao rodar com uvicorn
+VIEWS_ASSINCRONAS = os.getenv('VIEWS_ASSINCRONAS', '0').lower() in ('1', 'true', 'sim')
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+#
+# PostgreSQL com pool de conexões quando DATABASE_URL está definida; senão,
+# SQLite local com WAL (ver core/banco.py).
+
 DATABASES = {
+    'default': configurar_banco(BASE_DIR / 'db.sqlite3'),
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# O catálogo da loja usa um cache próprio ('catalogo'). Por padrão é em memória
+# (locmem); em produção pode apontar para arquivos ou para um Redis compatível:
+#   CATALOGO_CACHE_BACKEND=arquivo CATALOGO_CACHE_LOCATION=/var/tmp/catalogo
+#   CATALOGO_CACHE_BACKEND=redis   CATALOGO_CACHE_LOCATION=redis://127.0.0.1:6379/1
+
+CATALOGO_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'arquivo': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalogo': {
+        'BACKEND': CATALOGO_CACHE_BACKENDS[os.getenv('CATALOGO_CACHE_BACKEND', 'locmem')],
+        'LOCATION': os.getenv('CATALOGO_CACHE_LOCATION', 'catalogo'),
+        'TIMEOUT': int(os.getenv('CATALOGO_CACHE_TIMEOUT', 60 * 60)),
+    },
+    # Baldes do limite de requisições quando LIMITES_ARMAZENAMENTO=cache; use o Redis
+    # para que os workers compartilhem os limites
+    'limites': {
+        'BACKEND': CATALOGO_CACHE_BACKENDS[os.getenv('LIMITES_CACHE_BACKEND', 'locmem')],
+        'LOCATION': os.getenv('LIMITES_CACHE_LOCATION', 'limites'),
+    },
 }
 
+# Quantidade de produtos por página na loja
+CATALOGO_PRODUTOS_POR_PAGINA = 24
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -127,6 +178,19 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# 'local': arquivos servidos como estão (desenvolvimento);
+# 'hash': nomes com hash do conteúdo (collectstatic), para cache longo no navegador e na CDN
+ESTATICOS = os.getenv('ESTATICOS', 'local')
+ARMAZENAMENTOS_ESTATICOS = {
+    'local': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    'hash': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage',
+}
+if ESTATICOS not in ARMAZENAMENTOS_ESTATICOS:
+    raise ImproperlyConfigured(
+        f'ESTATICOS={ESTATICOS!r} inválido; use um destes: {", ".join(ARMAZENAMENTOS_ESTATICOS)}.'
+    )
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -137,24 +201,71 @@ LOGIN_REDIRECT_URL = '/produtos/'
 
 LOGIN_URL = '/login/'
 
-import os
-from dotenv import load_dotenv
-load_dotenv()
-# Configurações do Cloudinary
+# E-mails (confirmação de pedido). Em desenvolvimento são apenas exibidos no console.
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'NetworQ <nao-responda@networq.com.br>')
+
+# Configurações do Cloudinary. O SDK só é carregado no primeiro envio ou URL
+# de imagem (ver ecommerce/armazenamento.py), não na inicialização.
 CLOUDINARY_STORAGE = {
     'CLOUD_NAME': os.getenv('CLOUDINARY_STORAGE_CLOUD_NAME'),
     'API_KEY': os.getenv('CLOUDINARY_STORAGE_API_KEY'),
     'API_SECRET': os.getenv('CLOUDINARY_STORAGE_API_SECRET')
 }
 
-cloudinary.config( 
-  cloud_name = CLOUDINARY_STORAGE['CLOUD_NAME'],  
-  api_key = CLOUDINARY_STORAGE['API_KEY'],  
-  api_secret = CLOUDINARY_STORAGE['API_SECRET']  
-)
-
-DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
-STATICFILES_STORAGE = 'cloudinary_storage.storage.StaticHashedCloudinaryStorage'
-
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Sem as credenciais do Cloudinary, as imagens enviadas ficam em MEDIA_ROOT/produtos
+CLOUDINARY_ATIVO = bool(CLOUDINARY_STORAGE['CLOUD_NAME'])
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': ARMAZENAMENTOS_ESTATICOS[ESTATICOS],
+    },
+    # Imagens originais dos produtos (ver ecommerce/armazenamento.py)
+    'imagens': {
+        'BACKEND': 'ecommerce.armazenamento.CloudinaryStorage' if CLOUDINARY_ATIVO
+        else 'django.core.files.storage.FileSystemStorage',
+    },
+    # Miniaturas WebP/AVIF das imagens de produto (ver ecommerce/imagens.py)
+    'derivados': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {
+            'location': os.path.join(MEDIA_ROOT, 'derivados'),
+            'base_url': MEDIA_URL + 'derivados/',
+        },
+    },
+}
+
+# Threads usadas para gerar as miniaturas no upload (0 = gera na própria requisição)
+IMAGENS_THREADS = int(os.getenv('IMAGENS_THREADS', 2))
+
+# Validade do perfil de cliente em cache (request.cliente). O cache 'default' é local
+# a cada processo, então a invalidação ao salvar só vale no processo que salvou:
+# mantenha a validade curta.
+CLIENTE_CACHE_SEGUNDOS = int(os.getenv('CLIENTE_CACHE_SEGUNDOS', 60))
+
+# Por quanto tempo os itens do carrinho ficam com o estoque reservado
+RESERVA_ESTOQUE_MINUTOS = int(os.getenv('RESERVA_ESTOQUE_MINUTOS', 15))
+
+# Limite de requisições por usuário/IP (ver ecommerce/limites.py): rajada aceita
+# (capacidade) e fichas repostas por segundo. Remover uma entrada desliga o limite.
+LIMITES = {
+    'carrinho': {
+        'capacidade': int(os.getenv('LIMITE_CARRINHO_RAJADA', 20)),
+        'por_segundo': float(os.getenv('LIMITE_CARRINHO_POR_SEGUNDO', 2)),
+    },
+    'checkout': {
+        'capacidade': int(os.getenv('LIMITE_CHECKOUT_RAJADA', 5)),
+        'por_segundo': float(os.getenv('LIMITE_CHECKOUT_POR_SEGUNDO', 0.1)),
+    },
+}
+# memoria (por processo), cache (CACHES['limites']) ou o caminho de uma classe
+LIMITES_ARMAZENAMENTO = os.getenv('LIMITES_ARMAZENAMENTO', 'memoria')
+LIMITES_CACHE = 'limites'
+# Atrás de um proxy (ex.: Render), o IP do visitante vem deste cabeçalho: HTTP_X_FORWARDED_FOR
+LIMITES_CABECALHO_IP = os.getenv('LIMITES_CABECALHO_IP', '')
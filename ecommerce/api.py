@@ -0,0 +1,470 @@
+"""
+API JSON da loja (produtos, pedidos e carrinho), feita com views simples do Django.
+
+Listas são paginadas por cursor (?cursor=...&tamanho=...). O parâmetro
+?fields=id,nome,itens.quantidade,itens.produto.nome escolhe os campos da
+resposta; a consulta é montada a partir deles, com .only() nos campos pedidos,
+select_related para relações simples e prefetch_related para listas aninhadas.
+
+A autenticação é a mesma do site (sessão + CSRF nas escritas), e as escritas no
+carrinho e os pedidos passam pelos limites de requisições (429). As respostas
+usam orjson quando ele está instalado e o json da biblioteca padrão caso contrário.
+"""
+import json
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import historico_produtos, reservas
+from .checkout import EstoqueInsuficiente, ProdutoIndisponivel, finalizar_pedido
+from .forms import ProdutoApiForm
+from .limites import limitar
+from .models import Carrinho, Cliente, CustomUser, ItemPedido, Pedido, Produto
+from .paginacao import CursorInvalido, paginar_keyset
+from .pedidos import TransicaoInvalida, alterar_status
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+TAMANHO_PADRAO = 25
+TAMANHO_MAXIMO = 100
+
+
+class ErroApi(Exception):
+    def __init__(self, mensagem, status=400, **extras):
+        super().__init__(mensagem)
+        self.status = status
+        self.extras = extras
+
+
+_codificador = DjangoJSONEncoder()
+
+
+def _padrao_orjson(valor):
+    # Datas (com OPT_PASSTHROUGH_DATETIME) e Decimal saem iguais às do DjangoJSONEncoder,
+    # para que a resposta não dependa de o orjson estar instalado
+    return _codificador.default(valor)
+
+
+def resposta_json(dados, status=200):
+    if orjson is not None:
+        conteudo = orjson.dumps(dados, default=_padrao_orjson, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    else:
+        conteudo = json.dumps(dados, cls=DjangoJSONEncoder, ensure_ascii=False).encode()
+    return HttpResponse(conteudo, status=status, content_type='application/json')
+
+
+# Descrição dos recursos e planejamento das consultas
+
+class Relacao:
+    def __init__(self, recurso, muitos=False, campo_pai=None):
+        self.recurso = recurso
+        self.muitos = muitos
+        # Para listas: o campo do filho que aponta para o pai, necessário ao prefetch
+        self.campo_pai = campo_pai
+
+
+class Recurso:
+    """
+    Campos expostos de um model. `campos` mapeia o nome na API para o atributo do model;
+    `padrao` são os campos devolvidos quando ?fields não é informado.
+    """
+    def __init__(self, model, campos, relacoes=None, padrao=None):
+        self.model = model
+        self.campos = campos
+        self.relacoes = relacoes or {}
+        self.padrao = padrao or list(campos)
+
+    def arvore(self, nomes=None):
+        """
+        Converte ['id', 'itens.produto.nome'] em {'id': None, 'itens': {'produto': {'nome': None}}}.
+        """
+        arvore = {}
+        subcampos = {}
+        for nome in nomes or self.padrao:
+            primeiro, _, resto = nome.partition('.')
+            if primeiro in self.relacoes:
+                # "itens" sozinho usa os campos padrão do item
+                subcampos.setdefault(primeiro, []).extend([resto] if resto else self.relacoes[primeiro].recurso.padrao)
+                arvore[primeiro] = None
+            elif primeiro in self.campos and not resto:
+                arvore[primeiro] = None
+            else:
+                raise ErroApi(f'Campo desconhecido: {nome}')
+        for nome, campos in subcampos.items():
+            arvore[nome] = self.relacoes[nome].recurso.arvore(campos)
+        return arvore
+
+    def _planejar(self, arvore, prefixo=''):
+        somente = [f'{prefixo}id']
+        relacionados = []
+        prefetches = []
+        for nome, sub in arvore.items():
+            if nome not in self.relacoes:
+                somente.append(prefixo + self.campos[nome])
+                continue
+            relacao = self.relacoes[nome]
+            if relacao.muitos:
+                filhos = relacao.recurso.model.objects.order_by('id')
+                filhos = relacao.recurso.consulta(sub, filhos, extras=[relacao.campo_pai])
+                prefetches.append(Prefetch(prefixo + nome, queryset=filhos))
+            else:
+                somente.append(prefixo + nome)
+                relacionados.append(prefixo + nome)
+                sub_somente, sub_relacionados, sub_prefetches = relacao.recurso._planejar(sub, f'{prefixo}{nome}__')
+                somente += sub_somente
+                relacionados += sub_relacionados
+                prefetches += sub_prefetches
+        return somente, relacionados, prefetches
+
+    def consulta(self, arvore, queryset, extras=()):
+        """
+        Restringe o queryset aos campos da árvore (mais `extras`, ex.: os da ordenação).
+        """
+        somente, relacionados, prefetches = self._planejar(arvore)
+        queryset = queryset.only(*somente, *extras)
+        if relacionados:
+            queryset = queryset.select_related(*relacionados)
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        return queryset
+
+    def serializar(self, objeto, arvore):
+        dados = {}
+        for nome, sub in arvore.items():
+            if nome not in self.relacoes:
+                dados[nome] = getattr(objeto, self.campos[nome])
+                continue
+            relacao = self.relacoes[nome]
+            valor = getattr(objeto, nome)
+            if relacao.muitos:
+                dados[nome] = [relacao.recurso.serializar(filho, sub) for filho in valor.all()]
+            else:
+                dados[nome] = relacao.recurso.serializar(valor, sub) if valor is not None else None
+        return dados
+
+
+USUARIO = Recurso(CustomUser, {'id': 'id', 'username': 'username'})
+CLIENTE = Recurso(
+    Cliente,
+    {'id': 'id', 'telefone': 'telefone', 'endereco': 'endereco'},
+    relacoes={'user': Relacao(USUARIO)},
+    padrao=['id', 'user.username'],
+)
+PRODUTO = Recurso(
+    Produto,
+    {
+        'id': 'id', 'sku': 'sku', 'nome': 'nome', 'descricao': 'descricao',
+        'preco': 'preco', 'estoque': 'estoque', 'atualizado_em': 'atualizado_em',
+    },
+)
+ITEM_PEDIDO = Recurso(
+    ItemPedido,
+    {'id': 'id', 'quantidade': 'quantidade', 'preco': 'preco'},
+    relacoes={'produto': Relacao(PRODUTO)},
+    padrao=['id', 'quantidade', 'preco', 'produto.id', 'produto.nome'],
+)
+PEDIDO = Recurso(
+    Pedido,
+    {
+        'id': 'id', 'status': 'status', 'data_pedido': 'data_pedido', 'total': 'total',
+        'quantidade_itens': 'quantidade_itens', 'status_alterado_em': 'status_alterado_em',
+        'atualizado_em': 'atualizado_em',
+    },
+    relacoes={'cliente': Relacao(CLIENTE), 'itens': Relacao(ITEM_PEDIDO, muitos=True, campo_pai='pedido')},
+    padrao=['id', 'status', 'data_pedido', 'total', 'quantidade_itens', 'itens'],
+)
+
+
+# Infraestrutura das views
+
+def _corpo(request):
+    try:
+        dados = json.loads(request.body or b'{}')
+    except ValueError:
+        raise ErroApi('JSON inválido.')
+    if not isinstance(dados, dict):
+        raise ErroApi('O corpo deve ser um objeto JSON.')
+    return dados
+
+
+def _campos(request, recurso):
+    texto = request.GET.get('fields', '')
+    return recurso.arvore([campo.strip() for campo in texto.split(',') if campo.strip()] or None)
+
+
+def _tamanho(request):
+    try:
+        return min(max(int(request.GET.get('tamanho', TAMANHO_PADRAO)), 1), TAMANHO_MAXIMO)
+    except ValueError:
+        raise ErroApi('tamanho deve ser um número.')
+
+
+def _listar(request, recurso, queryset, ordenacao):
+    arvore = _campos(request, recurso)
+    queryset = recurso.consulta(arvore, queryset, extras=[campo.lstrip('-') for campo in ordenacao])
+    pagina = paginar_keyset(queryset, ordenacao, cursor=request.GET.get('cursor'), tamanho=_tamanho(request))
+    return resposta_json({
+        'resultados': [recurso.serializar(objeto, arvore) for objeto in pagina.itens],
+        'proximo_cursor': pagina.proximo_cursor,
+    })
+
+
+def _detalhe(request, recurso, queryset, pk, status=200):
+    arvore = _campos(request, recurso)
+    objeto = get_object_or_404(recurso.consulta(arvore, queryset), pk=pk)
+    return resposta_json(recurso.serializar(objeto, arvore), status=status)
+
+
+def endpoint(*metodos):
+    """
+    Exige login, limita os métodos HTTP e converte os erros em respostas JSON.
+    """
+    def decorator(view):
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if request.method not in metodos:
+                resposta = resposta_json({'erro': 'Método não permitido.'}, status=405)
+                resposta['Allow'] = ', '.join(metodos)
+                return resposta
+            if not request.user.is_authenticated:
+                return resposta_json({'erro': 'Autenticação necessária.'}, status=401)
+            try:
+                return view(request, *args, **kwargs)
+            except ErroApi as erro:
+                return resposta_json({'erro': str(erro), **erro.extras}, status=erro.status)
+            except CursorInvalido:
+                return resposta_json({'erro': 'Cursor inválido.'}, status=400)
+            except Http404:
+                return resposta_json({'erro': 'Não encontrado.'}, status=404)
+        return inner
+    return decorator
+
+
+def _limite_excedido(resultado):
+    return resposta_json({'erro': 'Muitas requisições.', 'tentar_em': round(resultado.espera, 1)}, status=429)
+
+
+def _exigir_empresa(request):
+    if request.user.cargo != 'empresa':
+        raise ErroApi('Acesso restrito à empresa.', status=403)
+
+
+# Produtos
+
+def _salvar_produto(request, produto=None):
+    _exigir_empresa(request)
+    dados = _corpo(request)
+    if produto is not None:
+        # PATCH: os campos ausentes mantêm o valor atual
+        atuais = {campo: getattr(produto, campo) for campo in ProdutoApiForm.Meta.fields}
+        dados = {**atuais, **dados}
+    form = ProdutoApiForm(dados, instance=produto)
+    if not form.is_valid():
+        raise ErroApi('Dados inválidos.', erros=form.errors.get_json_data())
+    return form.save()
+
+
+@endpoint('GET', 'POST')
+def produtos(request):
+    if request.method == 'POST':
+        produto = _salvar_produto(request)
+        return _detalhe(request, PRODUTO, Produto.objects.all(), produto.pk, status=201)
+    return _listar(request, PRODUTO, Produto.objects.all(), ('id',))
+
+
+@endpoint('GET', 'PATCH', 'DELETE')
+def produto(request, pk):
+    if request.method == 'PATCH':
+        _salvar_produto(request, get_object_or_404(Produto, pk=pk))
+    elif request.method == 'DELETE':
+        _exigir_empresa(request)
+        get_object_or_404(Produto, pk=pk).delete()
+        return HttpResponse(status=204)
+    return _detalhe(request, PRODUTO, Produto.objects.all(), pk)
+
+
+def _instante(request, parametro, padrao):
+    valor = request.GET.get(parametro)
+    if not valor:
+        return padrao
+    try:
+        instante = parse_datetime(valor)
+        if instante is None:
+            data = parse_date(valor)
+            instante = data and datetime.combine(data, time.min)
+    except ValueError:
+        instante = None
+    if instante is None:
+        raise ErroApi(f'{parametro} deve ser uma data ou data e hora ISO 8601.')
+    return timezone.make_aware(instante) if timezone.is_naive(instante) else instante
+
+
+def _estado(linha):
+    if linha is None:
+        return None
+    return {'registrado_em': linha.registrado_em, 'preco': linha.preco, 'estoque': linha.estoque, 'origem': linha.origem}
+
+
+@endpoint('GET')
+def produto_historico(request, pk):
+    """
+    ?em=<instante>: preço e estoque do produto naquele instante.
+    ?inicio=...&fim=...: as alterações do período (30 dias por padrão), paginadas por
+    cursor; a primeira página traz também o estado no início do período.
+    """
+    _exigir_empresa(request)
+    if not Produto.objects.filter(pk=pk).exists():
+        raise Http404
+    agora = timezone.now()
+    if 'em' in request.GET:
+        instante = _instante(request, 'em', agora)
+        return resposta_json({'em': instante, 'estado': _estado(historico_produtos.no_instante(pk, instante))})
+
+    inicio = _instante(request, 'inicio', agora - timedelta(days=30))
+    fim = _instante(request, 'fim', agora)
+    cursor = request.GET.get('cursor')
+    pagina = historico_produtos.serie(pk, inicio, fim, cursor=cursor, tamanho=_tamanho(request))
+    dados = {
+        'resultados': [_estado(linha) for linha in pagina.itens],
+        'proximo_cursor': pagina.proximo_cursor,
+    }
+    if not cursor:
+        dados['inicial'] = _estado(historico_produtos.no_instante(pk, inicio))
+    return resposta_json(dados)
+
+
+# Pedidos
+
+def _pedidos_visiveis(request):
+    # A empresa vê todos os pedidos; o cliente, só os seus
+    if request.user.cargo == 'empresa':
+        return Pedido.objects.all()
+    if not request.cliente:
+        return Pedido.objects.none()
+    return Pedido.objects.filter(cliente=request.cliente)
+
+
+def _quantidades(itens):
+    if not isinstance(itens, list) or not itens:
+        raise ErroApi('Informe "itens": [{"produto": id, "quantidade": n}, ...].')
+    quantidades = {}
+    try:
+        for item in itens:
+            produto_id, quantidade = int(item['produto']), int(item.get('quantidade', 1))
+            if quantidade < 1:
+                raise ValueError
+            quantidades[produto_id] = quantidades.get(produto_id, 0) + quantidade
+    except (KeyError, TypeError, ValueError, AttributeError):
+        raise ErroApi('Itens inválidos.')
+    return quantidades
+
+
+def _erro_estoque(erro):
+    return ErroApi(str(erro), status=409)
+
+
+@limitar('checkout', metodos=('POST',), rejeitar=_limite_excedido)
+@endpoint('GET', 'POST')
+def pedidos(request):
+    if request.method == 'POST':
+        # Cria o pedido a partir dos itens informados ou, sem itens, do carrinho
+        if not request.cliente:
+            raise ErroApi('O usuário não tem perfil de cliente.', status=403)
+        dados = _corpo(request)
+        carrinho = Carrinho.do_usuario(request.user)
+        try:
+            with transaction.atomic():
+                if 'itens' in dados:
+                    # Itens avulsos: o carrinho e as suas reservas continuam como estão
+                    pedido = finalizar_pedido(request.cliente, _quantidades(dados['itens']))
+                else:
+                    # Lido na transação que o limpa, para não apagar itens que não entraram no pedido
+                    quantidades = carrinho.quantidades()
+                    if not quantidades:
+                        raise ErroApi('O carrinho está vazio.')
+                    pedido = finalizar_pedido(request.cliente, quantidades, carrinho=carrinho)
+                    carrinho.limpar()
+        except (EstoqueInsuficiente, ProdutoIndisponivel) as erro:
+            raise _erro_estoque(erro)
+        return _detalhe(request, PEDIDO, Pedido.objects.all(), pedido.pk, status=201)
+    return _listar(request, PEDIDO, _pedidos_visiveis(request), ('-id',))
+
+
+@endpoint('GET', 'PATCH')
+def pedido(request, pk):
+    if request.method == 'PATCH':
+        _exigir_empresa(request)
+        objeto = get_object_or_404(Pedido, pk=pk)
+        novo_status = _corpo(request).get('status')
+        if novo_status not in dict(Pedido.STATUS_CHOICES):
+            raise ErroApi('Status inválido.')
+        if novo_status != objeto.status:
+            try:
+                alterar_status(objeto, novo_status, usuario=request.user)
+            except TransicaoInvalida as erro:
+                raise ErroApi(str(erro), status=409)
+    return _detalhe(request, PEDIDO, _pedidos_visiveis(request), pk)
+
+
+# Carrinho
+
+def _carrinho(carrinho):
+    itens = carrinho.itens.select_related('produto').only(
+        'quantidade', 'carrinho_id', 'produto__id', 'produto__nome', 'produto__preco',
+    ).order_by('id')
+    return resposta_json({
+        'itens': [
+            {
+                'produto': {'id': item.produto.id, 'nome': item.produto.nome, 'preco': item.produto.preco},
+                'quantidade': item.quantidade,
+            }
+            for item in itens
+        ],
+        # No SQLite a soma volta sem as casas decimais
+        'total': carrinho.total().quantize(Decimal('0.01')),
+    })
+
+
+@limitar('carrinho', metodos=('POST',), rejeitar=_limite_excedido)
+@endpoint('GET', 'POST', 'DELETE')
+def carrinho(request):
+    carrinho = Carrinho.do_usuario(request.user)
+    if request.method == 'POST':
+        dados = _corpo(request)
+        try:
+            produto_id, quantidade = int(dados['produto']), int(dados.get('quantidade', 1))
+        except (KeyError, TypeError, ValueError):
+            raise ErroApi('Informe "produto" e, opcionalmente, "quantidade".')
+        if quantidade < 1:
+            raise ErroApi('A quantidade deve ser positiva.')
+        try:
+            reservas.adicionar_ao_carrinho(carrinho, get_object_or_404(Produto, pk=produto_id), quantidade)
+        except EstoqueInsuficiente as erro:
+            raise _erro_estoque(erro)
+    elif request.method == 'DELETE':
+        with transaction.atomic():
+            carrinho.limpar()
+            reservas.liberar(carrinho)
+    return _carrinho(carrinho)
+
+
+@endpoint('DELETE')
+def carrinho_item(request, produto_id):
+    carrinho = Carrinho.do_usuario(request.user)
+    with transaction.atomic():
+        if not carrinho.remover(produto_id):
+            raise Http404
+        reservas.liberar(carrinho, [produto_id])
+    return _carrinho(carrinho)
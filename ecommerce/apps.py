@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class EcommerceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ecommerce'
+
+    def ready(self):
+        # Registra os receivers de sinais (invalidação de cache, etc.)
+        from . import signals  # noqa: F401
+        # Registra as funções executadas pela fila de tarefas
+        from . import notificacoes, vendas  # noqa: F401
@@ -0,0 +1,102 @@
+"""
+Armazenamento das imagens originais dos produtos (Produto.imagem).
+
+O armazenamento fica em STORAGES['imagens']: o Cloudinary quando as credenciais
+estão configuradas, ou o sistema de arquivos local (offline, CI, desenvolvimento).
+O SDK do Cloudinary é pesado de importar, então só é carregado e configurado na
+primeira operação com uma imagem, e não na inicialização de cada processo.
+"""
+import re
+import threading
+
+from django.conf import settings
+from django.core.files.storage import Storage, storages
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import LazyObject, empty
+
+
+# Formato gravado pelo antigo CloudinaryField: image/upload/v123/public_id.jpg
+NOME_CLOUDINARY = re.compile(
+    r'(?:(?P<resource_type>image|raw|video)/(?P<type>upload|private|authenticated)/)?'
+    r'(?:v(?P<version>\d+)/)?(?P<public_id>.*?)(\.(?P<format>[^.]+))?$'
+)
+
+_configurado = False
+_trava = threading.Lock()
+
+
+class ArmazenamentoImagens(LazyObject):
+    def _setup(self):
+        self._wrapped = storages['imagens']
+
+
+_imagens = ArmazenamentoImagens()
+
+
+def imagens():
+    # Usado como `storage` do campo: o armazenamento só é criado no primeiro uso
+    return _imagens
+
+
+@receiver(setting_changed)
+def _reiniciar(*, setting, **kwargs):
+    if setting == 'STORAGES':
+        _imagens._wrapped = empty
+
+
+def _cloudinary():
+    global _configurado
+    import cloudinary
+    import cloudinary.uploader
+
+    with _trava:
+        if not _configurado:
+            credenciais = settings.CLOUDINARY_STORAGE
+            cloudinary.config(
+                cloud_name=credenciais['CLOUD_NAME'],
+                api_key=credenciais['API_KEY'],
+                api_secret=credenciais['API_SECRET'],
+                secure=True,
+            )
+            _configurado = True
+    return cloudinary
+
+
+@deconstructible
+class CloudinaryStorage(Storage):
+    """
+    Envia as imagens ao Cloudinary. O nome devolvido é o mesmo que o CloudinaryField
+    gravava, então as imagens já existentes continuam funcionando.
+    """
+    def _recurso(self, nome):
+        partes = NOME_CLOUDINARY.match(nome)
+        return _cloudinary().CloudinaryResource(
+            public_id=partes['public_id'],
+            format=partes['format'],
+            version=partes['version'],
+            type=partes['type'] or 'upload',
+            resource_type=partes['resource_type'] or 'image',
+        )
+
+    def get_available_name(self, name, max_length=None):
+        # O Cloudinary gera um public_id único a cada envio
+        return name
+
+    def _save(self, name, content):
+        cloudinary = _cloudinary()
+        if hasattr(content, 'seekable') and content.seekable():
+            content.seek(0)
+        return cloudinary.uploader.upload_resource(content, type='upload', resource_type='image').get_prep_value()
+
+    def delete(self, name):
+        recurso = self._recurso(name)
+        _cloudinary().uploader.destroy(recurso.public_id, type=recurso.type, resource_type=recurso.resource_type)
+
+    def exists(self, name):
+        # Só usado por get_available_name, que não consulta o Cloudinary
+        return False
+
+    def url(self, name):
+        return self._recurso(name).url
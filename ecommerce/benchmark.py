@@ -0,0 +1,119 @@
+"""
+Utilitários para os comandos de benchmark (manage.py benchmark_*).
+
+Os benchmarks rodam sempre em um banco de testes descartável, nunca no banco configurado.
+"""
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connection
+
+from .models import Cliente, CustomUser, ItemPedido, Pedido, Produto
+from .pedidos import atualizar_totais
+
+
+PALAVRAS = [
+    'celular', 'samsung', 'galaxy', 'fone', 'bluetooth', 'carregador', 'cabo', 'capa',
+    'notebook', 'teclado', 'mouse', 'monitor', 'tela', 'memoria', 'ssd', 'roteador',
+    'wifi', 'camera', 'smartwatch', 'caixa', 'som', 'tablet', 'placa', 'video',
+    'processador', 'gamer', 'usb', 'hdmi', 'bateria', 'portatil', 'preto', 'branco',
+]
+
+
+@contextmanager
+def banco_temporario():
+    """
+    Cria um banco de testes (com todas as migrações) e o destrói ao final.
+    """
+    nome_original = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(nome_original, verbosity=0)
+
+
+def cronometrar(funcao, repeticoes=20):
+    """
+    Executa a função várias vezes e retorna estatísticas de tempo em milissegundos.
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return {'repeticoes': repeticoes, **estatisticas(tempos)}
+
+
+def estatisticas(tempos):
+    """
+    Média, p50 e p99 de uma lista (não vazia) de tempos em milissegundos.
+    """
+    tempos = sorted(tempos)
+    return {
+        'media_ms': round(statistics.mean(tempos), 3),
+        'p50_ms': round(tempos[len(tempos) // 2], 3),
+        'p99_ms': round(tempos[min(len(tempos) - 1, int(len(tempos) * 0.99))], 3),
+    }
+
+
+def gerar_produtos(quantidade, tamanho_lote=5000, semente=42):
+    """
+    Cria produtos sintéticos com nomes e descrições aleatórios.
+    """
+    aleatorio = random.Random(semente)
+    criados = 0
+    while criados < quantidade:
+        lote = min(tamanho_lote, quantidade - criados)
+        Produto.objects.bulk_create([
+            Produto(
+                nome=f"{' '.join(aleatorio.choices(PALAVRAS, k=3)).title()} Modelo {aleatorio.randrange(16 ** 5):05X}",
+                descricao=' '.join(aleatorio.choices(PALAVRAS, k=25)),
+                preco=Decimal(aleatorio.randint(100, 500000)) / 100,
+                estoque=aleatorio.randint(0, 100),
+            )
+            for _ in range(lote)
+        ])
+        criados += lote
+
+
+def gerar_clientes(quantidade, tamanho_lote=5000, prefixo='cliente'):
+    """
+    Cria usuários (sem senha utilizável) e seus perfis de cliente.
+    """
+    criados = 0
+    while criados < quantidade:
+        lote = min(tamanho_lote, quantidade - criados)
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'{prefixo}{criados + i}', password='!')
+            for i in range(lote)
+        ])
+        Cliente.objects.bulk_create([Cliente(user=user) for user in users])
+        criados += lote
+
+
+def gerar_pedidos(quantidade, tamanho_lote=5000, semente=42):
+    """
+    Cria pedidos de clientes e produtos já existentes, com 1 a 3 itens cada.
+    """
+    aleatorio = random.Random(semente)
+    clientes = list(Cliente.objects.values_list('id', flat=True))
+    produtos = list(Produto.objects.values_list('id', 'preco'))
+    status = [codigo for codigo, _ in Pedido.STATUS_CHOICES]
+    criados = 0
+    while criados < quantidade:
+        lote = min(tamanho_lote, quantidade - criados)
+        pedidos = Pedido.objects.bulk_create([
+            Pedido(cliente_id=aleatorio.choice(clientes), status=aleatorio.choice(status))
+            for _ in range(lote)
+        ])
+        itens = []
+        for pedido in pedidos:
+            for produto_id, preco in aleatorio.sample(produtos, k=min(len(produtos), aleatorio.randint(1, 3))):
+                itens.append(ItemPedido(pedido=pedido, produto_id=produto_id, preco=preco, quantidade=aleatorio.randint(1, 5)))
+        ItemPedido.objects.bulk_create(itens)
+        atualizar_totais([pedido.pk for pedido in pedidos])
+        criados += lote
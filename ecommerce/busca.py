@@ -0,0 +1,161 @@
+"""
+Busca textual de produtos por nome e descrição.
+
+O índice fica em uma tabela separada, mantida pelo próprio banco:
+- SQLite: tabela virtual FTS5 (ecommerce_produto_fts);
+- PostgreSQL: tabela com uma coluna tsvector e índice GIN (ecommerce_produto_busca).
+
+Em outros bancos a busca cai para um filtro icontains.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Produto
+
+
+TABELA_SQLITE = 'ecommerce_produto_fts'
+TABELA_POSTGRES = 'ecommerce_produto_busca'
+CONFIGURACAO_POSTGRES = 'portuguese'
+
+
+def _vendor(conexao=None):
+    return (conexao or connection).vendor
+
+
+def _termos(texto):
+    return re.findall(r'\w+', texto or '')
+
+
+def criar_indice(conexao):
+    """
+    Cria a estrutura do índice para o banco da conexão. Usada pela migração.
+    """
+    with conexao.cursor() as cursor:
+        if _vendor(conexao) == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA_SQLITE} "
+                "USING fts5(nome, descricao, tokenize='unicode61 remove_diacritics 2')"
+            )
+        elif _vendor(conexao) == 'postgresql':
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABELA_POSTGRES} ("
+                "produto_id bigint PRIMARY KEY REFERENCES ecommerce_produto(id) ON DELETE CASCADE, "
+                "documento tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {TABELA_POSTGRES}_documento_idx "
+                f"ON {TABELA_POSTGRES} USING GIN (documento)"
+            )
+
+
+def remover_indice(conexao):
+    with conexao.cursor() as cursor:
+        if _vendor(conexao) == 'sqlite':
+            cursor.execute(f"DROP TABLE IF EXISTS {TABELA_SQLITE}")
+        elif _vendor(conexao) == 'postgresql':
+            cursor.execute(f"DROP TABLE IF EXISTS {TABELA_POSTGRES}")
+
+
+def _inserir_sql(conexao, filtro):
+    # O documento é montado pelo próprio banco a partir da tabela de produtos
+    if _vendor(conexao) == 'sqlite':
+        return (
+            f"INSERT INTO {TABELA_SQLITE} (rowid, nome, descricao) "
+            f"SELECT id, nome, descricao FROM ecommerce_produto WHERE {filtro}"
+        )
+    return (
+        f"INSERT INTO {TABELA_POSTGRES} (produto_id, documento) "
+        f"SELECT id, setweight(to_tsvector('{CONFIGURACAO_POSTGRES}', nome), 'A') || "
+        f"setweight(to_tsvector('{CONFIGURACAO_POSTGRES}', descricao), 'B') "
+        f"FROM ecommerce_produto WHERE {filtro} "
+        "ON CONFLICT (produto_id) DO UPDATE SET documento = EXCLUDED.documento"
+    )
+
+
+def indexar_produtos(ids, conexao=None):
+    """
+    Atualiza o índice para os produtos informados (inclusão ou alteração).
+    """
+    conexao = conexao or connection
+    ids = [int(produto_id) for produto_id in ids]
+    if not ids or _vendor(conexao) not in ('sqlite', 'postgresql'):
+        return
+    marcadores = ', '.join(['%s'] * len(ids))
+    with conexao.cursor() as cursor:
+        if _vendor(conexao) == 'sqlite':
+            # FTS5 não tem upsert: remove as linhas antigas antes de inserir
+            cursor.execute(f"DELETE FROM {TABELA_SQLITE} WHERE rowid IN ({marcadores})", ids)
+        cursor.execute(_inserir_sql(conexao, f"id IN ({marcadores})"), ids)
+
+
+def remover_produtos(ids, conexao=None):
+    conexao = conexao or connection
+    ids = [int(produto_id) for produto_id in ids]
+    if not ids:
+        return
+    marcadores = ', '.join(['%s'] * len(ids))
+    with conexao.cursor() as cursor:
+        if _vendor(conexao) == 'sqlite':
+            cursor.execute(f"DELETE FROM {TABELA_SQLITE} WHERE rowid IN ({marcadores})", ids)
+        elif _vendor(conexao) == 'postgresql':
+            cursor.execute(f"DELETE FROM {TABELA_POSTGRES} WHERE produto_id IN ({marcadores})", ids)
+
+
+def reconstruir_indice(tamanho_lote=10000, conexao=None):
+    """
+    Refaz o índice inteiro em lotes por faixa de id. Retorna quantos produtos foram indexados.
+    """
+    conexao = conexao or connection
+    if _vendor(conexao) not in ('sqlite', 'postgresql'):
+        return 0
+    tabela = TABELA_SQLITE if _vendor(conexao) == 'sqlite' else TABELA_POSTGRES
+    with conexao.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {tabela}")
+        cursor.execute("SELECT MIN(id), MAX(id) FROM ecommerce_produto")
+        menor, maior = cursor.fetchone()
+        if menor is None:
+            return 0
+        for inicio in range(menor, maior + 1, tamanho_lote):
+            cursor.execute(_inserir_sql(conexao, "id >= %s AND id < %s"), [inicio, inicio + tamanho_lote])
+        cursor.execute(f"SELECT COUNT(*) FROM {tabela}")
+        return cursor.fetchone()[0]
+
+
+def _ids_encontrados(termos, limite):
+    with connection.cursor() as cursor:
+        if _vendor() == 'sqlite':
+            consulta = ' '.join(f'"{termo}"*' for termo in termos)
+            cursor.execute(
+                f"SELECT rowid FROM {TABELA_SQLITE} WHERE {TABELA_SQLITE} MATCH %s ORDER BY rank LIMIT %s",
+                [consulta, limite],
+            )
+        else:
+            consulta = ' & '.join(f"{termo}:*" for termo in termos)
+            cursor.execute(
+                f"SELECT produto_id FROM {TABELA_POSTGRES}, to_tsquery('{CONFIGURACAO_POSTGRES}', %s) consulta "
+                "WHERE documento @@ consulta ORDER BY ts_rank(documento, consulta) DESC LIMIT %s",
+                [consulta, limite],
+            )
+        return [linha[0] for linha in cursor.fetchall()]
+
+
+def buscar_produtos(texto, limite=48):
+    """
+    Retorna a lista de produtos que combinam com o texto, os mais relevantes primeiro.
+    Cada palavra digitada precisa aparecer (como prefixo) no nome ou na descrição.
+    """
+    termos = _termos(texto)
+    if not termos:
+        return []
+
+    if _vendor() not in ('sqlite', 'postgresql'):
+        filtro = Q()
+        for termo in termos:
+            filtro &= Q(nome__icontains=termo) | Q(descricao__icontains=termo)
+        return list(Produto.objects.com_disponivel().filter(filtro).order_by('id')[:limite])
+
+    ids = _ids_encontrados(termos, limite)
+    produtos = Produto.objects.com_disponivel().in_bulk(ids)
+    return [produtos[produto_id] for produto_id in ids if produto_id in produtos]
@@ -0,0 +1,118 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.paginator import Paginator
+from django.template.loader import render_to_string
+
+from .models import Produto
+
+
+CHAVE_VERSAO = 'catalogo:versao'
+
+
+def cache_catalogo():
+    return caches['catalogo']
+
+
+def versao_catalogo():
+    """
+    Retorna a versão atual do catálogo. Ela faz parte da chave de todas as
+    páginas em cache, então trocar a versão invalida todas de uma vez.
+    """
+    cache = cache_catalogo()
+    versao = cache.get(CHAVE_VERSAO)
+    if versao is None:
+        # Começa a partir do relógio para não reaproveitar versões antigas
+        # caso a chave seja despejada do cache ou o processo reinicie.
+        cache.add(CHAVE_VERSAO, int(time.time() * 1000), timeout=None)
+        versao = cache.get(CHAVE_VERSAO)
+    return versao
+
+
+async def aversao_catalogo():
+    cache = cache_catalogo()
+    versao = await cache.aget(CHAVE_VERSAO)
+    if versao is None:
+        await cache.aadd(CHAVE_VERSAO, int(time.time() * 1000), timeout=None)
+        versao = await cache.aget(CHAVE_VERSAO)
+    return versao
+
+
+def invalidar_catalogo():
+    """
+    Incrementa a versão do catálogo, descartando todas as páginas em cache.
+    """
+    cache = cache_catalogo()
+    try:
+        cache.incr(CHAVE_VERSAO)
+    except ValueError:
+        # A chave ainda não existe (ou foi despejada): cria uma versão nova
+        versao_catalogo()
+
+
+def _numero_pagina(numero):
+    try:
+        return max(int(numero), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def _paginator():
+    return Paginator(Produto.objects.com_disponivel().order_by('id'), settings.CATALOGO_PRODUTOS_POR_PAGINA)
+
+
+def _total_paginas():
+    return _paginator().num_pages
+
+
+def _renderizar_pagina(numero):
+    page_obj = _paginator().get_page(numero)
+    return render_to_string('ecommerce/_grade_produtos.html', {
+        'produtos': page_obj.object_list,
+        'page_obj': page_obj,
+    })
+
+
+def grade_produtos(numero_pagina):
+    """
+    Retorna o HTML da grade de produtos de uma página do catálogo.
+
+    O fragmento não depende do usuário, então é renderizado uma vez e
+    servido do cache até que algum produto mude.
+    """
+    cache = cache_catalogo()
+    versao = versao_catalogo()
+    # A chave usa a página já limitada ao total, para números fora da faixa não criarem entradas novas
+    paginas = cache.get(f'catalogo:{versao}:paginas')
+    if paginas is None:
+        paginas = _total_paginas()
+        cache.set(f'catalogo:{versao}:paginas', paginas)
+    numero = min(_numero_pagina(numero_pagina), paginas)
+    chave = f'catalogo:{versao}:pagina:{numero}'
+    html = cache.get(chave)
+    if html is None:
+        html = _renderizar_pagina(numero)
+        cache.set(chave, html)
+    return html
+
+
+async def agrade_produtos(numero_pagina):
+    """
+    Versão async de grade_produtos(): o acerto no cache não bloqueia o event loop;
+    só a renderização de uma página ausente roda em uma thread.
+    """
+    cache = cache_catalogo()
+    versao = await aversao_catalogo()
+    paginas = await cache.aget(f'catalogo:{versao}:paginas')
+    if paginas is None:
+        paginas = await sync_to_async(_total_paginas)()
+        await cache.aset(f'catalogo:{versao}:paginas', paginas)
+    numero = min(_numero_pagina(numero_pagina), paginas)
+    chave = f'catalogo:{versao}:pagina:{numero}'
+    html = await cache.aget(chave)
+    if html is None:
+        html = await sync_to_async(_renderizar_pagina)(numero)
+        await cache.aset(chave, html)
+    return html
@@ -0,0 +1,119 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from . import historico_produtos, tarefas
+from .catalogo import invalidar_catalogo
+from .models import Produto, Pedido, ItemPedido
+
+
+class EstoqueInsuficiente(Exception):
+    """
+    Levantada quando algum item do carrinho não tem estoque suficiente.
+    Nenhuma alteração é gravada no banco quando isso acontece.
+    """
+    def __init__(self, produtos):
+        self.produtos = produtos
+        nomes = ', '.join(produto.nome for produto in produtos)
+        super().__init__(f'Estoque insuficiente para: {nomes}')
+
+
+class ProdutoIndisponivel(Exception):
+    """
+    Levantada quando um produto do carrinho não existe mais no catálogo.
+    """
+
+
+def _quantidade_por_produto(quantidades):
+    # Monta um CASE ... WHEN para usar a quantidade de cada produto na mesma query
+    return Case(
+        *[When(pk=produto_id, then=Value(quantidade)) for produto_id, quantidade in quantidades.items()],
+        output_field=IntegerField(),
+    )
+
+
+def finalizar_pedido(cliente, quantidades, carrinho=None):
+    """
+    Cria um pedido para o cliente a partir de um dicionário {produto_id: quantidade}.
+
+    Tudo acontece dentro de uma única transação:
+    - os produtos são buscados e travados com uma única query (select_for_update),
+      sempre na ordem do id, para checkouts concorrentes não se travarem mutuamente;
+    - os itens do pedido são gravados com bulk_create;
+    - o estoque é decrementado com um único UPDATE condicional usando F().
+
+    Unidades reservadas por outros carrinhos não podem ser vendidas; as reservas
+    do próprio `carrinho` contam a favor e são consumidas pelo pedido.
+
+    Se algum produto não tiver estoque suficiente, nada é gravado e
+    EstoqueInsuficiente é levantada.
+    """
+    quantidades = {int(produto_id): int(quantidade) for produto_id, quantidade in quantidades.items()}
+
+    with transaction.atomic():
+        travados = (
+            Produto.objects.select_for_update().com_disponivel(exceto_carrinho=carrinho)
+            .filter(pk__in=list(quantidades)).order_by('pk')
+        )
+        produtos = {produto.pk: produto for produto in travados}
+        if len(produtos) != len(quantidades):
+            raise ProdutoIndisponivel('Um ou mais produtos do carrinho não estão mais disponíveis.')
+
+        sem_estoque = [
+            produto for produto_id, produto in produtos.items()
+            if produto.disponivel < quantidades[produto_id]
+        ]
+        if sem_estoque:
+            raise EstoqueInsuficiente(sem_estoque)
+
+        # Total e quantidade de itens ficam gravados no pedido (ver ecommerce/pedidos.py)
+        pedido = Pedido.objects.create(
+            cliente=cliente,
+            total=sum(produto.preco * quantidades[produto_id] for produto_id, produto in produtos.items()),
+            quantidade_itens=sum(quantidades.values()),
+        )
+        ItemPedido.objects.bulk_create([
+            ItemPedido(
+                pedido=pedido,
+                produto=produto,
+                quantidade=quantidades[produto_id],
+                preco=produto.preco,
+            )
+            for produto_id, produto in produtos.items()
+        ])
+
+        # O filtro estoque >= quantidade garante que nunca vendemos além do estoque,
+        # mesmo em bancos onde o select_for_update não trava linhas (ex.: SQLite).
+        quantidade = _quantidade_por_produto(quantidades)
+        agora = timezone.now()
+        atualizados = (
+            Produto.objects
+            .filter(pk__in=quantidades)
+            .alias(quantidade_pedida=quantidade)
+            .filter(estoque__gte=F('quantidade_pedida'))
+            .update(estoque=F('estoque') - quantidade, atualizado_em=agora)
+        )
+        if atualizados != len(quantidades):
+            raise EstoqueInsuficiente(list(produtos.values()))
+        # Os produtos estão travados desde a leitura, então o estoque final é conhecido
+        historico_produtos.registrar([
+            (produto_id, produto.preco, produto.estoque - quantidades[produto_id])
+            for produto_id, produto in produtos.items()
+        ], 'checkout', agora)
+        if carrinho is not None:
+            carrinho.reservas.filter(produto_id__in=quantidades).delete()
+        # O resumo do cliente é atualizado pelo post_save do pedido (ver signals.py)
+
+        # O restante do pós-checkout roda fora da requisição, pelo worker de tarefas
+        tarefas.enfileirar(
+            'vendas.registrar_pedidos', {'pedido_ids': [pedido.pk], 'status': pedido.status},
+            chave=f'vendas:pedido:{pedido.pk}',
+        )
+        tarefas.enfileirar('pedidos.enviar_confirmacao', {'pedido_id': pedido.pk}, chave=f'confirmacao:pedido:{pedido.pk}')
+
+        # O UPDATE em massa não dispara post_save; se algum produto esgotou,
+        # o selo "Sem estoque" do catálogo em cache precisa ser atualizado.
+        if any(produto.disponivel == quantidades[produto_id] for produto_id, produto in produtos.items()):
+            transaction.on_commit(invalidar_catalogo)
+
+    return pedido
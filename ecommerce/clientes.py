@@ -0,0 +1,97 @@
+"""
+Perfil de cliente do usuário logado, resolvido no máximo uma vez por requisição.
+
+O ClienteMiddleware coloca em request.cliente um objeto preguiçoso: a primeira
+leitura busca o perfil no cache (por usuário, com validade curta) e, se não
+estiver lá, no banco. Usuários sem perfil (ex.: empresa) também ficam em cache.
+Os sinais de Cliente (signals.py) apagam a entrada ao salvar ou excluir o perfil.
+
+Como o objeto é preguiçoso, teste-o pela veracidade (`if request.cliente:`),
+não com `is None`. Em views async use `await request.acliente()`.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+from .models import Cliente
+
+
+# Guardado no cache para usuários sem perfil, já que None significa "não está no cache"
+SEM_CLIENTE = 'sem-cliente'
+
+
+def chave(user_id):
+    return f'cliente:usuario:{user_id}'
+
+
+def _resultado(valor, user):
+    if valor == SEM_CLIENTE:
+        return None
+    # O perfil é guardado sem o usuário; reaproveita o que a requisição já carregou
+    valor.user = user
+    return valor
+
+
+def _para_cache(cliente):
+    if cliente is None:
+        return SEM_CLIENTE
+    cliente._state.fields_cache.pop('user', None)
+    return cliente
+
+
+def cliente_do_usuario(user):
+    if not user.is_authenticated:
+        return None
+    valor = cache.get(chave(user.pk))
+    if valor is None:
+        valor = _para_cache(Cliente.objects.filter(user=user).first())
+        cache.set(chave(user.pk), valor, settings.CLIENTE_CACHE_SEGUNDOS)
+    return _resultado(valor, user)
+
+
+async def acliente_do_usuario(user):
+    if not user.is_authenticated:
+        return None
+    valor = await cache.aget(chave(user.pk))
+    if valor is None:
+        valor = _para_cache(await Cliente.objects.filter(user=user).afirst())
+        await cache.aset(chave(user.pk), valor, settings.CLIENTE_CACHE_SEGUNDOS)
+    return _resultado(valor, user)
+
+
+def invalidar(user_id):
+    cache.delete(chave(user_id))
+
+
+class ClienteMiddleware:
+    """
+    Disponibiliza request.cliente (e request.acliente() para views async).
+    Deve vir depois do AuthenticationMiddleware. Funciona sob WSGI e ASGI, sem
+    que o Django precise adaptar a cadeia de middlewares com threads.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _preparar(self, request):
+        request.cliente = SimpleLazyObject(lambda: cliente_do_usuario(request.user))
+
+        async def acliente():
+            return await acliente_do_usuario(await request.auser())
+
+        request.acliente = acliente
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self._preparar(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self._preparar(request)
+        return await self.get_response(request)
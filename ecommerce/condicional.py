@@ -0,0 +1,140 @@
+"""
+GET condicional (ETag / Last-Modified) para as páginas de leitura.
+
+Cada página tem uma função de validadores que faz uma consulta barata (versão do
+catálogo, MAX(atualizado_em), COUNT) e devolve as partes do ETag e a data da
+última modificação. Se o navegador já tem a versão atual, a resposta é um 304
+sem executar a view nem renderizar templates.
+
+As páginas dependem do usuário (nome no menu, carrinho, pedidos), então o ETag
+inclui o id do usuário e o segredo CSRF embutido nos formulários, e as respostas
+levam Vary: Cookie e Cache-Control private para usuários logados. Com mensagens pendentes a página é sempre renderizada,
+para que a mensagem seja exibida.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib import messages
+from django.middleware.csrf import get_token
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .catalogo import versao_catalogo
+from .models import ItemCarrinho, Pedido, ResumoCliente
+
+
+def _etag(partes):
+    return '"%s"' % hashlib.md5(':'.join(str(parte) for parte in partes).encode()).hexdigest()
+
+
+def _preparar(validadores, request, args, kwargs):
+    """
+    Retorna (resposta 304/412 ou None, etag, última modificação, privado).
+    """
+    privado = request.user.is_authenticated
+    if len(messages.get_messages(request)):
+        return None, None, None, privado
+    resultado = validadores(request, *args, **kwargs)
+    if resultado is None:
+        return None, None, None, privado
+    partes, ultima_modificacao = resultado
+    # As páginas trazem o token CSRF (ex.: formulário de logout); o login troca o segredo,
+    # e uma página revalidada com o segredo antigo daria 403 no próximo POST
+    get_token(request)  # garante o segredo (e o cookie) já na primeira resposta
+    etag = _etag([request.user.pk or 0, request.META['CSRF_COOKIE'], *partes])
+    ultima_modificacao = int(ultima_modificacao.timestamp()) if ultima_modificacao else None
+    resposta = get_conditional_response(request, etag=etag, last_modified=ultima_modificacao)
+    return resposta, etag, ultima_modificacao, privado
+
+
+def _finalizar(request, response, etag, ultima_modificacao, privado):
+    patch_vary_headers(response, ['Cookie'])
+    # no-cache: o navegador guarda a página, mas revalida (e recebe 304) a cada acesso
+    if privado:
+        patch_cache_control(response, no_cache=True, private=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    if request.method in ('GET', 'HEAD'):
+        if etag:
+            response.headers.setdefault('ETag', etag)
+        if ultima_modificacao and not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(ultima_modificacao)
+    return response
+
+
+def get_condicional(validadores):
+    """
+    Como o decorator condition() do Django, mas com uma única função de validadores
+    (uma consulta para ETag e Last-Modified) e suporte a views async, em que a
+    consulta roda em uma thread.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def inner(request, *args, **kwargs):
+                resposta, *validacao = await sync_to_async(_preparar)(validadores, request, args, kwargs)
+                if resposta is None:
+                    resposta = await view(request, *args, **kwargs)
+                return _finalizar(request, resposta, *validacao)
+        else:
+            @wraps(view)
+            def inner(request, *args, **kwargs):
+                resposta, *validacao = _preparar(validadores, request, args, kwargs)
+                if resposta is None:
+                    resposta = view(request, *args, **kwargs)
+                return _finalizar(request, resposta, *validacao)
+        return inner
+    return decorator
+
+
+def itens_no_carrinho(request):
+    """
+    Quantidade de itens no carrinho do usuário, contada uma vez por requisição:
+    a loja usa o mesmo número no ETag e no cabeçalho da página.
+    """
+    if not hasattr(request, '_itens_no_carrinho'):
+        request._itens_no_carrinho = 0
+        if request.user.is_authenticated:
+            request._itens_no_carrinho = ItemCarrinho.objects.filter(carrinho__user=request.user).count()
+    return request._itens_no_carrinho
+
+
+async def aitens_no_carrinho(request):
+    if not hasattr(request, '_itens_no_carrinho'):
+        request._itens_no_carrinho = 0
+        user = await request.auser()
+        if user.is_authenticated:
+            request._itens_no_carrinho = await ItemCarrinho.objects.filter(carrinho__user=user).acount()
+    return request._itens_no_carrinho
+
+
+def validadores_loja(request):
+    # A versão do catálogo muda com qualquer alteração de produto ou esgotamento por reserva
+    return [versao_catalogo(), request.GET.get('page', ''), itens_no_carrinho(request)], None
+
+
+def validadores_meus_pedidos(request):
+    # O resumo do cliente muda com qualquer alteração nos seus pedidos (ver ecommerce/pedidos.py),
+    # então a validação é uma leitura por chave primária, qualquer que seja o tamanho do histórico
+    if not request.cliente:
+        return [0, None], None
+    resumo = ResumoCliente.objects.filter(cliente=request.cliente).values_list('quantidade_pedidos', 'atualizado_em').first()
+    if resumo is None:
+        return [0, None], None
+    return list(resumo), resumo[1]
+
+
+def validadores_pedido(request, pk=None, pedido_id=None):
+    # O detalhe mostra os nomes dos produtos, então também depende da alteração mais recente deles
+    linha = (
+        Pedido.objects.filter(pk=pk or pedido_id)
+        .annotate(produtos=Max('itens__produto__atualizado_em'))
+        .values_list('atualizado_em', 'produtos')
+        .first()
+    )
+    if linha is None:
+        return None
+    ultima = max(data for data in linha if data is not None)
+    return [pk or pedido_id, *linha], ultima
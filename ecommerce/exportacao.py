@@ -0,0 +1,62 @@
+"""
+Respostas de exportação em streaming (CSV e JSON Lines).
+
+As linhas são geradas sob demanda e escritas direto na resposta, então a
+memória usada não depende da quantidade de registros exportados.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+}
+
+
+class _Eco:
+    """
+    Objeto "arquivo" que devolve o que recebe, para usar o csv.writer em streaming.
+    """
+    def write(self, valor):
+        return valor
+
+
+def linhas_csv(campos, registros):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(campos)
+    for registro in registros:
+        yield escritor.writerow([registro.get(campo, '') for campo in campos])
+
+
+def linhas_jsonl(registros):
+    for registro in registros:
+        yield json.dumps(registro, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def continuar_apos(queryset, apos):
+    """
+    Ordena pelo id e, com `apos` (o último id recebido), continua uma exportação
+    interrompida a partir do registro seguinte. Levanta ValueError se `apos` não for um número.
+    """
+    queryset = queryset.order_by('id')
+    if apos:
+        queryset = queryset.filter(id__gt=int(apos))
+    return queryset
+
+
+def resposta_exportacao(registros, campos, formato, nome_arquivo):
+    """
+    Monta uma StreamingHttpResponse para os registros (dicionários) no formato pedido.
+    """
+    tipo, extensao = FORMATOS[formato]
+    if formato == 'csv':
+        linhas = linhas_csv(campos, registros)
+    else:
+        linhas = linhas_jsonl(registros)
+    resposta = StreamingHttpResponse(linhas, content_type=tipo)
+    resposta['Content-Disposition'] = f'attachment; filename="{nome_arquivo}.{extensao}"'
+    return resposta
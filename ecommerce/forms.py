@@ -1,4 +1,7 @@
+from datetime import datetime, time, timedelta
+
 from django import forms
+from django.utils import timezone
 from django.contrib.auth.forms import UserCreationForm
 from .models import CustomUser, Pedido, Produto
 
@@ -22,3 +25,97 @@ class PedidoForm(forms.ModelForm):
     class Meta:
         model = Pedido
         fields = ['cliente']
+
+
+def _inicio_do_dia(dia):
+    # Meia-noite no fuso local, como o __date compararia
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+class PedidoFiltroForm(forms.Form):
+    """
+    Filtros da lista de pedidos da área da empresa.
+    """
+    status = forms.ChoiceField(
+        choices=[('', 'Todos')] + Pedido.STATUS_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    data_inicio = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+    )
+    data_fim = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+    )
+    valor_minimo = forms.DecimalField(
+        required=False,
+        min_value=0,
+        decimal_places=2,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
+    )
+    valor_maximo = forms.DecimalField(
+        required=False,
+        min_value=0,
+        decimal_places=2,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
+    )
+    ordem = forms.ChoiceField(
+        choices=[('', 'Mais recentes'), ('maior_valor', 'Maior valor'), ('menor_valor', 'Menor valor')],
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+
+    # Ordenações da paginação por cursor; a do valor usa o índice pedido_total_idx
+    ORDENACOES = {
+        '': ('-data_pedido', '-id'),
+        'maior_valor': ('-total', '-id'),
+        'menor_valor': ('total', 'id'),
+    }
+
+    def ordenacao(self):
+        ordem = self.cleaned_data.get('ordem', '') if self.is_valid() else ''
+        return self.ORDENACOES[ordem]
+
+    def filtrar(self, queryset, prefixo=''):
+        # Com prefixo (ex.: 'pedido__'), filtra um queryset de outro model pelos campos do pedido
+        if not self.is_valid():
+            return queryset
+        inicio, fim = self.cleaned_data['data_inicio'], self.cleaned_data['data_fim']
+        filtros = {
+            'total__gte': self.cleaned_data['valor_minimo'],
+            'total__lte': self.cleaned_data['valor_maximo'],
+            'status': self.cleaned_data['status'] or None,
+            # Intervalos de instantes, e não __date, para o banco usar o índice (status, data_pedido)
+            'data_pedido__gte': _inicio_do_dia(inicio) if inicio else None,
+            'data_pedido__lt': _inicio_do_dia(fim + timedelta(days=1)) if fim else None,
+        }
+        return queryset.filter(**{prefixo + campo: valor for campo, valor in filtros.items() if valor is not None})
+
+
+class ProdutoImportacaoForm(forms.Form):
+    """
+    Valida uma linha do arquivo de importação de produtos.
+    """
+    sku = forms.CharField(max_length=64)
+    nome = forms.CharField(max_length=100)
+    descricao = forms.CharField(required=False)
+    preco = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    estoque = forms.IntegerField(min_value=0)
+
+
+class ProdutoApiForm(forms.ModelForm):
+    """
+    Valida os produtos criados ou alterados pela API JSON.
+    """
+    class Meta:
+        model = Produto
+        fields = ['sku', 'nome', 'descricao', 'preco', 'estoque']
+
+
+class ImportacaoProdutosForm(forms.Form):
+    arquivo = forms.FileField(
+        help_text='CSV com cabeçalho (sku, nome, descricao, preco, estoque) ou JSON Lines com as mesmas chaves.',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.jsonl,.ndjson'}),
+    )
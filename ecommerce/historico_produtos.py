@@ -0,0 +1,96 @@
+"""
+Histórico de preço e estoque dos produtos (HistoricoProduto).
+
+Cada alteração grava uma linha com o preço e o estoque resultantes, só com
+inclusões e sempre em lote: o checkout e a devolução de estoque registram todos
+os produtos do pedido com um bulk_create, a importação registra só os produtos
+que mudaram e as edições avulsas passam pelo post_save de Produto (signals.py).
+
+As consultas usam o índice historico_produto_idx (produto, registrado_em, id): o
+estado em um instante é a última linha até ele, uma única busca no índice, e a
+série de um período é paginada por cursor. O comando compactar_historico reduz as
+linhas antigas a uma por produto e dia (o estado no fim do dia).
+"""
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import HistoricoProduto, Produto
+from .paginacao import paginar_keyset
+
+
+ORDENACAO = ('registrado_em', 'id')
+
+
+def registrar(estados, origem, agora=None):
+    """
+    Grava uma linha para cada (produto_id, preco, estoque) de `estados`, com um bulk_create.
+    """
+    agora = agora or timezone.now()
+    HistoricoProduto.objects.bulk_create([
+        HistoricoProduto(produto_id=produto_id, registrado_em=agora, preco=preco, estoque=estoque, origem=origem)
+        for produto_id, preco, estoque in estados
+    ])
+
+
+def registrar_produtos(produto_ids, origem, agora=None):
+    """
+    Registra o preço e o estoque atuais dos produtos informados (ids ou um queryset de ids),
+    depois de um UPDATE em massa cujos valores finais só o banco conhece.
+    """
+    registrar(Produto.objects.filter(pk__in=produto_ids).values_list('id', 'preco', 'estoque'), origem, agora)
+
+
+def no_instante(produto_id, instante):
+    """
+    A linha do histórico em vigor no instante (a última até ele), ou None se o
+    histórico do produto começa depois.
+    """
+    return (
+        HistoricoProduto.objects
+        .filter(produto_id=produto_id, registrado_em__lte=instante)
+        .order_by('-registrado_em', '-id')
+        .first()
+    )
+
+
+def serie(produto_id, inicio, fim, cursor=None, tamanho=500):
+    """
+    Uma página das alterações do produto depois de `inicio` e até `fim`, das mais antigas
+    para as mais recentes; o estado em `inicio` é no_instante(produto_id, inicio).
+    Levanta CursorInvalido se o cursor não puder ser lido.
+    """
+    alteracoes = HistoricoProduto.objects.filter(
+        produto_id=produto_id, registrado_em__gt=inicio, registrado_em__lte=fim,
+    )
+    return paginar_keyset(alteracoes, ORDENACAO, cursor=cursor, tamanho=tamanho)
+
+
+def compactar(antes_de, tamanho_lote=500):
+    """
+    Mantém, para cada produto e dia anterior a `antes_de`, só a última linha gravada
+    (o estado no fim do dia), marcada como 'diario'. Os produtos são processados em
+    lotes de ids, cada lote em uma transação com um DELETE e um UPDATE.
+    Retorna quantas linhas foram apagadas.
+    """
+    apagadas = 0
+    ultimo_id = 0
+    while True:
+        lote = list(
+            Produto.objects.filter(pk__gt=ultimo_id).order_by('pk').values_list('pk', flat=True)[:tamanho_lote]
+        )
+        if not lote:
+            return apagadas
+        ultimo_id = lote[-1]
+
+        antigas = HistoricoProduto.objects.filter(produto_id__in=lote, registrado_em__lt=antes_de)
+        ultimas_do_dia = (
+            antigas.annotate(dia=TruncDate('registrado_em'))
+            .order_by().values('produto_id', 'dia')
+            .annotate(ultima=Max('id')).values('ultima')
+        )
+        with transaction.atomic():
+            apagadas += antigas.exclude(pk__in=ultimas_do_dia).delete()[0]
+            # O que sobrou antes do limite já é uma linha por produto e dia
+            antigas.exclude(origem='diario').update(origem='diario')
@@ -0,0 +1,126 @@
+"""
+Derivados das imagens de produto (miniaturas WebP/AVIF em larguras fixas).
+
+Os arquivos ficam no armazenamento local 'derivados', em uma pasta com o hash
+do conteúdo da imagem original. A mesma imagem nunca é processada duas vezes,
+e o processamento acontece em um pool de threads para não segurar a requisição.
+"""
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from PIL import Image, ImageOps, features
+
+from .catalogo import invalidar_catalogo
+
+
+logger = logging.getLogger(__name__)
+
+LARGURAS = (200, 400, 800)
+QUALIDADE = {'avif': 55, 'webp': 80}
+# Marcador gravado depois que todos os derivados existem
+ARQUIVO_PRONTO = 'pronto'
+
+_pool = None
+
+
+def formatos_disponiveis():
+    return [formato for formato in ('avif', 'webp') if features.check(formato)]
+
+
+def armazenamento():
+    return storages['derivados']
+
+
+def hash_do_conteudo(conteudo):
+    return hashlib.sha256(conteudo).hexdigest()[:32]
+
+
+def caminho(hash_imagem, largura, formato):
+    return f'{hash_imagem}/{largura}.{formato}'
+
+
+def prontos(hash_imagem):
+    return bool(hash_imagem) and armazenamento().exists(f'{hash_imagem}/{ARQUIVO_PRONTO}')
+
+
+def gerar_derivados(hash_imagem, conteudo=None):
+    """
+    Gera as miniaturas que ainda não existem para a imagem. Se o conteúdo não
+    for informado, usa a cópia do original guardada na primeira geração.
+    """
+    storage = armazenamento()
+    original = f'{hash_imagem}/original'
+    if conteudo is None:
+        with storage.open(original) as arquivo:
+            conteudo = arquivo.read()
+    elif not storage.exists(original):
+        storage.save(original, ContentFile(conteudo))
+
+    with Image.open(io.BytesIO(conteudo)) as imagem:
+        imagem = ImageOps.exif_transpose(imagem)
+        if imagem.mode not in ('RGB', 'RGBA'):
+            imagem = imagem.convert('RGBA' if 'transparency' in imagem.info else 'RGB')
+
+        for largura in LARGURAS:
+            if largura < imagem.width:
+                altura = round(imagem.height * largura / imagem.width)
+                redimensionada = imagem.resize((largura, altura), Image.Resampling.LANCZOS)
+            else:
+                redimensionada = imagem
+            for formato in formatos_disponiveis():
+                nome = caminho(hash_imagem, largura, formato)
+                if storage.exists(nome):
+                    continue
+                saida = io.BytesIO()
+                redimensionada.save(saida, format=formato.upper(), quality=QUALIDADE[formato])
+                storage.save(nome, ContentFile(saida.getvalue()))
+
+    if not storage.exists(f'{hash_imagem}/{ARQUIVO_PRONTO}'):
+        storage.save(f'{hash_imagem}/{ARQUIVO_PRONTO}', ContentFile(b''))
+
+
+def _gerar_e_invalidar(hash_imagem, conteudo):
+    try:
+        gerar_derivados(hash_imagem, conteudo)
+    except Exception:
+        logger.exception('Falha ao gerar os derivados da imagem %s', hash_imagem)
+        return
+    # As páginas em cache do catálogo passam a usar as miniaturas
+    invalidar_catalogo()
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=settings.IMAGENS_THREADS, thread_name_prefix='imagens')
+    return _pool
+
+
+def agendar_derivados(conteudo):
+    """
+    Calcula o hash da imagem e agenda a geração dos derivados.
+    Retorna o hash, que deve ser guardado em Produto.imagem_hash.
+    Com IMAGENS_THREADS = 0 a geração acontece na própria chamada.
+    """
+    hash_imagem = hash_do_conteudo(conteudo)
+    if prontos(hash_imagem):
+        return hash_imagem
+    if settings.IMAGENS_THREADS:
+        _executor().submit(_gerar_e_invalidar, hash_imagem, conteudo)
+    else:
+        _gerar_e_invalidar(hash_imagem, conteudo)
+    return hash_imagem
+
+
+def srcset(hash_imagem, formato):
+    storage = armazenamento()
+    return ', '.join(f'{storage.url(caminho(hash_imagem, largura, formato))} {largura}w' for largura in LARGURAS)
+
+
+def url(hash_imagem, largura=LARGURAS[0], formato='webp'):
+    return armazenamento().url(caminho(hash_imagem, largura, formato))
@@ -0,0 +1,133 @@
+"""
+Importação em massa do catálogo de produtos (CSV ou JSON Lines).
+
+O arquivo é lido linha a linha e gravado em lotes, com upsert pelo SKU
+(bulk_create com update_conflicts), então a memória usada não depende do
+tamanho do arquivo. Linhas inválidas são reportadas e ignoradas.
+"""
+import csv
+import json
+
+from django.db import transaction
+
+from . import busca, historico_produtos
+from .catalogo import invalidar_catalogo
+from .forms import ProdutoImportacaoForm
+from .models import Produto
+
+
+CAMPOS_ATUALIZADOS = ['nome', 'descricao', 'preco', 'estoque']
+
+# Registro gerado por ler_linhas() quando o texto não pôde ser decodificado
+CODIFICACAO_INVALIDA = object()
+
+
+class ResultadoImportacao:
+    """
+    Resumo de uma importação: quantas linhas foram lidas, gravadas e os erros por linha.
+    Só os primeiros erros são guardados, para não crescer sem limite em arquivos ruins.
+    """
+    def __init__(self, max_erros=1000):
+        self.lidas = 0
+        self.gravadas = 0
+        self.total_erros = 0
+        self.erros = []
+        self.max_erros = max_erros
+
+    def adicionar_erro(self, linha, mensagem):
+        self.total_erros += 1
+        if len(self.erros) < self.max_erros:
+            self.erros.append((linha, mensagem))
+
+
+def formato_do_arquivo(nome):
+    return 'jsonl' if nome.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def ler_linhas(arquivo, formato):
+    """
+    Gera (número da linha, dicionário) para cada registro de um arquivo texto.
+    Linhas que não puderem ser lidas geram (número, None). Se o texto não puder ser
+    decodificado, gera (número, CODIFICACAO_INVALIDA) e para: o resto do arquivo é ilegível.
+    """
+    if formato == 'csv':
+        leitor = csv.DictReader(arquivo)
+        try:
+            for registro in leitor:
+                yield leitor.line_num, registro
+        except UnicodeDecodeError:
+            yield leitor.line_num + 1, CODIFICACAO_INVALIDA
+        return
+
+    numero = 0
+    try:
+        for numero, texto in enumerate(arquivo, start=1):
+            if not texto.strip():
+                continue
+            try:
+                registro = json.loads(texto)
+            except ValueError:
+                registro = None
+            yield numero, registro if isinstance(registro, dict) else None
+    except UnicodeDecodeError:
+        yield numero + 1, CODIFICACAO_INVALIDA
+
+
+def _gravar_lote(produtos_por_sku):
+    produtos = list(produtos_por_sku.values())
+    skus = list(produtos_por_sku)
+    with transaction.atomic():
+        anteriores = {
+            sku: (preco, estoque)
+            for sku, preco, estoque in Produto.objects.filter(sku__in=skus).values_list('sku', 'preco', 'estoque')
+        }
+        Produto.objects.bulk_create(
+            produtos,
+            update_conflicts=True,
+            unique_fields=['sku'],
+            # atualizado_em é preenchido pelo auto_now também no bulk_create
+            update_fields=CAMPOS_ATUALIZADOS + ['atualizado_em'],
+        )
+        # bulk_create não dispara sinais: atualiza o índice de busca e o histórico aqui
+        ids = dict(Produto.objects.filter(sku__in=skus).values_list('sku', 'id'))
+        busca.indexar_produtos(list(ids.values()))
+        historico_produtos.registrar([
+            (ids[sku], produto.preco, produto.estoque)
+            for sku, produto in produtos_por_sku.items()
+            if anteriores.get(sku) != (produto.preco, produto.estoque)
+        ], 'importacao')
+    return len(produtos)
+
+
+def importar_produtos(linhas, tamanho_lote=1000, max_erros=1000):
+    """
+    Valida e grava os registros gerados por ler_linhas() em lotes.
+    Se o mesmo SKU aparecer mais de uma vez no lote, vale a última linha.
+    """
+    resultado = ResultadoImportacao(max_erros=max_erros)
+    lote = {}
+    for numero, registro in linhas:
+        if registro is CODIFICACAO_INVALIDA:
+            resultado.adicionar_erro(numero, 'O arquivo não está em UTF-8; a importação parou nesta linha.')
+            break
+        resultado.lidas += 1
+        if registro is None:
+            resultado.adicionar_erro(numero, 'Linha mal formatada.')
+            continue
+
+        form = ProdutoImportacaoForm(registro)
+        if not form.is_valid():
+            mensagens = '; '.join(f'{campo}: {" ".join(erros)}' for campo, erros in form.errors.items())
+            resultado.adicionar_erro(numero, mensagens)
+            continue
+
+        lote[form.cleaned_data['sku']] = Produto(**form.cleaned_data)
+        if len(lote) >= tamanho_lote:
+            resultado.gravadas += _gravar_lote(lote)
+            lote = {}
+
+    if lote:
+        resultado.gravadas += _gravar_lote(lote)
+    if resultado.gravadas:
+        invalidar_catalogo()
+    return resultado
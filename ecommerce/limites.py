@@ -0,0 +1,216 @@
+"""
+Limite de requisições por usuário (ou por IP, para visitantes) com balde de fichas.
+
+Cada limite de settings.LIMITES tem uma capacidade (a rajada aceita) e uma
+reposição em fichas por segundo. O decorator @limitar('nome') consome uma ficha
+antes de a view rodar; sem fichas, a resposta é um 429 com Retry-After, sem
+consultar o banco (no máximo a leitura da sessão, para saber o usuário).
+
+O estado dos baldes fica em um armazenamento configurável (LIMITES_ARMAZENAMENTO):
+  memoria  - dicionário do processo; exato, mas cada worker tem os seus baldes
+  cache    - cache do Django (LIMITES_CACHE), compartilhado entre os processos
+             quando aponta para um Redis; só usa add/incr/decr, que são atômicos
+ou o caminho de uma classe com o mesmo método consumir().
+
+As requisições aceitas e rejeitadas são contadas por processo (ver metricas(),
+exposto em /metricas/limites/).
+"""
+import math
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+
+Resultado = namedtuple('Resultado', 'permitido restantes espera')
+
+_armazenamento = None
+_contagem = Counter()
+_trava = threading.Lock()
+
+
+class ArmazenamentoMemoria:
+    """
+    Baldes em um dicionário do processo, protegidos por uma trava. Os baldes usados
+    há mais tempo são descartados acima de `max_chaves` (um balde descartado volta cheio).
+    """
+    def __init__(self, max_chaves=10000):
+        self.max_chaves = max_chaves
+        self._baldes = OrderedDict()
+        self._trava = threading.Lock()
+
+    def consumir(self, chave, capacidade, por_segundo):
+        agora = time.monotonic()
+        with self._trava:
+            fichas, ultimo = self._baldes.pop(chave, (capacidade, agora))
+            fichas = min(capacidade, fichas + (agora - ultimo) * por_segundo)
+            permitido = fichas >= 1
+            if permitido:
+                fichas -= 1
+            self._baldes[chave] = (fichas, agora)
+            if len(self._baldes) > self.max_chaves:
+                self._baldes.popitem(last=False)
+        espera = 0 if permitido else (1 - fichas) / por_segundo
+        return Resultado(permitido, int(fichas), espera)
+
+    async def aconsumir(self, chave, capacidade, por_segundo):
+        # Só uma trava em memória: não vale a pena ir para uma thread
+        return self.consumir(chave, capacidade, por_segundo)
+
+
+class ArmazenamentoCache:
+    """
+    Baldes no cache do Django, no formato GCRA: cada chave guarda, em ms, o instante em
+    que o balde estará cheio de novo. Consumir uma ficha é um incr desse instante; se ele
+    passar de agora + capacidade, a requisição é rejeitada e o incr é desfeito.
+    """
+    def __init__(self, alias=None):
+        self.alias = alias or settings.LIMITES_CACHE
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def consumir(self, chave, capacidade, por_segundo):
+        cache = self.cache
+        intervalo = max(math.ceil(1000 / por_segundo), 1)
+        tolerancia = capacidade * intervalo
+        validade = math.ceil(tolerancia / 1000) + 1
+        agora = int(time.time() * 1000)
+
+        if cache.add(chave, agora + intervalo, validade):
+            return Resultado(True, capacidade - 1, 0)
+        try:
+            cheio_em = cache.incr(chave, intervalo)
+        except ValueError:
+            # A chave expirou entre o add e o incr: o balde está cheio
+            cache.set(chave, agora + intervalo, validade)
+            return Resultado(True, capacidade - 1, 0)
+
+        if cheio_em - intervalo < agora:
+            # O balde já estava cheio; sob concorrência esse ajuste pode perdoar uma ficha
+            cheio_em = agora + intervalo
+            cache.set(chave, cheio_em, validade)
+        elif cheio_em - agora > tolerancia:
+            cache.decr(chave, intervalo)
+            return Resultado(False, 0, (cheio_em - tolerancia - agora) / 1000)
+        else:
+            cache.touch(chave, validade)
+        return Resultado(True, (tolerancia - (cheio_em - agora)) // intervalo, 0)
+
+    async def aconsumir(self, chave, capacidade, por_segundo):
+        return await sync_to_async(self.consumir)(chave, capacidade, por_segundo)
+
+
+ARMAZENAMENTOS = {
+    'memoria': ArmazenamentoMemoria,
+    'cache': ArmazenamentoCache,
+}
+
+
+def armazenamento():
+    global _armazenamento
+    with _trava:
+        if _armazenamento is None:
+            nome = settings.LIMITES_ARMAZENAMENTO
+            classe = ARMAZENAMENTOS.get(nome) or import_string(nome)
+            _armazenamento = classe()
+        return _armazenamento
+
+
+@receiver(setting_changed)
+def _reiniciar(*, setting, **kwargs):
+    global _armazenamento
+    if setting in ('LIMITES_ARMAZENAMENTO', 'LIMITES_CACHE'):
+        with _trava:
+            _armazenamento = None
+
+
+def ip_do_cliente(request):
+    cabecalho = settings.LIMITES_CABECALHO_IP
+    if cabecalho and request.META.get(cabecalho):
+        # O último endereço é o que o nosso proxy viu; os anteriores vêm do cliente
+        return request.META[cabecalho].split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _identidade(usuario_id, request):
+    return f'usuario:{usuario_id}' if usuario_id else f'ip:{ip_do_cliente(request)}'
+
+
+def _contar(nome, resultado):
+    with _trava:
+        _contagem[nome, 'permitidas' if resultado.permitido else 'rejeitadas'] += 1
+
+
+def limpar():
+    global _armazenamento
+    with _trava:
+        _contagem.clear()
+        _armazenamento = None
+
+
+def metricas():
+    with _trava:
+        contagem = dict(_contagem)
+    nomes = sorted({nome for nome, _ in contagem})
+    return {
+        nome: {
+            'permitidas': contagem.get((nome, 'permitidas'), 0),
+            'rejeitadas': contagem.get((nome, 'rejeitadas'), 0),
+        }
+        for nome in nomes
+    }
+
+
+def _rejeitar_html(resultado):
+    return HttpResponse('Muitas requisições. Tente novamente em instantes.', status=429, content_type='text/plain; charset=utf-8')
+
+
+def _resposta_rejeitada(rejeitar, resultado):
+    resposta = (rejeitar or _rejeitar_html)(resultado)
+    resposta['Retry-After'] = str(max(math.ceil(resultado.espera), 1))
+    return resposta
+
+
+def limitar(nome, metodos=None, rejeitar=None):
+    """
+    Aplica o limite settings.LIMITES[nome] à view (sync ou async). Com `metodos`, só
+    esses métodos HTTP consomem fichas. `rejeitar(resultado)` monta a resposta 429.
+    Deve ficar por fora de login_required, para rejeitar antes de carregar o usuário.
+    """
+    def _aplica(request):
+        return nome in settings.LIMITES and (metodos is None or request.method in metodos)
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def inner(request, *args, **kwargs):
+                if _aplica(request):
+                    chave = f'limite:{nome}:{_identidade(await request.session.aget(SESSION_KEY), request)}'
+                    resultado = await armazenamento().aconsumir(chave, **settings.LIMITES[nome])
+                    _contar(nome, resultado)
+                    if not resultado.permitido:
+                        return _resposta_rejeitada(rejeitar, resultado)
+                return await view(request, *args, **kwargs)
+        else:
+            @wraps(view)
+            def inner(request, *args, **kwargs):
+                if _aplica(request):
+                    chave = f'limite:{nome}:{_identidade(request.session.get(SESSION_KEY), request)}'
+                    resultado = armazenamento().consumir(chave, **settings.LIMITES[nome])
+                    _contar(nome, resultado)
+                    if not resultado.permitido:
+                        return _resposta_rejeitada(rejeitar, resultado)
+                return view(request, *args, **kwargs)
+        return inner
+    return decorator
@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from ecommerce import busca
+from ecommerce.benchmark import banco_temporario, cronometrar, gerar_produtos
+from ecommerce.models import Produto
+
+
+class Command(BaseCommand):
+    help = 'Compara a busca indexada com filtros icontains em um catálogo sintético.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--produtos', type=int, default=100000)
+        parser.add_argument('--repeticoes', type=int, default=20)
+        parser.add_argument('--termos', nargs='+', default=['samsung', 'fone bluetooth', '1A2B3', 'produto inexistente'])
+
+    def handle(self, *args, **options):
+        with banco_temporario():
+            self.stderr.write(f"Gerando {options['produtos']} produtos...")
+            gerar_produtos(options['produtos'])
+            busca.reconstruir_indice()
+
+            resultados = []
+            for termo in options['termos']:
+                def icontains():
+                    filtro = Q()
+                    for palavra in termo.split():
+                        filtro &= Q(nome__icontains=palavra) | Q(descricao__icontains=palavra)
+                    return list(Produto.objects.filter(filtro)[:48])
+
+                resultados.append({
+                    'termo': termo,
+                    'indice': cronometrar(lambda: busca.buscar_produtos(termo), options['repeticoes']),
+                    'icontains': cronometrar(icontains, options['repeticoes']),
+                })
+
+        self.stdout.write(json.dumps({'produtos': options['produtos'], 'resultados': resultados}, indent=2))
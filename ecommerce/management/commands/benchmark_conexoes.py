@@ -0,0 +1,87 @@
+import copy
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.utils import load_backend
+
+from ecommerce.benchmark import estatisticas
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede o custo de abrir conexões com o banco configurado: simula requisições curtas '
+        '(uma consulta cada) abrindo uma conexão nova por requisição, reaproveitando conexões '
+        'persistentes (CONN_MAX_AGE) e, no PostgreSQL, usando o pool do psycopg.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Workers simultâneos.')
+        parser.add_argument('--requisicoes', type=int, default=2000, help='Requisições por modo.')
+        parser.add_argument('--modos', nargs='+', choices=['sem_reuso', 'persistente', 'pool'])
+
+    def handle(self, *args, **options):
+        base = connections['default'].settings_dict
+        modos = options['modos'] or self._modos_disponiveis(base)
+        resultados = {}
+        for modo in modos:
+            self.stderr.write(f'{modo}...')
+            resultados[modo] = self._medir(self._configuracao(base, modo), modo, options['threads'], options['requisicoes'])
+        self.stdout.write(json.dumps({
+            'engine': base['ENGINE'],
+            'threads': options['threads'],
+            'requisicoes': options['requisicoes'],
+            'modos': resultados,
+        }, indent=2))
+
+    def _modos_disponiveis(self, base):
+        modos = ['sem_reuso', 'persistente']
+        if base['ENGINE'] == 'django.db.backends.postgresql':
+            modos.append('pool')
+        return modos
+
+    def _configuracao(self, base, modo):
+        config = copy.deepcopy(base)
+        opcoes = config['OPTIONS']
+        pool = opcoes.pop('pool', None)
+        if modo == 'sem_reuso':
+            config['CONN_MAX_AGE'] = 0
+        elif modo == 'persistente':
+            config['CONN_MAX_AGE'] = None
+            config['CONN_HEALTH_CHECKS'] = True
+        else:
+            opcoes['pool'] = pool or True
+            config['CONN_MAX_AGE'] = 0
+        return config
+
+    def _medir(self, config, modo, threads, requisicoes):
+        backend = load_backend(config['ENGINE'])
+        por_thread = [requisicoes // threads + (1 if i < requisicoes % threads else 0) for i in range(threads)]
+
+        def worker(quantidade):
+            # Mesmo alias em todas as threads: no modo pool, elas dividem o mesmo pool
+            conexao = backend.DatabaseWrapper(config, alias=f'benchmark_{modo}')
+            tempos = []
+            for _ in range(quantidade):
+                inicio = time.perf_counter()
+                # O mesmo ciclo que o Django faz em request_started/request_finished
+                conexao.close_if_unusable_or_obsolete()
+                with conexao.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+                conexao.close_if_unusable_or_obsolete()
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            conexao.close()
+            return tempos
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            parciais = list(executor.map(worker, por_thread))
+        duracao = time.perf_counter() - inicio
+        if modo == 'pool':
+            backend.DatabaseWrapper(config, alias=f'benchmark_{modo}').close_pool()
+
+        tempos = [tempo for parcial in parciais for tempo in parcial]
+        return {'req_por_segundo': round(len(tempos) / duracao, 1), **estatisticas(tempos)}
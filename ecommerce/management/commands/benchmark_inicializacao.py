@@ -0,0 +1,69 @@
+import json
+import re
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.benchmark import estatisticas
+
+
+# Linha do -X importtime: "import time: self [us] | cumulative | nome"
+LINHA_IMPORTTIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede a inicialização a frio de um processo (python -X importtime manage.py check) e '
+        'lista os módulos mais caros de importar. Com --limite-ms, termina com erro se o p50 passar do limite.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=5)
+        parser.add_argument('--comando', nargs='+', default=['check'], help='Comando do manage.py a inicializar.')
+        parser.add_argument('--top', type=int, default=15, help='Quantos módulos listar.')
+        parser.add_argument('--limite-ms', type=float, help='Tempo máximo aceitável (p50) em milissegundos.')
+
+    def handle(self, *args, **options):
+        tempos, importacoes = [], {}
+        for _ in range(options['repeticoes']):
+            tempo, importacoes = self._executar(options['comando'])
+            tempos.append(tempo)
+
+        # Só os módulos de primeiro nível: o tempo acumulado já inclui os que eles importam
+        raiz = sorted(
+            ((nome, acumulado) for nome, (acumulado, nivel) in importacoes.items() if nivel == 0),
+            key=lambda item: item[1], reverse=True,
+        )
+        resultado = {
+            'comando': options['comando'],
+            'repeticoes': options['repeticoes'],
+            **estatisticas(tempos),
+            'importacao_ms': round(sum(acumulado for _, acumulado in raiz) / 1000, 1),
+            'mais_lentos': [{'modulo': nome, 'ms': round(acumulado / 1000, 1)} for nome, acumulado in raiz[:options['top']]],
+        }
+        self.stdout.write(json.dumps(resultado, indent=2))
+
+        limite = options['limite_ms']
+        if limite is not None and resultado['p50_ms'] > limite:
+            raise CommandError(f"Inicialização lenta: p50 de {resultado['p50_ms']} ms, limite de {limite} ms.")
+
+    def _executar(self, comando):
+        inicio = time.perf_counter()
+        processo = subprocess.run(
+            [sys.executable, '-X', 'importtime', str(settings.BASE_DIR / 'manage.py'), *comando],
+            capture_output=True, text=True, cwd=settings.BASE_DIR,
+        )
+        tempo = (time.perf_counter() - inicio) * 1000
+        if processo.returncode:
+            raise CommandError(f'O comando falhou:\n{processo.stdout}{processo.stderr}')
+
+        importacoes = {}
+        for linha in processo.stderr.splitlines():
+            encontrada = LINHA_IMPORTTIME.match(linha)
+            if encontrada:
+                _, acumulado, recuo, nome = encontrada.groups()
+                importacoes[nome] = (int(acumulado), len(recuo) // 2)
+        return tempo, importacoes
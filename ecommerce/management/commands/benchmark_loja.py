@@ -0,0 +1,131 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from ecommerce import limites
+from ecommerce.benchmark import banco_temporario, estatisticas, gerar_clientes, gerar_pedidos, gerar_produtos
+from ecommerce.models import Carrinho, Cliente, CustomUser, Pedido, Produto
+from ecommerce.perfil import Coleta
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede tempo e número de consultas das páginas principais da loja em bancos sintéticos '
+        'de vários tamanhos. Com --comparar, falha se houver regressão em relação a um resultado anterior.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escalas', type=int, nargs='+', default=[1000],
+                            help='Quantidade de produtos e de pedidos de cada banco (ex.: 1000 100000 1000000).')
+        parser.add_argument('--repeticoes', type=int, default=20)
+        parser.add_argument('--saida', help='Arquivo onde gravar o resultado em JSON (além da saída padrão).')
+        parser.add_argument('--comparar', help='Resultado JSON anterior usado como referência.')
+        parser.add_argument('--tolerancia-tempo', type=float, default=0.25,
+                            help='Aumento relativo aceito no p50 (0.25 = 25%%).')
+        parser.add_argument('--folga-ms', type=float, default=2.0,
+                            help='Aumento absoluto no p50 sempre aceito, para não acusar ruído em páginas rápidas.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        try:
+            resultado = {'repeticoes': options['repeticoes'], 'escalas': {}}
+            # As medições repetem o checkout do mesmo usuário muito além dos limites de requisições
+            with override_settings(LIMITES={}):
+                for escala in options['escalas']:
+                    with banco_temporario():
+                        self.stderr.write(f'Gerando banco com {escala} produtos e pedidos...')
+                        self._gerar(escala)
+                        resultado['escalas'][str(escala)] = self._medir_paginas(options['repeticoes'])
+        finally:
+            teardown_test_environment()
+            limites.limpar()
+
+        if options['comparar']:
+            with open(options['comparar']) as arquivo:
+                referencia = json.load(arquivo)
+            resultado['regressoes'] = self._regressoes(referencia, resultado, options['tolerancia_tempo'], options['folga_ms'])
+
+        saida = json.dumps(resultado, indent=2)
+        self.stdout.write(saida)
+        if options['saida']:
+            with open(options['saida'], 'w') as arquivo:
+                arquivo.write(saida)
+
+        if resultado.get('regressoes'):
+            raise CommandError(f"{len(resultado['regressoes'])} regressão(ões) de desempenho encontrada(s).")
+
+    def _gerar(self, escala):
+        gerar_produtos(escala)
+        gerar_clientes(max(escala // 10, 1))
+        gerar_pedidos(escala)
+
+    def _medir_paginas(self, repeticoes):
+        empresa = CustomUser.objects.create_user(username='benchmark-empresa', cargo='empresa')
+        # Cliente com pedidos, para que "meus pedidos" não seja uma página vazia
+        cliente = Cliente.objects.select_related('user').get(pk=Pedido.objects.order_by('id').values('cliente_id')[:1])
+        produtos = list(Produto.objects.order_by('id')[:2])
+        Produto.objects.filter(pk__in=[produto.pk for produto in produtos]).update(estoque=10 ** 9)
+        carrinho = Carrinho.do_usuario(cliente.user)
+        pedido = Pedido.objects.order_by('-id').first()
+
+        http_cliente = Client()
+        http_cliente.force_login(cliente.user)
+        http_empresa = Client()
+        http_empresa.force_login(empresa)
+
+        def encher_carrinho():
+            for produto in produtos:
+                carrinho.adicionar(produto)
+
+        encher_carrinho()
+        paginas = {
+            'loja_produtos': (http_cliente, reverse('loja_produtos'), None),
+            'carrinho': (http_cliente, reverse('carrinho'), None),
+            'checkout_pedido': (http_cliente, reverse('checkout_pedido'), encher_carrinho),
+            'pedido_list': (http_empresa, reverse('pedido_list'), None),
+            'pedido_detail': (http_empresa, reverse('pedido_detail', args=[pedido.pk]), None),
+            'meus_pedidos': (http_cliente, reverse('meus_pedidos'), None),
+        }
+        return {
+            nome: self._medir(cliente_http, url, repeticoes, preparar)
+            for nome, (cliente_http, url, preparar) in paginas.items()
+        }
+
+    def _medir(self, cliente_http, url, repeticoes, preparar=None):
+        tempos = []
+        consultas = 0
+        for _ in range(repeticoes):
+            if preparar:
+                preparar()
+            inicio = time.perf_counter()
+            with Coleta() as coleta:
+                resposta = cliente_http.get(url)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+            if resposta.status_code >= 400:
+                raise CommandError(f'{url} respondeu {resposta.status_code}.')
+            consultas = max(consultas, coleta.consultas)
+        return {'consultas': consultas, **estatisticas(tempos)}
+
+    def _regressoes(self, referencia, resultado, tolerancia_tempo, folga_ms):
+        regressoes = []
+        for escala, paginas in resultado['escalas'].items():
+            for nome, atual in paginas.items():
+                anterior = referencia.get('escalas', {}).get(escala, {}).get(nome)
+                if anterior is None:
+                    continue
+                if atual['consultas'] > anterior['consultas']:
+                    regressoes.append({
+                        'escala': escala, 'pagina': nome, 'medida': 'consultas',
+                        'anterior': anterior['consultas'], 'atual': atual['consultas'],
+                    })
+                limite = max(anterior['p50_ms'] * (1 + tolerancia_tempo), anterior['p50_ms'] + folga_ms)
+                if atual['p50_ms'] > limite:
+                    regressoes.append({
+                        'escala': escala, 'pagina': nome, 'medida': 'p50_ms',
+                        'anterior': anterior['p50_ms'], 'atual': atual['p50_ms'],
+                    })
+        return regressoes
@@ -0,0 +1,97 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.benchmark import estatisticas
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga HTTP nas páginas da loja. Rode o mesmo código sob WSGI (gunicorn) e '
+        'ASGI (uvicorn com VIEWS_ASSINCRONAS=1) e passe as duas URLs para comparar p50/p99 e req/s.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', action='append', required=True, help='URL base de um servidor; repita para comparar.')
+        parser.add_argument('--caminhos', nargs='+', default=['/loja/', '/loja/carrinho/', '/meus-pedidos/'])
+        parser.add_argument('--clientes', type=int, default=32, help='Conexões simultâneas.')
+        parser.add_argument('--requisicoes', type=int, default=2000, help='Requisições por caminho.')
+        parser.add_argument('--usuario', help='Usuário cuja sessão é usada nas requisições (precisa existir no banco dos servidores).')
+
+    def handle(self, *args, **options):
+        cookie = self._cookie_de_sessao(options['usuario']) if options['usuario'] else None
+        resultados = []
+        for url in options['url']:
+            for caminho in options['caminhos']:
+                self.stderr.write(f'{url}{caminho}...')
+                resultados.append({
+                    'url': url,
+                    'caminho': caminho,
+                    **self._medir(url, caminho, cookie, options['clientes'], options['requisicoes']),
+                })
+        self.stdout.write(json.dumps({
+            'clientes': options['clientes'],
+            'requisicoes': options['requisicoes'],
+            'resultados': resultados,
+        }, indent=2))
+
+    def _cookie_de_sessao(self, username):
+        try:
+            user = get_user_model().objects.get(username=username)
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Usuário "{username}" não encontrado.')
+        sessao = SessionStore()
+        sessao[SESSION_KEY] = str(user.pk)
+        sessao[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        sessao[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        sessao.create()
+        return f'{settings.SESSION_COOKIE_NAME}={sessao.session_key}'
+
+    def _medir(self, url, caminho, cookie, clientes, requisicoes):
+        partes = urlsplit(url)
+        classe = HTTPSConnection if partes.scheme == 'https' else HTTPConnection
+        cabecalhos = {'Cookie': cookie} if cookie else {}
+        por_cliente = [requisicoes // clientes + (1 if i < requisicoes % clientes else 0) for i in range(clientes)]
+
+        def cliente(quantidade):
+            # Cada cliente mantém uma conexão keep-alive, como um navegador
+            conexao = classe(partes.netloc, timeout=30)
+            tempos, erros = [], 0
+            for _ in range(quantidade):
+                inicio = time.perf_counter()
+                try:
+                    conexao.request('GET', partes.path.rstrip('/') + caminho, headers=cabecalhos)
+                    resposta = conexao.getresponse()
+                    resposta.read()
+                    if resposta.status >= 400:
+                        erros += 1
+                except OSError:
+                    erros += 1
+                    conexao.close()
+                    conexao = classe(partes.netloc, timeout=30)
+                    continue
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            conexao.close()
+            return tempos, erros
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clientes) as pool:
+            parciais = list(pool.map(cliente, por_cliente))
+        duracao = time.perf_counter() - inicio
+
+        tempos = [tempo for parcial, _ in parciais for tempo in parcial]
+        resultado = {
+            'respostas': len(tempos),
+            'erros': sum(erros for _, erros in parciais),
+            'req_por_segundo': round(len(tempos) / duracao, 1),
+        }
+        if tempos:
+            resultado.update(estatisticas(tempos))
+        return resultado
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ecommerce import historico_produtos
+
+
+class Command(BaseCommand):
+    help = (
+        'Compacta o histórico de preço e estoque dos produtos: antes do limite, '
+        'mantém só o estado no fim de cada dia.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=90, help='Mantém completas as alterações dos últimos N dias.')
+        parser.add_argument('--lote', type=int, default=500, help='Quantidade de produtos compactados por transação.')
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(days=options['dias'])
+        apagadas = historico_produtos.compactar(limite, tamanho_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{apagadas} registro(s) anteriores a {limite:%d/%m/%Y} compactado(s) em resumos diários.'
+        ))
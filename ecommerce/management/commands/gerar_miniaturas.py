@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ecommerce import imagens
+from ecommerce.catalogo import invalidar_catalogo
+from ecommerce.models import Produto
+
+
+def _gerar_do_original(produto):
+    # Produtos anteriores às miniaturas só têm o arquivo original (local ou no Cloudinary)
+    with produto.imagem.open('rb') as arquivo:
+        conteudo = arquivo.read()
+    hash_imagem = imagens.hash_do_conteudo(conteudo)
+    imagens.gerar_derivados(hash_imagem, conteudo)
+    return hash_imagem
+
+
+class Command(BaseCommand):
+    help = 'Gera as miniaturas que estiverem faltando para as imagens de produto já enviadas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=max(settings.IMAGENS_THREADS, 1))
+
+    def handle(self, *args, **options):
+        hashes = (
+            Produto.objects.exclude(imagem_hash='')
+            .values_list('imagem_hash', flat=True).distinct().iterator(chunk_size=1000)
+        )
+        sem_hash = (
+            Produto.objects.filter(imagem_hash='').exclude(imagem='').exclude(imagem__isnull=True)
+            .only('pk', 'imagem').iterator(chunk_size=1000)
+        )
+        erros = 0
+        total = 0
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            futuros = [(hash_imagem, pool.submit(imagens.gerar_derivados, hash_imagem), None) for hash_imagem in hashes]
+            futuros += [(produto.imagem.name, pool.submit(_gerar_do_original, produto), produto.pk) for produto in sem_hash]
+            for nome, futuro, produto_id in futuros:
+                total += 1
+                try:
+                    hash_imagem = futuro.result()
+                except Exception as e:
+                    erros += 1
+                    self.stderr.write(f'{nome}: {e}')
+                    continue
+                if produto_id is not None:
+                    # update() e não save(): só o hash muda, sem passar pelo histórico e pela busca
+                    Produto.objects.filter(pk=produto_id).update(imagem_hash=hash_imagem)
+        invalidar_catalogo()
+        self.stdout.write(self.style.SUCCESS(f'{total - erros} de {total} imagens processadas.'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.importacao import formato_do_arquivo, importar_produtos, ler_linhas
+
+
+class Command(BaseCommand):
+    help = 'Importa (ou atualiza pelo SKU) produtos de um arquivo CSV ou JSON Lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo')
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], help='Padrão: deduzido pela extensão do arquivo.')
+        parser.add_argument('--lote', type=int, default=1000, help='Quantidade de produtos gravados por lote.')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or formato_do_arquivo(options['arquivo'])
+        try:
+            arquivo = open(options['arquivo'], encoding='utf-8', newline='')
+        except OSError as e:
+            raise CommandError(f'Não foi possível abrir o arquivo: {e}')
+
+        with arquivo:
+            resultado = importar_produtos(ler_linhas(arquivo, formato), tamanho_lote=options['lote'])
+
+        for linha, mensagem in resultado.erros:
+            self.stderr.write(f'Linha {linha}: {mensagem}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.lidas} linhas lidas, {resultado.gravadas} produtos gravados, {resultado.total_erros} erros.'
+        ))
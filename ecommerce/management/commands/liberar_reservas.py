@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ecommerce import reservas
+
+
+class Command(BaseCommand):
+    help = 'Apaga as reservas de estoque vencidas dos carrinhos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--continuo', action='store_true', help='Continua rodando e limpando periodicamente.')
+        parser.add_argument('--intervalo', type=float, default=60.0, help='Segundos entre as limpezas no modo contínuo.')
+        parser.add_argument('--lote', type=int, default=5000, help='Quantidade de reservas apagadas por DELETE.')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            total += reservas.liberar_expiradas(tamanho_lote=options['lote'])
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
+        self.stdout.write(self.style.SUCCESS(f'{total} reserva(s) vencida(s) liberada(s).'))
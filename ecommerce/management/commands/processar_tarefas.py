@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ecommerce import tarefas
+
+
+class Command(BaseCommand):
+    help = 'Executa as tarefas pendentes da fila (e-mails, consolidação de vendas, etc.).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--continuo', action='store_true', help='Continua rodando e aguardando novas tarefas.')
+        parser.add_argument('--intervalo', type=float, default=1.0, help='Segundos de espera quando a fila está vazia.')
+        parser.add_argument('--lote', type=int, default=10, help='Quantidade de tarefas reservadas por vez.')
+
+    def handle(self, *args, **options):
+        trabalhador = tarefas.nome_do_worker()
+        total = 0
+        while True:
+            tarefas.liberar_abandonadas()
+            executadas = tarefas.processar_pendentes(trabalhador, options['lote'])
+            total += executadas
+            if executadas:
+                continue
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
+        self.stdout.write(self.style.SUCCESS(f'{total} tarefa(s) executada(s).'))
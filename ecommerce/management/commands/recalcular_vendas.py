@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce.vendas import recalcular
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói a consolidação diária de vendas a partir dos itens de pedido, em lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help='Quantidade de pedidos por lote.')
+
+    def handle(self, *args, **options):
+        lotes = recalcular(tamanho_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'Consolidação de vendas reconstruída em {lotes} lote(s).'))
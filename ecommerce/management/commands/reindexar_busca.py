@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce.busca import reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o índice de busca textual de produtos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=10000, help='Quantidade de ids processados por INSERT.')
+
+    def handle(self, *args, **options):
+        total = reconstruir_indice(tamanho_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{total} produtos indexados.'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce.pedidos import verificar_totais
+
+
+class Command(BaseCommand):
+    help = 'Confere o total e a quantidade de itens gravados nos pedidos contra os itens, em lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corrigir', action='store_true', help='Grava os valores recalculados nos pedidos divergentes.')
+        parser.add_argument('--lote', type=int, default=5000, help='Quantidade de pedidos por lote.')
+
+    def handle(self, *args, **options):
+        divergentes = verificar_totais(tamanho_lote=options['lote'], corrigir=options['corrigir'])
+        if not divergentes:
+            self.stdout.write(self.style.SUCCESS('Todos os pedidos estão consistentes.'))
+            return
+        amostra = ', '.join(f'#{pk}' for pk in divergentes[:20])
+        acao = 'corrigido(s)' if options['corrigir'] else 'divergente(s)'
+        self.stdout.write(self.style.WARNING(f'{len(divergentes)} pedido(s) {acao}: {amostra}'))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0004_itempedido_preco_alter_itempedido_pedido'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['status', 'data_pedido'], name='pedido_status_data_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def criar_indice_busca(apps, schema_editor):
+    from ecommerce.busca import criar_indice, reconstruir_indice
+    criar_indice(schema_editor.connection)
+    reconstruir_indice(conexao=schema_editor.connection)
+
+
+def remover_indice_busca(apps, schema_editor):
+    from ecommerce.busca import remover_indice
+    remover_indice(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0006_carrinho'),
+    ]
+
+    operations = [
+        # FTS5 no SQLite ou tsvector + GIN no PostgreSQL (ver ecommerce/busca.py)
+        migrations.RunPython(criar_indice_busca, remover_indice_busca),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:09
+
+import django.utils.timezone
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def preencher_totais(apps, schema_editor):
+    Pedido = apps.get_model('ecommerce', 'Pedido')
+    ItemPedido = apps.get_model('ecommerce', 'ItemPedido')
+    itens = ItemPedido.objects.filter(pedido=OuterRef('pk')).order_by().values('pedido')
+    decimal = DecimalField(max_digits=12, decimal_places=2)
+    Pedido.objects.update(
+        total=Coalesce(Subquery(itens.annotate(soma=Sum(F('preco') * F('quantidade'), output_field=decimal)).values('soma')), Value(Decimal('0.00')), output_field=decimal),
+        quantidade_itens=Coalesce(Subquery(itens.annotate(soma=Sum('quantidade')).values('soma')), Value(0)),
+        status_alterado_em=F('data_pedido'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0011_tarefa'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='quantidade_itens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='status_alterado_em',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['total', 'id'], name='pedido_total_idx'),
+        ),
+        migrations.RunPython(preencher_totais, migrations.RunPython.noop),
+    ]
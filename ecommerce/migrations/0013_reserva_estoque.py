@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0012_pedido_totais'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.PositiveIntegerField()),
+                ('expira_em', models.DateTimeField()),
+                ('carrinho', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='ecommerce.carrinho')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='ecommerce.produto')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['produto', 'expira_em'], name='reserva_produto_expira_idx'), models.Index(fields=['expira_em'], name='reserva_expira_idx')],
+                'constraints': [models.UniqueConstraint(fields=('carrinho', 'produto'), name='reserva_estoque_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0014_atualizado_em'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['data_pedido', 'id'], name='pedido_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['cliente', '-data_pedido'], name='pedido_cliente_data_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:21
+
+import ecommerce.armazenamento
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0015_indices_pedido'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='produto',
+            name='imagem',
+            field=models.ImageField(blank=True, max_length=255, null=True, storage=ecommerce.armazenamento.imagens, upload_to='produtos/', verbose_name='image'),
+        ),
+    ]
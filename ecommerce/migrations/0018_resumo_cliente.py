@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+
+def preencher_resumos(apps, schema_editor):
+    Pedido = apps.get_model('ecommerce', 'Pedido')
+    ResumoCliente = apps.get_model('ecommerce', 'ResumoCliente')
+    validos = ~Q(status='cancelado')
+    linhas = Pedido.objects.order_by().values('cliente_id').annotate(
+        quantidade=Count('id', filter=validos), total=Sum('total', filter=validos), ultimo=Max('data_pedido', filter=validos),
+    )
+    agora = timezone.now()
+    ResumoCliente.objects.bulk_create([
+        ResumoCliente(
+            cliente_id=linha['cliente_id'], quantidade_pedidos=linha['quantidade'],
+            total_gasto=linha['total'] or Decimal('0.00'), ultimo_pedido_em=linha['ultimo'], atualizado_em=agora,
+        )
+        for linha in linhas.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0017_historico_status_pedido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoCliente',
+            fields=[
+                ('cliente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumo', serialize=False, to='ecommerce.cliente')),
+                ('quantidade_pedidos', models.PositiveIntegerField(default=0)),
+                ('total_gasto', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('ultimo_pedido_em', models.DateTimeField(blank=True, null=True)),
+                ('atualizado_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(preencher_resumos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:32
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def registrar_estado_atual(apps, schema_editor):
+    # O histórico começa com o preço e o estoque atuais de cada produto
+    Produto = apps.get_model('ecommerce', 'Produto')
+    HistoricoProduto = apps.get_model('ecommerce', 'HistoricoProduto')
+    HistoricoProduto.objects.bulk_create((
+        HistoricoProduto(produto_id=produto_id, registrado_em=atualizado_em, preco=preco, estoque=estoque, origem='edicao')
+        for produto_id, preco, estoque, atualizado_em in
+        Produto.objects.values_list('id', 'preco', 'estoque', 'atualizado_em').iterator()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0018_resumo_cliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoricoProduto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('registrado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('preco', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('estoque', models.IntegerField()),
+                ('origem', models.CharField(choices=[('edicao', 'Edição'), ('checkout', 'Checkout'), ('devolucao', 'Devolução'), ('importacao', 'Importação'), ('diario', 'Resumo diário')], max_length=10)),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historico', to='ecommerce.produto')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['produto', 'registrado_em', 'id'], name='historico_produto_idx')],
+            },
+        ),
+        migrations.RunPython(registrar_estado_atual, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,12 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
-from cloudinary.models import CloudinaryField
+
+from .armazenamento import imagens
 
 
 # Crie um modelo de usuário customizado para adicionar o campo 'cargo'
@@ -19,20 +25,80 @@ class CustomUser(AbstractUser):
         verbose_name = "Usuário"
         verbose_name_plural = "Usuários"
 
+class ProdutoQuerySet(models.QuerySet):
+    def com_disponivel(self, exceto_carrinho=None):
+        """
+        Anota `disponivel`: o estoque menos as reservas ainda válidas (ver ecommerce/reservas.py),
+        na mesma query. Com exceto_carrinho, as reservas desse carrinho não são descontadas.
+        """
+        reservas = ReservaEstoque.objects.filter(produto=OuterRef('pk'), expira_em__gt=timezone.now())
+        if exceto_carrinho is not None:
+            reservas = reservas.exclude(carrinho=exceto_carrinho)
+        reservado = reservas.order_by().values('produto').annotate(soma=Sum('quantidade')).values('soma')
+        return self.annotate(disponivel=F('estoque') - Coalesce(Subquery(reservado, output_field=IntegerField()), Value(0)))
+
+
 class Produto(models.Model):
     """
     Representa um produto disponível na loja.
     """
+    # Código estável do produto, usado para importar/atualizar o catálogo em massa
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     nome = models.CharField(max_length=100)
     descricao = models.TextField()
     preco = models.DecimalField(max_digits=10, decimal_places=2)
     estoque = models.IntegerField(default=0)
-    # Altere o campo de imagem para CloudinaryField para upload de imagens
-    imagem = CloudinaryField('image', blank=True, null=True)
+    # Imagem original, no Cloudinary ou em disco conforme STORAGES['imagens'] (ver ecommerce/armazenamento.py)
+    imagem = models.ImageField('image', upload_to='produtos/', storage=imagens, max_length=255, blank=True, null=True)
+    # Hash do conteúdo da imagem; identifica as miniaturas locais (ver ecommerce/imagens.py)
+    imagem_hash = models.CharField(max_length=32, blank=True, editable=False)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    objects = ProdutoQuerySet.as_manager()
 
     def __str__(self):
         return self.nome
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        produto = super().from_db(db, field_names, values)
+        # Preço e estoque lidos do banco: o histórico só registra quando eles mudam (ver signals.py)
+        produto._registrado = (produto.__dict__.get('preco'), produto.__dict__.get('estoque'))
+        return produto
+
+    def save(self, *args, **kwargs):
+        # SKU em branco vira NULL para não violar a restrição de unicidade
+        if not self.sku:
+            self.sku = None
+        super().save(*args, **kwargs)
+
+class HistoricoProduto(models.Model):
+    """
+    Preço e estoque de um produto depois de cada alteração, só com inclusões
+    (ver ecommerce/historico_produtos.py). Registros antigos são compactados em
+    um por produto e dia pelo comando compactar_historico.
+    """
+    ORIGENS = [
+        ('edicao', 'Edição'),
+        ('checkout', 'Checkout'),
+        ('devolucao', 'Devolução'),
+        ('importacao', 'Importação'),
+        ('diario', 'Resumo diário'),
+    ]
+    produto = models.ForeignKey(Produto, related_name='historico', on_delete=models.CASCADE)
+    registrado_em = models.DateTimeField(default=timezone.now)
+    preco = models.DecimalField(max_digits=10, decimal_places=2)
+    estoque = models.IntegerField()
+    origem = models.CharField(max_length=10, choices=ORIGENS)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['produto', 'registrado_em', 'id'], name='historico_produto_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.produto_id} em {self.registrado_em:%d/%m/%Y %H:%M}: R$ {self.preco}, {self.estoque} un."
+
 class Cliente(models.Model):
     """
     Representa o perfil de um cliente, associado a um CustomUser.
@@ -44,6 +110,21 @@ class Cliente(models.Model):
     def __str__(self):
         return self.user.username
 
+class ResumoCliente(models.Model):
+    """
+    Totais dos pedidos de um cliente (pedidos cancelados não contam), mantidos por
+    ecommerce/pedidos.py para que "Meus Pedidos" não precise agregar o histórico.
+    """
+    cliente = models.OneToOneField(Cliente, primary_key=True, related_name='resumo', on_delete=models.CASCADE)
+    quantidade_pedidos = models.PositiveIntegerField(default=0)
+    total_gasto = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    ultimo_pedido_em = models.DateTimeField(null=True, blank=True)
+    # Muda com qualquer alteração nos pedidos do cliente; usado no ETag de "Meus Pedidos"
+    atualizado_em = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Resumo de {self.cliente_id}: {self.quantidade_pedidos} pedido(s)"
+
 class Pedido(models.Model):
     """
     Representa um pedido feito por um cliente.
@@ -58,10 +139,47 @@ class Pedido(models.Model):
     cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE)
     data_pedido = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='aguardando_pagamento')
+    # Valores desnormalizados dos itens, mantidos por ecommerce/pedidos.py,
+    # para que as listas não precisem agregar ItemPedido
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    quantidade_itens = models.PositiveIntegerField(default=0)
+    status_alterado_em = models.DateTimeField(default=timezone.now)
+    # Usado nos validadores HTTP (ETag/Last-Modified) das páginas de pedido
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Usado pelos filtros de status e período da lista de pedidos
+            models.Index(fields=['status', 'data_pedido'], name='pedido_status_data_idx'),
+            # Ordenação e filtro por valor na lista de pedidos
+            models.Index(fields=['total', 'id'], name='pedido_total_idx'),
+            # Ordenação padrão (mais recentes primeiro) e filtro por período sem status
+            models.Index(fields=['data_pedido', 'id'], name='pedido_data_idx'),
+            # Histórico de pedidos do cliente (Meus Pedidos)
+            models.Index(fields=['cliente', '-data_pedido'], name='pedido_cliente_data_idx'),
+        ]
 
     def __str__(self):
         return f"Pedido #{self.id} - {self.cliente.user.username}"
 
+class HistoricoStatusPedido(models.Model):
+    """
+    Registro de cada mudança de status de um pedido (ver ecommerce/pedidos.py).
+    """
+    pedido = models.ForeignKey(Pedido, related_name='historico_status', on_delete=models.CASCADE)
+    status_anterior = models.CharField(max_length=20, choices=Pedido.STATUS_CHOICES)
+    novo_status = models.CharField(max_length=20, choices=Pedido.STATUS_CHOICES)
+    alterado_em = models.DateTimeField(default=timezone.now)
+    usuario = models.ForeignKey(CustomUser, null=True, blank=True, on_delete=models.SET_NULL)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pedido', 'alterado_em'], name='historico_pedido_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pedido #{self.pedido_id}: {self.status_anterior} -> {self.novo_status}"
+
 class ItemPedido(models.Model):
     """
     Item individual dentro de um pedido, com a quantidade e o preço no momento da compra.
@@ -76,3 +194,156 @@ class ItemPedido(models.Model):
 
     def __str__(self):
         return f"{self.quantidade}x {self.produto.nome} em Pedido #{self.pedido.id}"
+
+class Carrinho(models.Model):
+    """
+    Carrinho de compras de um usuário, guardado no banco em vez da sessão.
+    Os preços e nomes vêm sempre do Produto, nunca de uma cópia guardada.
+    """
+    user = models.OneToOneField(CustomUser, related_name='carrinho', on_delete=models.CASCADE)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Carrinho de {self.user.username}"
+
+    @classmethod
+    def do_usuario(cls, user):
+        carrinho, _ = cls.objects.get_or_create(user=user)
+        return carrinho
+
+    @classmethod
+    async def ado_usuario(cls, user):
+        carrinho, _ = await cls.objects.aget_or_create(user=user)
+        return carrinho
+
+    def adicionar(self, produto, quantidade=1):
+        """
+        Soma a quantidade ao item do produto com um UPDATE atômico (F()),
+        criando o item apenas se ele ainda não existir.
+        """
+        atualizados = self.itens.filter(produto=produto).update(quantidade=F('quantidade') + quantidade)
+        if atualizados:
+            return
+        try:
+            with transaction.atomic():
+                self.itens.create(produto=produto, quantidade=quantidade)
+        except IntegrityError:
+            # Outra requisição criou o item ao mesmo tempo; basta incrementar
+            self.itens.filter(produto=produto).update(quantidade=F('quantidade') + quantidade)
+
+    def remover(self, produto_id):
+        return self.itens.filter(produto_id=produto_id).delete()[0] > 0
+
+    def limpar(self):
+        return self.itens.all().delete()[0] > 0
+
+    def quantidades(self):
+        return dict(self.itens.values_list('produto_id', 'quantidade'))
+
+    def _expressao_total(self):
+        return Sum(F('quantidade') * F('produto__preco'), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+
+    def total(self):
+        # Soma feita no banco, em Decimal, com uma única query
+        total = self.itens.aggregate(total=self._expressao_total())['total']
+        return total or Decimal('0.00')
+
+    async def atotal(self):
+        total = (await self.itens.aaggregate(total=self._expressao_total()))['total']
+        return total or Decimal('0.00')
+
+
+class ItemCarrinho(models.Model):
+    """
+    Produto e quantidade dentro de um carrinho.
+    """
+    carrinho = models.ForeignKey(Carrinho, related_name='itens', on_delete=models.CASCADE)
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE)
+    quantidade = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['carrinho', 'produto'], name='item_carrinho_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantidade}x {self.produto.nome} no {self.carrinho}"
+
+
+class ReservaEstoque(models.Model):
+    """
+    Unidades de um produto separadas para um carrinho até `expira_em`.
+    O estoque disponível é o estoque menos as reservas ainda válidas (ver ecommerce/reservas.py).
+    """
+    carrinho = models.ForeignKey(Carrinho, related_name='reservas', on_delete=models.CASCADE)
+    produto = models.ForeignKey(Produto, related_name='reservas', on_delete=models.CASCADE)
+    quantidade = models.PositiveIntegerField()
+    expira_em = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['carrinho', 'produto'], name='reserva_estoque_unica'),
+        ]
+        indexes = [
+            # Usado pela soma das reservas válidas de um produto e pela limpeza das expiradas
+            models.Index(fields=['produto', 'expira_em'], name='reserva_produto_expira_idx'),
+            models.Index(fields=['expira_em'], name='reserva_expira_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantidade}x {self.produto_id} reservado(s) até {self.expira_em:%d/%m %H:%M}"
+
+
+class VendaDiaria(models.Model):
+    """
+    Consolidação diária das vendas por produto e status do pedido.
+    Mantida de forma incremental (ver ecommerce/vendas.py), para que o painel
+    de vendas não precise varrer a tabela de itens de pedido.
+    """
+    dia = models.DateField()
+    produto = models.ForeignKey(Produto, related_name='vendas_diarias', on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=Pedido.STATUS_CHOICES)
+    quantidade = models.IntegerField(default=0)
+    receita = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'produto', 'status'], name='venda_diaria_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} - {self.produto.nome} ({self.status}): {self.quantidade}"
+
+
+class Tarefa(models.Model):
+    """
+    Trabalho assíncrono guardado no banco e executado pelo comando processar_tarefas.
+    """
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('executando', 'Executando'),
+        ('concluida', 'Concluída'),
+        ('falhou', 'Falhou'),
+    ]
+    tipo = models.CharField(max_length=100)
+    dados = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    # Tarefas com a mesma chave são enfileiradas uma única vez
+    chave_idempotencia = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    tentativas = models.PositiveIntegerField(default=0)
+    max_tentativas = models.PositiveIntegerField(default=5)
+    executar_apos = models.DateTimeField(default=timezone.now)
+    travada_em = models.DateTimeField(null=True, blank=True)
+    travada_por = models.CharField(max_length=100, blank=True)
+    ultimo_erro = models.TextField(blank=True)
+    criada_em = models.DateTimeField(auto_now_add=True)
+    concluida_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Usado pelos workers para achar a próxima tarefa pronta para rodar
+            models.Index(fields=['status', 'executar_apos'], name='tarefa_fila_idx'),
+        ]
+
+    def __str__(self):
+        return f"Tarefa #{self.id} - {self.tipo} ({self.status})"
@@ -0,0 +1,19 @@
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+
+from .models import Pedido
+from .tarefas import tarefa
+
+
+@tarefa('pedidos.enviar_confirmacao')
+def enviar_confirmacao(pedido_id):
+    """
+    Envia o e-mail de confirmação do pedido para o cliente, se ele tiver e-mail cadastrado.
+    """
+    pedido = Pedido.objects.select_related('cliente__user').get(pk=pedido_id)
+    email = pedido.cliente.user.email
+    if not email:
+        return
+    itens = pedido.itens.select_related('produto')
+    mensagem = render_to_string('ecommerce/email/confirmacao_pedido.txt', {'pedido': pedido, 'itens': itens})
+    send_mail(f'Pedido #{pedido.id} recebido', mensagem, None, [email])
@@ -0,0 +1,98 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class CursorInvalido(Exception):
+    """
+    O cursor recebido na URL não pôde ser decodificado.
+    """
+
+
+class PaginaKeyset:
+    """
+    Uma página de resultados paginados por cursor (keyset).
+    """
+    def __init__(self, itens, proximo_cursor):
+        self.itens = itens
+        self.proximo_cursor = proximo_cursor
+
+    @property
+    def tem_proxima(self):
+        return self.proximo_cursor is not None
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+
+def _campos_da_ordenacao(ordenacao):
+    return [(campo.lstrip('-'), campo.startswith('-')) for campo in ordenacao]
+
+
+def codificar_cursor(objeto, ordenacao):
+    valores = []
+    for campo, _ in _campos_da_ordenacao(ordenacao):
+        valor = getattr(objeto, campo)
+        if hasattr(valor, 'isoformat'):
+            valor = valor.isoformat()
+        elif not isinstance(valor, (int, str)):
+            valor = str(valor)
+        valores.append(valor)
+    texto = json.dumps(valores, separators=(',', ':'))
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, model, ordenacao):
+    try:
+        texto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        valores = json.loads(texto)
+        campos = _campos_da_ordenacao(ordenacao)
+        if not isinstance(valores, list) or len(valores) != len(campos):
+            raise ValueError
+        return [
+            model._meta.get_field('id' if campo == 'pk' else campo).to_python(valor)
+            for (campo, _), valor in zip(campos, valores)
+        ]
+    except (ValueError, TypeError, ValidationError) as e:
+        raise CursorInvalido(cursor) from e
+
+
+def _filtro_apos(ordenacao, valores):
+    """
+    Monta o filtro "depois do cursor" para uma ordenação com vários campos:
+    (a > x) OR (a = x AND b > y) OR ...
+    """
+    filtro = Q()
+    anteriores = {}
+    for (campo, decrescente), valor in zip(_campos_da_ordenacao(ordenacao), valores):
+        lookup = f'{campo}__lt' if decrescente else f'{campo}__gt'
+        filtro |= Q(**anteriores, **{lookup: valor})
+        anteriores[campo] = valor
+    return filtro
+
+
+def paginar_keyset(queryset, ordenacao, cursor=None, tamanho=25):
+    """
+    Pagina um queryset por cursor em vez de OFFSET/COUNT.
+
+    A ordenação precisa terminar em um campo único (normalmente 'id' ou '-id')
+    para que o cursor seja estável. Cada página custa uma única query,
+    independentemente de quantas páginas vieram antes.
+    """
+    queryset = queryset.order_by(*ordenacao)
+    if cursor:
+        valores = decodificar_cursor(cursor, queryset.model, ordenacao)
+        queryset = queryset.filter(_filtro_apos(ordenacao, valores))
+
+    # Busca um item a mais só para saber se existe próxima página
+    itens = list(queryset[:tamanho + 1])
+    proximo_cursor = None
+    if len(itens) > tamanho:
+        itens = itens[:tamanho]
+        proximo_cursor = codificar_cursor(itens[-1], ordenacao)
+    return PaginaKeyset(itens, proximo_cursor)
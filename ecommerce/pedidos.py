@@ -0,0 +1,255 @@
+"""
+Manutenção dos valores desnormalizados de Pedido (total, quantidade_itens) e
+mudança de status dos pedidos.
+
+O checkout grava os valores junto com o pedido; alterações avulsas nos itens
+recalculam o pedido na mesma transação (ver signals.py). O comando
+verificar_pedidos usa verificar_totais() para encontrar e corrigir divergências.
+
+O status só muda pelas transições de TRANSICOES. Cada mudança fica registrada em
+HistoricoStatusPedido e pode ser feita em lote, com um único UPDATE condicional.
+
+ResumoCliente guarda os totais de cada cliente: o checkout o incrementa; mudanças
+avulsas (itens editados, cancelamentos, exclusões) recalculam os clientes afetados.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, OuterRef, Prefetch, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import historico_produtos, tarefas
+from .catalogo import invalidar_catalogo
+from .models import Cliente, HistoricoStatusPedido, ItemPedido, Pedido, Produto, ResumoCliente
+from .paginacao import paginar_keyset
+
+
+DECIMAL_TOTAL = DecimalField(max_digits=12, decimal_places=2)
+
+# Para quais status cada status pode ir
+TRANSICOES = {
+    'aguardando_pagamento': {'processando', 'cancelado'},
+    'processando': {'enviado', 'cancelado'},
+    'enviado': {'entregue'},
+    'entregue': set(),
+    'cancelado': set(),
+}
+
+
+class TransicaoInvalida(Exception):
+    """
+    Levantada quando o pedido não pode ir do status atual para o status pedido.
+    """
+    def __init__(self, status_anterior, novo_status):
+        self.status_anterior = status_anterior
+        self.novo_status = novo_status
+        nomes = dict(Pedido.STATUS_CHOICES)
+        super().__init__(
+            f'Um pedido "{nomes.get(status_anterior, status_anterior)}" '
+            f'não pode passar para "{nomes.get(novo_status, novo_status)}".'
+        )
+
+
+def _totais_calculados():
+    """
+    Expressões com o total e a quantidade de itens de cada pedido, calculados a partir de ItemPedido.
+    """
+    itens = ItemPedido.objects.filter(pedido=OuterRef('pk')).order_by().values('pedido')
+    total = itens.annotate(soma=Sum(F('preco') * F('quantidade'), output_field=DECIMAL_TOTAL)).values('soma')
+    quantidade = itens.annotate(soma=Sum('quantidade')).values('soma')
+    return {
+        'total': Coalesce(Subquery(total), Value(Decimal('0.00')), output_field=DECIMAL_TOTAL),
+        'quantidade_itens': Coalesce(Subquery(quantidade), Value(0)),
+    }
+
+
+def atualizar_totais(pedido_ids):
+    """
+    Recalcula os valores dos pedidos informados com um único UPDATE, e o resumo dos seus clientes.
+    """
+    atualizados = Pedido.objects.filter(pk__in=pedido_ids).update(**_totais_calculados(), atualizado_em=timezone.now())
+    recalcular_resumos(Pedido.objects.filter(pk__in=pedido_ids).values('cliente_id'))
+    return atualizados
+
+
+def historico(cliente, cursor=None, tamanho=10):
+    """
+    Uma página do histórico de pedidos do cliente (mais recentes primeiro) e o seu resumo.
+    Usa o índice pedido_cliente_data_idx; os itens e produtos da página vêm em uma consulta.
+    Levanta CursorInvalido se o cursor não puder ser lido.
+    """
+    itens = ItemPedido.objects.select_related('produto').only(
+        'pedido_id', 'quantidade', 'preco', 'produto__id', 'produto__nome',
+    ).order_by('id')
+    pedidos = Pedido.objects.filter(cliente=cliente).prefetch_related(Prefetch('itens', queryset=itens))
+    pagina = paginar_keyset(pedidos, ('-data_pedido', '-id'), cursor=cursor, tamanho=tamanho)
+    resumo = ResumoCliente.objects.filter(cliente=cliente).first() or ResumoCliente(cliente=cliente)
+    return pagina, resumo
+
+
+def registrar_no_resumo(pedido):
+    """
+    Soma um pedido novo ao resumo do cliente com um UPDATE atômico (F()).
+    No primeiro pedido do cliente, ou se o pedido já nasce cancelado, o resumo é
+    recalculado a partir dos pedidos.
+    """
+    if pedido.status == 'cancelado':
+        recalcular_resumos([pedido.cliente_id])
+        return
+    atualizados = ResumoCliente.objects.filter(cliente_id=pedido.cliente_id).update(
+        quantidade_pedidos=F('quantidade_pedidos') + 1,
+        total_gasto=F('total_gasto') + pedido.total,
+        ultimo_pedido_em=pedido.data_pedido,
+        atualizado_em=timezone.now(),
+    )
+    if not atualizados:
+        recalcular_resumos([pedido.cliente_id])
+
+
+def recalcular_resumos(cliente_ids):
+    """
+    Recalcula o resumo dos clientes informados (ids ou um queryset de ids) a partir dos
+    pedidos, com uma consulta de agregação e um bulk_create com upsert.
+    """
+    # Clientes já excluídos (ex.: exclusão em cascata dos pedidos) são ignorados
+    ids = list(Cliente.objects.filter(pk__in=cliente_ids).values_list('pk', flat=True))
+    if not ids:
+        return
+    validos = ~Q(status='cancelado')
+    linhas = {
+        linha['cliente_id']: linha
+        for linha in Pedido.objects.filter(cliente_id__in=ids).order_by().values('cliente_id').annotate(
+            quantidade=Count('id', filter=validos), total=Sum('total', filter=validos), ultimo=Max('data_pedido', filter=validos),
+        )
+    }
+    agora = timezone.now()
+    resumos = []
+    for cliente_id in ids:
+        linha = linhas.get(cliente_id, {})
+        resumos.append(ResumoCliente(
+            cliente_id=cliente_id,
+            quantidade_pedidos=linha.get('quantidade', 0),
+            total_gasto=linha.get('total') or Decimal('0.00'),
+            ultimo_pedido_em=linha.get('ultimo'),
+            atualizado_em=agora,
+        ))
+    ResumoCliente.objects.bulk_create(
+        resumos, update_conflicts=True, unique_fields=['cliente'],
+        update_fields=['quantidade_pedidos', 'total_gasto', 'ultimo_pedido_em', 'atualizado_em'],
+    )
+
+
+def verificar_totais(tamanho_lote=5000, corrigir=False):
+    """
+    Compara os valores gravados com os calculados a partir dos itens, em lotes por faixa de id.
+    Com corrigir=True, grava os valores calculados nos pedidos divergentes.
+    Retorna a lista de ids divergentes.
+    """
+    calculados = {f'{campo}_calculado': expressao for campo, expressao in _totais_calculados().items()}
+    divergentes = []
+    ultimo_id = 0
+    while True:
+        lote = list(
+            Pedido.objects.filter(pk__gt=ultimo_id).order_by('pk')
+            .annotate(**calculados)
+            .values_list('pk', 'total', 'quantidade_itens', 'total_calculado', 'quantidade_itens_calculado')[:tamanho_lote]
+        )
+        if not lote:
+            return divergentes
+        ids = [
+            pk for pk, total, quantidade, total_calculado, quantidade_calculada in lote
+            if total != total_calculado or quantidade != quantidade_calculada
+        ]
+        if ids and corrigir:
+            with transaction.atomic():
+                atualizar_totais(ids)
+        divergentes.extend(ids)
+        ultimo_id = lote[-1][0]
+
+
+def origens(novo_status):
+    """
+    Status a partir dos quais um pedido pode passar para `novo_status`.
+    """
+    return [status for status, destinos in TRANSICOES.items() if novo_status in destinos]
+
+
+def alterar_status(pedido, novo_status, usuario=None):
+    """
+    Muda o status de um pedido, levantando TransicaoInvalida se a transição não for permitida.
+    """
+    if novo_status not in TRANSICOES.get(pedido.status, ()):
+        raise TransicaoInvalida(pedido.status, novo_status)
+    if not alterar_status_em_lote(Pedido.objects.filter(pk=pedido.pk), novo_status, usuario):
+        # O status mudou no banco depois que o pedido foi lido
+        pedido.refresh_from_db(fields=['status'])
+        raise TransicaoInvalida(pedido.status, novo_status)
+    pedido.refresh_from_db(fields=['status', 'status_alterado_em', 'atualizado_em'])
+
+
+def alterar_status_em_lote(pedidos, novo_status, usuario=None):
+    """
+    Move para `novo_status` os pedidos do queryset que estão em um status de origem
+    permitido; os demais são ignorados. Retorna os ids dos pedidos alterados.
+
+    Tudo na mesma transação: um UPDATE ... WHERE status IN (...), o histórico com
+    bulk_create, a consolidação de vendas (pelo worker) e, no cancelamento, a
+    devolução do estoque com um único UPDATE.
+    """
+    permitidos = origens(novo_status)
+    agora = timezone.now()
+    with transaction.atomic():
+        anteriores = dict(
+            pedidos.filter(status__in=permitidos).select_for_update().order_by().values_list('id', 'status')
+        )
+        if not anteriores:
+            return []
+        # A condição no status garante que nenhum pedido pula uma transição
+        Pedido.objects.filter(pk__in=list(anteriores), status__in=permitidos).update(
+            status=novo_status, status_alterado_em=agora, atualizado_em=agora,
+        )
+        HistoricoStatusPedido.objects.bulk_create([
+            HistoricoStatusPedido(
+                pedido_id=pedido_id, status_anterior=status_anterior, novo_status=novo_status,
+                alterado_em=agora, usuario=usuario,
+            )
+            for pedido_id, status_anterior in anteriores.items()
+        ], batch_size=1000)
+
+        por_status = {}
+        for pedido_id, status_anterior in anteriores.items():
+            por_status.setdefault(status_anterior, []).append(pedido_id)
+        for status_anterior, pedido_ids in por_status.items():
+            tarefas.enfileirar('vendas.mover_status', {
+                'pedido_ids': pedido_ids,
+                'status_anterior': status_anterior,
+                'novo_status': novo_status,
+            })
+
+        alterados = Pedido.objects.filter(pk__in=list(anteriores))
+        if novo_status == 'cancelado':
+            devolver_estoque(list(anteriores), agora)
+            recalcular_resumos(alterados.values('cliente_id'))
+        else:
+            # Os totais não mudam, mas a página "Meus Pedidos" mostra o status
+            ResumoCliente.objects.filter(cliente__in=alterados.values('cliente_id')).update(atualizado_em=agora)
+    return list(anteriores)
+
+
+def devolver_estoque(pedido_ids, agora=None):
+    """
+    Devolve ao estoque as unidades dos pedidos informados, com um único UPDATE.
+    """
+    itens = ItemPedido.objects.filter(pedido_id__in=pedido_ids)
+    devolvidas = (
+        itens.filter(produto=OuterRef('pk')).order_by().values('produto')
+        .annotate(soma=Sum('quantidade')).values('soma')
+    )
+    agora = agora or timezone.now()
+    Produto.objects.filter(pk__in=itens.values('produto_id')).update(
+        estoque=F('estoque') + Subquery(devolvidas), atualizado_em=agora,
+    )
+    historico_produtos.registrar_produtos(itens.values('produto_id'), 'devolucao', agora)
+    # Produtos esgotados podem voltar a aparecer disponíveis no catálogo
+    transaction.on_commit(invalidar_catalogo)
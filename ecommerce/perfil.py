@@ -0,0 +1,220 @@
+"""
+Perfil das requisições: consultas ao banco, consultas repetidas (N+1), tempo de
+banco, tempo de renderização de templates e tamanho da resposta.
+
+O middleware é opcional e amostrado: só uma fração das requisições
+(PERFIL_AMOSTRAGEM, de 0 a 1) é medida, então pode ficar ligado em produção.
+As medições aparecem no cabeçalho Server-Timing da própria resposta (só para
+usuários da equipe ou da empresa) e são
+acumuladas, por processo, em uma janela das últimas requisições de cada URL
+(ver metricas(), exposto em /metricas/perfil/).
+"""
+import random
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template as TemplateDjango
+
+from .benchmark import estatisticas
+
+
+# Limites (em ms) das faixas do histograma de tempo total
+FAIXAS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+# Consultas idênticas (mesmo SQL, parâmetros diferentes) a partir desse número são reportadas
+LIMITE_REPETICOES = 3
+
+_coleta_atual = ContextVar('perfil_coleta', default=None)
+_janelas = {}
+_trava = threading.Lock()
+
+
+class Coleta:
+    """
+    Mede as consultas e os templates renderizados dentro do bloco `with`.
+    """
+    def __init__(self):
+        self.consultas = 0
+        self.tempo_banco = 0.0
+        self.tempo_templates = 0.0
+        self.assinaturas = Counter()
+        self._pilha = None
+        self._token = None
+
+    def __enter__(self):
+        self._ligar_conexoes()
+        self._token = _coleta_atual.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _coleta_atual.reset(self._token)
+        self._desligar_conexoes()
+
+    def _ligar_conexoes(self):
+        # As conexões são por thread: mede as da thread que chamou
+        self._pilha = ExitStack()
+        for conexao in connections.all():
+            self._pilha.enter_context(conexao.execute_wrapper(self._medir_consulta))
+
+    def _desligar_conexoes(self):
+        self._pilha.close()
+
+    def _medir_consulta(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tempo_banco += (time.perf_counter() - inicio) * 1000
+            self.consultas += 1
+            # O SQL ainda tem os marcadores (%s), então a mesma consulta em um laço tem a mesma assinatura
+            self.assinaturas[sql] += 1
+
+    def repetidas(self, limite=LIMITE_REPETICOES):
+        return [(sql, vezes) for sql, vezes in self.assinaturas.most_common() if vezes >= limite]
+
+
+def _renderizar_medindo(render_original):
+    def render(self, context=None, request=None):
+        coleta = _coleta_atual.get()
+        if coleta is None:
+            return render_original(self, context, request)
+        inicio = time.perf_counter()
+        try:
+            return render_original(self, context, request)
+        finally:
+            coleta.tempo_templates += (time.perf_counter() - inicio) * 1000
+    render.medindo = True
+    return render
+
+
+def _instrumentar_templates():
+    # Não há sinal de renderização fora dos testes: o render do backend de templates
+    # do Django é envolvido uma única vez e só mede quando há uma coleta ativa.
+    if not getattr(TemplateDjango.render, 'medindo', False):
+        TemplateDjango.render = _renderizar_medindo(TemplateDjango.render)
+
+
+def registrar(nome_url, amostra):
+    with _trava:
+        janela = _janelas.get(nome_url)
+        if janela is None:
+            janela = _janelas[nome_url] = deque(maxlen=settings.PERFIL_JANELA)
+        janela.append(amostra)
+
+
+def limpar():
+    with _trava:
+        _janelas.clear()
+
+
+def metricas():
+    """
+    Resumo por nome de URL das requisições na janela: tempos, histograma,
+    média de consultas e as consultas repetidas mais frequentes.
+    """
+    with _trava:
+        janelas = {nome: list(janela) for nome, janela in _janelas.items()}
+
+    resultado = {}
+    for nome, amostras in sorted(janelas.items()):
+        totais = [amostra['total_ms'] for amostra in amostras]
+        histograma = Counter()
+        for total in totais:
+            faixa = next((f'<={limite}ms' for limite in FAIXAS_MS if total <= limite), f'>{FAIXAS_MS[-1]}ms')
+            histograma[faixa] += 1
+        repetidas = Counter()
+        for amostra in amostras:
+            for sql, vezes in amostra['repetidas']:
+                repetidas[sql] = max(repetidas[sql], vezes)
+        resultado[nome] = {
+            'amostras': len(amostras),
+            **estatisticas(totais),
+            'histograma_ms': dict(histograma),
+            'consultas_media': round(sum(a['consultas'] for a in amostras) / len(amostras), 1),
+            'consultas_max': max(a['consultas'] for a in amostras),
+            'banco_media_ms': round(sum(a['banco_ms'] for a in amostras) / len(amostras), 3),
+            'templates_media_ms': round(sum(a['templates_ms'] for a in amostras) / len(amostras), 3),
+            'bytes_media': round(sum(a['bytes'] for a in amostras) / len(amostras)),
+            'consultas_repetidas': [{'sql': sql, 'vezes': vezes} for sql, vezes in repetidas.most_common(5)],
+        }
+    return resultado
+
+
+def _pode_ver(user):
+    # Consultas e tempos internos só aparecem para a equipe, não para qualquer visitante
+    return user is not None and user.is_authenticated and (user.is_staff or user.cargo == 'empresa')
+
+
+class PerfilMiddleware:
+    """
+    Mede uma amostra das requisições. Desligado (MiddlewareNotUsed) com PERFIL_AMOSTRAGEM = 0.
+    Sob ASGI roda como corrotina, sem que o Django adapte a cadeia de middlewares.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PERFIL_AMOSTRAGEM:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        _instrumentar_templates()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.PERFIL_AMOSTRAGEM:
+            return self.get_response(request)
+
+        inicio = time.perf_counter()
+        with Coleta() as coleta:
+            response = self.get_response(request)
+        total = (time.perf_counter() - inicio) * 1000
+        # Sem usuário quando a requisição falha antes do AuthenticationMiddleware (ex.: Host inválido)
+        return self._publicar(request, response, coleta, total, _pode_ver(getattr(request, 'user', None)))
+
+    async def __acall__(self, request):
+        if random.random() >= settings.PERFIL_AMOSTRAGEM:
+            return await self.get_response(request)
+
+        inicio = time.perf_counter()
+        # As views async consultam o banco na thread do sync_to_async da requisição,
+        # então as conexões medidas são as daquela thread
+        coleta = Coleta()
+        await sync_to_async(coleta._ligar_conexoes)()
+        token = _coleta_atual.set(coleta)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _coleta_atual.reset(token)
+            await sync_to_async(coleta._desligar_conexoes)()
+        total = (time.perf_counter() - inicio) * 1000
+        usuario = await request.auser() if hasattr(request, 'auser') else None
+        return self._publicar(request, response, coleta, total, _pode_ver(usuario))
+
+    def _publicar(self, request, response, coleta, total, mostrar):
+        tamanho = 0 if response.streaming else len(response.content)
+        if mostrar:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={coleta.tempo_banco:.1f};desc="{coleta.consultas} consultas"',
+                f'tpl;dur={coleta.tempo_templates:.1f}',
+                f'total;dur={total:.1f}',
+            ])
+
+        match = request.resolver_match
+        registrar(match.view_name if match else '<sem rota>', {
+            'total_ms': total,
+            'consultas': coleta.consultas,
+            'banco_ms': coleta.tempo_banco,
+            'templates_ms': coleta.tempo_templates,
+            'bytes': tamanho,
+            'repetidas': coleta.repetidas(),
+        })
+        return response
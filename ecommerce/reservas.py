@@ -0,0 +1,87 @@
+"""
+Reserva de estoque para os itens do carrinho.
+
+Ao adicionar um produto ao carrinho, as unidades ficam reservadas por
+RESERVA_ESTOQUE_MINUTOS. O estoque disponível de um produto é o estoque menos
+as reservas ainda válidas, calculado na mesma query que busca os produtos
+(Produto.objects.com_disponivel()). Reservas vencidas deixam de contar na hora
+e são apagadas em lote pelo comando liberar_reservas.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .catalogo import invalidar_catalogo
+from .checkout import EstoqueInsuficiente
+from .models import Produto, ReservaEstoque
+
+
+def validade():
+    return timedelta(minutes=settings.RESERVA_ESTOQUE_MINUTOS)
+
+
+def adicionar_ao_carrinho(carrinho, produto, quantidade=1):
+    """
+    Adiciona o produto ao carrinho e reserva as unidades, renovando a validade
+    das reservas do carrinho. Levanta EstoqueInsuficiente se não houver unidades
+    disponíveis para a quantidade total do carrinho.
+    """
+    with transaction.atomic():
+        # A trava no produto serializa reservas concorrentes do mesmo produto
+        disponivel = (
+            Produto.objects.select_for_update().filter(pk=produto.pk)
+            .com_disponivel(exceto_carrinho=carrinho)
+            .values_list('disponivel', flat=True)
+            .get()
+        )
+        no_carrinho = carrinho.itens.filter(produto=produto).values_list('quantidade', flat=True).first() or 0
+        desejado = no_carrinho + quantidade
+        if desejado > disponivel:
+            raise EstoqueInsuficiente([produto])
+
+        expira_em = timezone.now() + validade()
+        ReservaEstoque.objects.update_or_create(
+            carrinho=carrinho, produto=produto,
+            defaults={'quantidade': desejado, 'expira_em': expira_em},
+        )
+        carrinho.reservas.exclude(produto=produto).update(expira_em=expira_em)
+        carrinho.adicionar(produto, quantidade)
+        if desejado == disponivel:
+            # A última unidade foi reservada: a grade do catálogo passa a mostrar "Sem estoque"
+            transaction.on_commit(invalidar_catalogo)
+
+
+def liberar(carrinho, produto_ids=None):
+    """
+    Apaga as reservas do carrinho (ou só as dos produtos informados).
+    """
+    reservas = carrinho.reservas.all()
+    if produto_ids is not None:
+        reservas = reservas.filter(produto_id__in=produto_ids)
+    ids = list(reservas.values_list('produto_id', flat=True))
+    if not ids:
+        return 0
+    # Se algum desses produtos aparecia esgotado, a grade do catálogo precisa mudar
+    esgotados = Produto.objects.filter(pk__in=ids).com_disponivel().filter(disponivel__lte=0).exists()
+    apagadas = reservas.delete()[0]
+    if esgotados:
+        transaction.on_commit(invalidar_catalogo)
+    return apagadas
+
+
+def liberar_expiradas(tamanho_lote=5000):
+    """
+    Apaga as reservas vencidas em lotes. Retorna quantas foram apagadas.
+    """
+    agora = timezone.now()
+    total = 0
+    while True:
+        ids = list(ReservaEstoque.objects.filter(expira_em__lte=agora).values_list('id', flat=True)[:tamanho_lote])
+        if not ids:
+            break
+        total += ReservaEstoque.objects.filter(id__in=ids).delete()[0]
+    if total:
+        invalidar_catalogo()
+    return total
@@ -0,0 +1,93 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from . import busca, clientes, historico_produtos, pedidos, vendas
+from .catalogo import invalidar_catalogo
+from .models import Produto, Carrinho, Cliente, CustomUser, ItemPedido, Pedido
+
+
+@receiver([post_save, post_delete], sender=Produto)
+def produto_alterado(sender, **kwargs):
+    # Qualquer mudança em um produto invalida as páginas do catálogo em cache
+    invalidar_catalogo()
+
+
+@receiver(post_save, sender=Produto)
+def indexar_produto(sender, instance, update_fields=None, **kwargs):
+    # Alterações só de preço/estoque não mexem no texto indexado
+    if update_fields and not {'nome', 'descricao'} & set(update_fields):
+        return
+    busca.indexar_produtos([instance.pk])
+
+
+@receiver(post_save, sender=Produto)
+def registrar_preco_e_estoque(sender, instance, created, update_fields=None, **kwargs):
+    # Só grava no histórico quando o preço ou o estoque mudaram desde a leitura do banco
+    if update_fields and not {'preco', 'estoque'} & set(update_fields):
+        return
+    estado = (instance.preco, instance.estoque)
+    if created or estado != getattr(instance, '_registrado', None):
+        historico_produtos.registrar([(instance.pk, *estado)], 'edicao')
+        instance._registrado = estado
+
+
+@receiver(post_delete, sender=Produto)
+def desindexar_produto(sender, instance, **kwargs):
+    busca.remover_produtos([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=ItemPedido)
+def item_pedido_alterado(sender, instance, **kwargs):
+    # Mantém o total e a quantidade de itens do pedido; roda na transação de quem alterou o item.
+    # O checkout grava os itens com bulk_create (sem sinais) e já cria o pedido com os valores.
+    pedidos.atualizar_totais([instance.pedido_id])
+
+
+@receiver(post_save, sender=Pedido)
+def pedido_criado(sender, instance, created, **kwargs):
+    # Vale para o checkout e para os pedidos criados pela equipe
+    if created:
+        pedidos.registrar_no_resumo(instance)
+
+
+@receiver(pre_delete, sender=Pedido)
+def remover_das_vendas(sender, instance, **kwargs):
+    # Antes da exclusão em cascata dos itens, que são a base da contribuição na VendaDiaria
+    vendas.remover_pedido(instance)
+
+
+@receiver(post_delete, sender=Pedido)
+def pedido_excluido(sender, instance, **kwargs):
+    # Na exclusão do cliente o resumo já foi junto; recalcular_resumos ignora clientes inexistentes
+    transaction.on_commit(lambda: pedidos.recalcular_resumos([instance.cliente_id]))
+
+
+@receiver([post_save, post_delete], sender=Cliente)
+def cliente_alterado(sender, instance, **kwargs):
+    clientes.invalidar(instance.user_id)
+
+
+@receiver(post_save, sender=CustomUser)
+def usuario_criado(sender, instance, created, **kwargs):
+    # Um usuário novo nunca herda a entrada em cache de um id reaproveitado
+    if created:
+        clientes.invalidar(instance.pk)
+
+
+@receiver(user_logged_in)
+def migrar_carrinho_da_sessao(sender, request, user, **kwargs):
+    """
+    Move para o banco os carrinhos antigos que ainda estão guardados na sessão.
+    """
+    carrinho_sessao = request.session.pop('carrinho', None)
+    if not carrinho_sessao:
+        return
+
+    carrinho = Carrinho.do_usuario(user)
+    produtos = Produto.objects.in_bulk([int(produto_id) for produto_id in carrinho_sessao])
+    for produto_id, item in carrinho_sessao.items():
+        produto = produtos.get(int(produto_id))
+        if produto is not None:
+            carrinho.adicionar(produto, item['quantidade'])
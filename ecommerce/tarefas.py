@@ -0,0 +1,178 @@
+"""
+Fila de tarefas assíncronas guardada no banco de dados.
+
+As tarefas são enfileiradas na mesma transação que as originou (ex.: o checkout),
+então só existem se o pedido existir. O comando processar_tarefas executa as
+tarefas prontas, com novas tentativas e espera exponencial em caso de erro.
+
+Para reservar tarefas, o PostgreSQL usa SELECT ... FOR UPDATE SKIP LOCKED; nos
+demais bancos (SQLite) cada tarefa é reservada com um UPDATE condicional no status,
+de forma que dois workers nunca executam a mesma tarefa.
+"""
+import logging
+import os
+import random
+import socket
+import traceback
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Tarefa
+
+
+logger = logging.getLogger(__name__)
+
+ESPERA_BASE_SEGUNDOS = 10
+ESPERA_MAXIMA_SEGUNDOS = 60 * 60
+# Tarefas "executando" há mais tempo que isso são consideradas abandonadas
+TEMPO_LIMITE_SEGUNDOS = 15 * 60
+
+_registro = {}
+
+
+class ReservaPerdida(Exception):
+    """
+    A tarefa foi devolvida para a fila (ou reservada por outro worker) enquanto executava.
+    """
+
+
+def tarefa(tipo):
+    """
+    Registra uma função como tarefa. A função recebe os dados enfileirados como argumentos nomeados.
+    """
+    def registrar(funcao):
+        _registro[tipo] = funcao
+        return funcao
+    return registrar
+
+
+def enfileirar(tipo, dados=None, chave=None, atraso=None, max_tentativas=5):
+    """
+    Enfileira uma tarefa com um único INSERT. Se já existir uma tarefa com a
+    mesma chave de idempotência, nada é feito.
+    """
+    Tarefa.objects.bulk_create([
+        Tarefa(
+            tipo=tipo,
+            dados=dados or {},
+            chave_idempotencia=chave,
+            max_tentativas=max_tentativas,
+            executar_apos=timezone.now() + (atraso or timedelta()),
+        )
+    ], ignore_conflicts=True)
+
+
+def nome_do_worker():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _reservar_com_skip_locked(trabalhador, limite, agora):
+    with transaction.atomic():
+        ids = list(
+            Tarefa.objects.select_for_update(skip_locked=True)
+            .filter(status='pendente', executar_apos__lte=agora)
+            .order_by('executar_apos')
+            .values_list('id', flat=True)[:limite]
+        )
+        Tarefa.objects.filter(id__in=ids).update(
+            status='executando', travada_em=agora, travada_por=trabalhador, tentativas=F('tentativas') + 1,
+        )
+    return ids
+
+
+def _reservar_com_update_condicional(trabalhador, limite, agora):
+    candidatas = list(
+        Tarefa.objects.filter(status='pendente', executar_apos__lte=agora)
+        .order_by('executar_apos')
+        .values_list('id', flat=True)[:limite]
+    )
+    ids = []
+    for tarefa_id in candidatas:
+        # Só um worker consegue mudar o status de 'pendente' para 'executando'
+        reservada = Tarefa.objects.filter(id=tarefa_id, status='pendente').update(
+            status='executando', travada_em=agora, travada_por=trabalhador, tentativas=F('tentativas') + 1,
+        )
+        if reservada:
+            ids.append(tarefa_id)
+    return ids
+
+
+def reservar(trabalhador, limite=10):
+    """
+    Reserva até `limite` tarefas prontas para este worker e as retorna.
+    """
+    agora = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        ids = _reservar_com_skip_locked(trabalhador, limite, agora)
+    else:
+        ids = _reservar_com_update_condicional(trabalhador, limite, agora)
+    return list(Tarefa.objects.filter(id__in=ids).order_by('executar_apos'))
+
+
+def liberar_abandonadas(tempo_limite=TEMPO_LIMITE_SEGUNDOS):
+    """
+    Devolve para a fila as tarefas de workers que morreram no meio da execução.
+    """
+    limite = timezone.now() - timedelta(seconds=tempo_limite)
+    return Tarefa.objects.filter(status='executando', travada_em__lt=limite).update(
+        status='pendente', travada_em=None, travada_por='',
+    )
+
+
+def _espera(tentativas):
+    segundos = min(ESPERA_BASE_SEGUNDOS * 2 ** (tentativas - 1), ESPERA_MAXIMA_SEGUNDOS)
+    return timedelta(seconds=segundos * random.uniform(0.8, 1.2))
+
+
+def executar(tarefa_reservada):
+    """
+    Executa uma tarefa reservada. O efeito da tarefa no banco e a marcação de
+    concluída acontecem na mesma transação, então uma falha não deixa efeito pela metade.
+    As duas marcações só valem enquanto a reserva for deste worker: se a tarefa foi
+    liberada por liberar_abandonadas() no meio da execução, o efeito é desfeito.
+    Retorna True se a tarefa foi concluída.
+    """
+    funcao = _registro.get(tarefa_reservada.tipo)
+    # A reserva é identificada pelo worker e pelo instante em que ele a fez
+    reserva = Tarefa.objects.filter(
+        pk=tarefa_reservada.pk, status='executando',
+        travada_por=tarefa_reservada.travada_por, travada_em=tarefa_reservada.travada_em,
+    )
+    try:
+        if funcao is None:
+            raise LookupError(f'Tarefa desconhecida: {tarefa_reservada.tipo}')
+        with transaction.atomic():
+            funcao(**tarefa_reservada.dados)
+            if not reserva.update(status='concluida', concluida_em=timezone.now(), ultimo_erro=''):
+                raise ReservaPerdida
+        return True
+    except ReservaPerdida:
+        logger.warning('Tarefa #%s (%s) deixou de ser deste worker; o efeito foi desfeito', tarefa_reservada.pk, tarefa_reservada.tipo)
+        return False
+    except Exception:
+        erro = traceback.format_exc()
+        logger.warning('Tarefa #%s (%s) falhou na tentativa %s', tarefa_reservada.pk, tarefa_reservada.tipo, tarefa_reservada.tentativas)
+        if tarefa_reservada.tentativas >= tarefa_reservada.max_tentativas:
+            reserva.update(status='falhou', ultimo_erro=erro)
+        else:
+            reserva.update(
+                status='pendente',
+                ultimo_erro=erro,
+                travada_em=None,
+                travada_por='',
+                executar_apos=timezone.now() + _espera(tarefa_reservada.tentativas),
+            )
+        return False
+
+
+def processar_pendentes(trabalhador=None, limite=10):
+    """
+    Reserva e executa um lote de tarefas. Retorna quantas foram executadas.
+    """
+    tarefas = reservar(trabalhador or nome_do_worker(), limite)
+    for tarefa_reservada in tarefas:
+        executar(tarefa_reservada)
+    return len(tarefas)
@@ -0,0 +1,24 @@
+from django import template
+
+from ecommerce import imagens
+
+
+register = template.Library()
+
+
+@register.inclusion_tag('ecommerce/_imagem_produto.html')
+def imagem_produto(produto, classe='', estilo='', tamanhos='(max-width: 768px) 100vw, 33vw'):
+    """
+    Renderiza a imagem do produto usando as miniaturas locais (srcset) quando
+    elas já existem, ou a imagem original como alternativa.
+    """
+    contexto = {'produto': produto, 'classe': classe, 'estilo': estilo, 'tamanhos': tamanhos}
+    if imagens.prontos(produto.imagem_hash):
+        contexto['fontes'] = [
+            {'tipo': f'image/{formato}', 'srcset': imagens.srcset(produto.imagem_hash, formato)}
+            for formato in imagens.formatos_disponiveis()
+        ]
+        contexto['src'] = imagens.url(produto.imagem_hash)
+    elif produto.imagem:
+        contexto['src'] = produto.imagem.url
+    return contexto
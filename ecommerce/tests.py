@@ -1,3 +1,1321 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core import mail
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, OperationalError
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import armazenamento, busca, clientes, historico_produtos, imagens, importacao, limites, pedidos, perfil, reservas, tarefas, urls, vendas, views_async
+from .checkout import finalizar_pedido, EstoqueInsuficiente
+from .models import CustomUser, Cliente, Produto, Pedido, ItemPedido, Carrinho, VendaDiaria, Tarefa, ReservaEstoque, HistoricoStatusPedido, ResumoCliente, HistoricoProduto
+from .views import PedidoListView
+
+
+def criar_cliente(username='cliente'):
+    user = CustomUser.objects.create_user(username=username)
+    return Cliente.objects.create(user=user)
+
+
+def criar_empresa(username='empresa'):
+    return CustomUser.objects.create_user(username=username, cargo='empresa')
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.cliente = criar_cliente()
+        self.celular = Produto.objects.create(nome='Celular', descricao='-', preco=Decimal('1500.00'), estoque=5)
+        self.capa = Produto.objects.create(nome='Capa', descricao='-', preco=Decimal('30.00'), estoque=10)
+
+    def test_cria_itens_e_baixa_estoque(self):
+        pedido = finalizar_pedido(self.cliente, {self.celular.pk: 2, self.capa.pk: 3})
+
+        itens = {item.produto_id: item for item in pedido.itens.all()}
+        self.assertEqual(itens[self.celular.pk].quantidade, 2)
+        self.assertEqual(itens[self.celular.pk].preco, Decimal('1500.00'))
+        self.celular.refresh_from_db()
+        self.capa.refresh_from_db()
+        self.assertEqual(self.celular.estoque, 3)
+        self.assertEqual(self.capa.estoque, 7)
+
+    def test_quantidade_de_queries_nao_depende_do_numero_de_itens(self):
+        produtos = [
+            Produto.objects.create(nome=f'Produto {i}', descricao='-', preco=Decimal('1.00'), estoque=10)
+            for i in range(20)
+        ]
+        ResumoCliente.objects.create(cliente=self.cliente)
+        # SELECT ... FOR UPDATE, INSERT pedido, INSERT itens, UPDATE estoque, INSERT histórico,
+        # UPDATE resumo, duas tarefas enfileiradas para depois do checkout (+ savepoint)
+        with self.assertNumQueries(10):
+            finalizar_pedido(self.cliente, {produto.pk: 1 for produto in produtos})
+
+    def test_trava_os_produtos_na_ordem_do_id(self):
+        with CaptureQueriesContext(connection) as contexto:
+            finalizar_pedido(self.cliente, {self.capa.pk: 1, self.celular.pk: 1})
+        [leitura] = [consulta['sql'] for consulta in contexto.captured_queries
+                     if consulta['sql'].startswith('SELECT') and 'FROM "ecommerce_produto"' in consulta['sql']]
+        self.assertTrue(leitura.endswith('ORDER BY "ecommerce_produto"."id" ASC'), leitura)
+
+    def test_rejeita_pedido_sem_estoque(self):
+        with self.assertRaises(EstoqueInsuficiente):
+            finalizar_pedido(self.cliente, {self.celular.pk: 1, self.capa.pk: 11})
+
+        self.assertFalse(Pedido.objects.exists())
+        self.assertFalse(ItemPedido.objects.exists())
+        self.celular.refresh_from_db()
+        self.assertEqual(self.celular.estoque, 5)
+
+
+class CheckoutConcorrenteTests(TransactionTestCase):
+    """
+    Vários clientes disputando o mesmo produto ao mesmo tempo: o estoque
+    final precisa bater exatamente com o que foi vendido, sem vendas além do estoque.
+    """
+    THREADS = 8
+    PEDIDOS_POR_THREAD = 5
+    ESTOQUE_INICIAL = 17
+
+    def test_estoque_nao_e_perdido_nem_vendido_alem_do_disponivel(self):
+        produto = Produto.objects.create(nome='Oferta', descricao='-', preco=Decimal('10.00'), estoque=self.ESTOQUE_INICIAL)
+        clientes = [criar_cliente(f'cliente{i}') for i in range(self.THREADS)]
+        barreira = threading.Barrier(self.THREADS)
+        resultados = {'vendidos': 0, 'rejeitados': 0}
+        trava = threading.Lock()
+
+        def comprar(cliente):
+            try:
+                barreira.wait()
+                for _ in range(self.PEDIDOS_POR_THREAD):
+                    while True:
+                        try:
+                            finalizar_pedido(cliente, {produto.pk: 1})
+                            chave = 'vendidos'
+                        except EstoqueInsuficiente:
+                            chave = 'rejeitados'
+                        except OperationalError:
+                            # Banco ocupado (SQLite): tenta de novo, como faria o usuário
+                            continue
+                        with trava:
+                            resultados[chave] += 1
+                        break
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=comprar, args=(cliente,)) for cliente in clientes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        produto.refresh_from_db()
+        total_pedidos = self.THREADS * self.PEDIDOS_POR_THREAD
+        self.assertEqual(resultados['vendidos'] + resultados['rejeitados'], total_pedidos)
+        self.assertEqual(resultados['vendidos'], self.ESTOQUE_INICIAL)
+        self.assertEqual(produto.estoque, 0)
+        self.assertEqual(ItemPedido.objects.filter(produto=produto).count(), self.ESTOQUE_INICIAL)
+
+
+class PedidoListViewTests(TestCase):
+    def setUp(self):
+        self.client.force_login(criar_empresa())
+
+    def criar_pedidos(self, quantidade, status='aguardando_pagamento'):
+        inicio = Cliente.objects.count()
+        clientes = [criar_cliente(f'cliente-{inicio + i}') for i in range(quantidade)]
+        return [Pedido.objects.create(cliente=cliente, status=status) for cliente in clientes]
+
+    def test_quantidade_de_queries_constante_por_pagina(self):
+        self.criar_pedidos(5)
+        # sessão, usuário e a página de pedidos (com cliente e usuário via JOIN)
+        with self.assertNumQueries(3):
+            self.client.get(reverse('pedido_list'))
+
+        self.criar_pedidos(40)
+        with self.assertNumQueries(3):
+            resposta = self.client.get(reverse('pedido_list'))
+        self.assertEqual(len(resposta.context['pedidos']), PedidoListView.itens_por_pagina)
+
+    @override_settings(TIME_ZONE='America/Sao_Paulo')
+    def test_filtro_de_data_usa_o_dia_local(self):
+        # 10/03 no fuso de São Paulo vai de 03:00 UTC do dia 10 a 03:00 UTC do dia 11
+        instantes = ['2026-03-10T02:59Z', '2026-03-10T03:00Z', '2026-03-11T02:59Z', '2026-03-11T03:00Z']
+        for pedido, instante in zip(self.criar_pedidos(4), instantes):
+            Pedido.objects.filter(pk=pedido.pk).update(data_pedido=datetime.fromisoformat(instante))
+
+        resposta = self.client.get(reverse('pedido_list'), {'data_inicio': '2026-03-10', 'data_fim': '2026-03-10'})
+
+        self.assertEqual(
+            sorted(p.data_pedido.isoformat() for p in resposta.context['pedidos']),
+            ['2026-03-10T03:00:00+00:00', '2026-03-11T02:59:00+00:00'],
+        )
+
+    def test_exportacao_leva_todos_os_filtros_da_lista(self):
+        resposta = self.client.get(reverse('pedido_list'), {'status': 'enviado', 'valor_minimo': '10', 'ordem': 'maior_valor'})
+        self.assertContains(
+            resposta, f"{reverse('pedido_export')}?status=enviado&amp;valor_minimo=10&amp;ordem=maior_valor&formato=csv",
+        )
+
+    def test_cursor_percorre_todas_as_paginas_com_filtro(self):
+        enviados = self.criar_pedidos(30, status='enviado')
+        self.criar_pedidos(5, status='processando')
+
+        vistos = []
+        parametros = {'status': 'enviado'}
+        while True:
+            resposta = self.client.get(reverse('pedido_list'), parametros)
+            vistos.extend(pedido.pk for pedido in resposta.context['pedidos'])
+            pagina = resposta.context['pagina']
+            if not pagina.tem_proxima:
+                break
+            parametros['cursor'] = pagina.proximo_cursor
+
+        self.assertEqual(vistos, sorted((pedido.pk for pedido in enviados), reverse=True))
+
+    def test_cursor_invalido_retorna_404(self):
+        resposta = self.client.get(reverse('pedido_list'), {'cursor': 'nao-e-um-cursor'})
+        self.assertEqual(resposta.status_code, 404)
+
+
+class PedidoDetailViewTests(TestCase):
+    def setUp(self):
+        self.cliente = criar_cliente()
+        self.client.force_login(criar_empresa())
+
+    def criar_pedido(self, quantidade_itens):
+        pedido = Pedido.objects.create(cliente=self.cliente)
+        for i in range(quantidade_itens):
+            produto = Produto.objects.create(nome=f'Item {i}', descricao='-', preco=Decimal('1.50'), estoque=1)
+            ItemPedido.objects.create(pedido=pedido, produto=produto, preco=Decimal('1.50'), quantidade=i + 1)
+        return pedido
+
+    def test_consultas_nao_dependem_do_numero_de_itens(self):
+        for quantidade_itens in (1, 10):
+            pedido = self.criar_pedido(quantidade_itens)
+            # sessão + usuário + validadores do ETag + pedido + itens com produtos
+            with self.assertNumQueries(5):
+                resposta = self.client.get(reverse('pedido_detail', args=[pedido.pk]))
+            self.assertEqual(len(resposta.context['itens_pedido']), quantidade_itens)
+
+    def test_exibe_subtotais_e_total(self):
+        pedido = self.criar_pedido(3)
+        resposta = self.client.get(reverse('pedido_detail', args=[pedido.pk]))
+
+        self.assertEqual([item.subtotal for item in resposta.context['itens_pedido']],
+                         [Decimal('1.50'), Decimal('3.00'), Decimal('4.50')])
+        self.assertEqual(resposta.context['pedido'].total, Decimal('9.00'))
+        self.assertContains(resposta, 'R$ 9.00')
+
+
+class TotaisPedidoTests(TestCase):
+    def setUp(self):
+        self.cliente = criar_cliente()
+        self.produto = Produto.objects.create(nome='Cabo', descricao='-', preco=Decimal('4.25'), estoque=50)
+
+    def test_checkout_grava_total_e_quantidade(self):
+        pedido = finalizar_pedido(self.cliente, {self.produto.pk: 3})
+        pedido.refresh_from_db()
+        self.assertEqual((pedido.total, pedido.quantidade_itens), (Decimal('12.75'), 3))
+
+    def test_alteracao_de_itens_recalcula_o_pedido(self):
+        pedido = finalizar_pedido(self.cliente, {self.produto.pk: 1})
+        item = ItemPedido.objects.create(pedido=pedido, produto=self.produto, preco=Decimal('1.00'), quantidade=2)
+        pedido.refresh_from_db()
+        self.assertEqual((pedido.total, pedido.quantidade_itens), (Decimal('6.25'), 3))
+
+        item.delete()
+        pedido.refresh_from_db()
+        self.assertEqual((pedido.total, pedido.quantidade_itens), (Decimal('4.25'), 1))
+
+    def test_verificacao_encontra_e_corrige_divergencias(self):
+        certo = finalizar_pedido(self.cliente, {self.produto.pk: 1})
+        errado = finalizar_pedido(self.cliente, {self.produto.pk: 2})
+        Pedido.objects.filter(pk=errado.pk).update(total=0, quantidade_itens=0)
+
+        self.assertEqual(pedidos.verificar_totais(tamanho_lote=1), [errado.pk])
+        self.assertEqual(pedidos.verificar_totais(tamanho_lote=1, corrigir=True), [errado.pk])
+        self.assertEqual(pedidos.verificar_totais(), [])
+        errado.refresh_from_db()
+        self.assertEqual(errado.total, Decimal('8.50'))
+        self.assertEqual(Pedido.objects.get(pk=certo.pk).total, Decimal('4.25'))
+
+    def test_lista_filtra_e_ordena_por_valor(self):
+        for quantidade in (1, 5, 3):
+            finalizar_pedido(self.cliente, {self.produto.pk: quantidade})
+        self.client.force_login(criar_empresa())
+
+        resposta = self.client.get(reverse('pedido_list'), {'ordem': 'maior_valor', 'valor_minimo': '10'})
+
+        self.assertEqual([p.quantidade_itens for p in resposta.context['pedidos']], [5, 3])
+
+
+class CatalogoCacheTests(TestCase):
+    def setUp(self):
+        caches['catalogo'].clear()
+        self.produto = Produto.objects.create(nome='Fone', descricao='-', preco=Decimal('99.90'), estoque=1)
+
+    def test_pagina_em_cache_nao_consulta_o_banco(self):
+        self.client.get(reverse('loja_produtos'))
+        with self.assertNumQueries(0):
+            resposta = self.client.get(reverse('loja_produtos'))
+        self.assertContains(resposta, 'Fone')
+
+    def test_pagina_fora_da_faixa_usa_a_entrada_da_ultima(self):
+        self.client.get(reverse('loja_produtos'))
+        for numero in ('2', '999999'):
+            with self.assertNumQueries(0):
+                resposta = self.client.get(reverse('loja_produtos'), {'page': numero})
+            self.assertContains(resposta, 'Fone')
+
+    def test_salvar_produto_invalida_o_cache(self):
+        self.client.get(reverse('loja_produtos'))
+        self.produto.nome = 'Fone Bluetooth'
+        self.produto.save()
+        self.assertContains(self.client.get(reverse('loja_produtos')), 'Fone Bluetooth')
+
+    def test_checkout_que_esgota_o_produto_atualiza_o_selo(self):
+        self.assertContains(self.client.get(reverse('loja_produtos')), 'Adicionar ao Carrinho')
+        with self.captureOnCommitCallbacks(execute=True):
+            finalizar_pedido(criar_cliente(), {self.produto.pk: 1})
+        self.assertContains(self.client.get(reverse('loja_produtos')), 'Sem estoque')
+
+
+class CarrinhoTests(TestCase):
+    def setUp(self):
+        self.cliente = criar_cliente()
+        self.produto = Produto.objects.create(nome='Mouse', descricao='-', preco=Decimal('0.10'), estoque=10)
+        self.client.force_login(self.cliente.user)
+
+    def test_adicionar_incrementa_sem_tocar_na_sessao(self):
+        self.client.get(reverse('adicionar_ao_carrinho', args=[self.produto.pk]))
+        self.client.get(reverse('adicionar_ao_carrinho', args=[self.produto.pk]))
+        self.client.get(reverse('adicionar_ao_carrinho', args=[self.produto.pk]))
+
+        carrinho = Carrinho.objects.get(user=self.cliente.user)
+        self.assertEqual(carrinho.quantidades(), {self.produto.pk: 3})
+        self.assertEqual(carrinho.total(), Decimal('0.30'))
+        self.assertNotIn('carrinho', self.client.session)
+
+    def test_checkout_usa_o_carrinho_do_banco_e_o_esvazia(self):
+        Carrinho.do_usuario(self.cliente.user).adicionar(self.produto, 2)
+        resposta = self.client.get(reverse('checkout_pedido'))
+
+        pedido = Pedido.objects.get(cliente=self.cliente)
+        self.assertRedirects(resposta, reverse('pedido_confirmacao', args=[pedido.pk]))
+        self.assertEqual(Carrinho.do_usuario(self.cliente.user).quantidades(), {})
+
+    def test_carrinho_da_sessao_e_migrado_no_login(self):
+        self.client.logout()
+        CustomUser.objects.filter(pk=self.cliente.user.pk).update(password=make_password('senha-teste-123'))
+        sessao = self.client.session
+        sessao['carrinho'] = {str(self.produto.pk): {'nome': 'Mouse', 'preco': '0.10', 'quantidade': 4, 'imagem_url': None}}
+        sessao.save()
+
+        self.client.post(reverse('login'), {'username': 'cliente', 'password': 'senha-teste-123'})
+
+        self.assertEqual(Carrinho.do_usuario(self.cliente.user).quantidades(), {self.produto.pk: 4})
+        self.assertNotIn('carrinho', self.client.session)
+
+
+class ReservaEstoqueTests(TestCase):
+    def setUp(self):
+        self.produto = Produto.objects.create(nome='Headset', descricao='-', preco=Decimal('10.00'), estoque=2)
+        self.ana = Carrinho.do_usuario(criar_cliente('ana').user)
+        self.bia = Carrinho.do_usuario(criar_cliente('bia').user)
+
+    def disponivel(self):
+        return Produto.objects.com_disponivel().get(pk=self.produto.pk).disponivel
+
+    def test_reserva_ao_adicionar_e_bloqueia_outros_carrinhos(self):
+        reservas.adicionar_ao_carrinho(self.ana, self.produto)
+        reservas.adicionar_ao_carrinho(self.ana, self.produto)
+        self.assertEqual(self.disponivel(), 0)
+        self.assertEqual(ReservaEstoque.objects.get().quantidade, 2)
+
+        with self.assertRaises(EstoqueInsuficiente):
+            reservas.adicionar_ao_carrinho(self.bia, self.produto)
+        self.assertEqual(self.bia.quantidades(), {})
+
+        self.client.force_login(self.bia.user)
+        self.assertContains(self.client.get(reverse('loja_produtos')), 'Sem estoque')
+
+    def test_reservas_vencidas_nao_contam_e_sao_liberadas(self):
+        reservas.adicionar_ao_carrinho(self.ana, self.produto, 2)
+        ReservaEstoque.objects.update(expira_em=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self.disponivel(), 2)
+        reservas.adicionar_ao_carrinho(self.bia, self.produto)
+        self.assertEqual(reservas.liberar_expiradas(), 1)
+        self.assertEqual(list(ReservaEstoque.objects.values_list('carrinho', flat=True)), [self.bia.pk])
+
+    def test_checkout_consome_a_propria_reserva_e_respeita_as_outras(self):
+        reservas.adicionar_ao_carrinho(self.ana, self.produto)
+        self.bia.adicionar(self.produto, 2)
+
+        with self.assertRaises(EstoqueInsuficiente):
+            finalizar_pedido(Cliente.objects.get(user=self.bia.user), self.bia.quantidades(), carrinho=self.bia)
+
+        finalizar_pedido(Cliente.objects.get(user=self.ana.user), self.ana.quantidades(), carrinho=self.ana)
+        self.assertFalse(ReservaEstoque.objects.exists())
+        self.assertEqual(self.disponivel(), 1)
+
+    def test_remover_do_carrinho_libera_a_reserva(self):
+        reservas.adicionar_ao_carrinho(self.ana, self.produto)
+        self.client.force_login(self.ana.user)
+        self.client.get(reverse('remover_do_carrinho', args=[self.produto.pk]))
+        self.assertFalse(ReservaEstoque.objects.exists())
+
+
+class ClienteDaRequisicaoTests(TestCase):
+    def setUp(self):
+        self.cliente = criar_cliente()
+        self.client.force_login(self.cliente.user)
+
+    def consultas_ao_perfil(self):
+        with CaptureQueriesContext(connection) as contexto:
+            self.client.get(reverse('meus_pedidos'))
+        return [q['sql'] for q in contexto.captured_queries if 'ecommerce_cliente' in q['sql']]
+
+    def test_perfil_vem_do_cache_depois_da_primeira_requisicao(self):
+        self.assertEqual(len(self.consultas_ao_perfil()), 1)
+        self.assertEqual(self.consultas_ao_perfil(), [])
+
+    def test_salvar_o_cliente_invalida_o_cache(self):
+        clientes.cliente_do_usuario(self.cliente.user)
+        self.cliente.telefone = '11999990000'
+        self.cliente.save()
+        self.assertEqual(clientes.cliente_do_usuario(self.cliente.user).telefone, '11999990000')
+
+    def test_usuario_sem_perfil_tambem_fica_em_cache(self):
+        empresa = criar_empresa()
+        self.assertIsNone(clientes.cliente_do_usuario(empresa))
+        with self.assertNumQueries(0):
+            self.assertIsNone(clientes.cliente_do_usuario(empresa))
+
+        Cliente.objects.create(user=empresa)
+        self.assertIsNotNone(clientes.cliente_do_usuario(empresa))
+
+
+class GetCondicionalTests(TestCase):
+    def setUp(self):
+        self.cliente = criar_cliente()
+        self.produto = Produto.objects.create(nome='Pendrive', descricao='-', preco=Decimal('3.00'), estoque=5)
+        self.pedido = finalizar_pedido(self.cliente, {self.produto.pk: 1})
+        self.client.force_login(self.cliente.user)
+
+    def revalidar(self, url):
+        primeira = self.client.get(url)
+        self.assertEqual(primeira.status_code, 200)
+        self.assertIn('Cookie', primeira['Vary'])
+        self.assertIn('private', primeira['Cache-Control'])
+        return self.client.get(url, HTTP_IF_NONE_MATCH=primeira['ETag'])
+
+    def test_paginas_respondem_304_sem_renderizar(self):
+        for url in (reverse('loja_produtos'), reverse('meus_pedidos'), reverse('pedido_confirmacao', args=[self.pedido.pk])):
+            with self.subTest(url=url):
+                resposta = self.revalidar(url)
+                self.assertEqual(resposta.status_code, 304)
+                self.assertIsNone(resposta.context)
+
+    def test_alteracoes_mudam_o_etag(self):
+        url = reverse('meus_pedidos')
+        etag = self.client.get(url)['ETag']
+        finalizar_pedido(self.cliente, {self.produto.pk: 1})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        url = reverse('loja_produtos')
+        etag = self.client.get(url)['ETag']
+        reservas.adicionar_ao_carrinho(Carrinho.do_usuario(self.cliente.user), self.produto)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_loja_conta_o_carrinho_uma_vez(self):
+        reservas.adicionar_ao_carrinho(Carrinho.do_usuario(self.cliente.user), self.produto)
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.client.get(reverse('loja_produtos'))
+        contagens = [consulta for consulta in contexto.captured_queries if 'ecommerce_itemcarrinho' in consulta['sql']]
+        self.assertEqual(len(contagens), 1)
+        self.assertEqual(resposta.context['itens_no_carrinho'], 1)
+
+    def test_novo_login_muda_o_etag(self):
+        url = reverse('meus_pedidos')
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        self.client.logout()
+        self.client.force_login(self.cliente.user)
+        self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_depende_do_usuario(self):
+        url = reverse('pedido_detail', args=[self.pedido.pk])
+        self.client.force_login(criar_empresa('empresa1'))
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(criar_empresa('empresa2'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class UrlsAssincronas:
+    # As mesmas URLs do app, com as views da loja trocadas pelas versões async
+    urlpatterns = [
+        path(str(padrao.pattern), getattr(views_async, padrao.name, padrao.callback), name=padrao.name)
+        for padrao in urls.urlpatterns
+    ]
+
+
+@override_settings(ROOT_URLCONF=UrlsAssincronas)
+class ViewsAssincronasTests(TestCase):
+    def setUp(self):
+        self.cliente = criar_cliente()
+        self.produto = Produto.objects.create(nome='Teclado', descricao='-', preco=Decimal('2.50'), estoque=10)
+
+    async def test_fluxo_da_loja_com_o_orm_async(self):
+        await self.async_client.aforce_login(self.cliente.user)
+
+        await self.async_client.get(reverse('adicionar_ao_carrinho', args=[self.produto.pk]))
+        await self.async_client.get(reverse('adicionar_ao_carrinho', args=[self.produto.pk]))
+
+        resposta = await self.async_client.get(reverse('loja_produtos'))
+        self.assertContains(resposta, 'Teclado')
+        self.assertEqual(resposta.context['itens_no_carrinho'], 1)
+
+        resposta = await self.async_client.get(reverse('carrinho'))
+        self.assertEqual(resposta.context['total'], Decimal('5.00'))
+        self.assertEqual([item.quantidade for item in resposta.context['carrinho_itens']], [2])
+
+        await Pedido.objects.acreate(cliente=self.cliente)
+        resposta = await self.async_client.get(reverse('meus_pedidos'))
+        self.assertEqual(len(resposta.context['pagina']), 1)
+
+    async def test_exige_login(self):
+        resposta = await self.async_client.get(reverse('carrinho'))
+        self.assertEqual(resposta.status_code, 302)
+
+
+class BuscaTests(TestCase):
+    def setUp(self):
+        self.celular = Produto.objects.create(nome='Celular Samsung Galaxy', descricao='Tela de 6,7 polegadas', preco=Decimal('2000.00'))
+        self.fone = Produto.objects.create(nome='Fone Bluetooth', descricao='Compatível com celulares', preco=Decimal('150.00'))
+
+    def test_busca_por_prefixo_em_nome_e_descricao(self):
+        self.assertEqual(set(busca.buscar_produtos('celul')), {self.celular, self.fone})
+        self.assertEqual(busca.buscar_produtos('galaxy polegadas'), [self.celular])
+
+    def test_indice_acompanha_alteracoes_e_exclusoes(self):
+        self.fone.nome = 'Headset'
+        self.fone.descricao = 'Sem fio'
+        self.fone.save()
+        self.assertEqual(busca.buscar_produtos('bluetooth'), [])
+        self.assertEqual(busca.buscar_produtos('headset'), [self.fone])
+
+        self.celular.delete()
+        self.assertEqual(busca.buscar_produtos('samsung'), [])
+
+    def test_entrada_com_sintaxe_de_consulta_e_tratada_como_texto(self):
+        self.assertEqual(busca.buscar_produtos('"galaxy" (samsung* -'), [self.celular])
+
+    def test_resultado_com_estoque_pode_ir_para_o_carrinho(self):
+        Produto.objects.filter(pk=self.fone.pk).update(estoque=3)
+        url_carrinho = reverse('adicionar_ao_carrinho', args=[self.fone.pk])
+        self.assertContains(self.client.get(reverse('buscar_produtos'), {'q': 'bluetooth'}), url_carrinho)
+        # Bancos sem busca textual caem no icontains, que também anota a disponibilidade
+        with mock.patch.object(busca, '_vendor', return_value='mysql'):
+            self.assertEqual(busca.buscar_produtos('bluetooth')[0].disponivel, 3)
+
+
+class VendaDiariaTests(TestCase):
+    def setUp(self):
+        self.cliente = criar_cliente()
+        self.produto = Produto.objects.create(nome='Teclado', descricao='-', preco=Decimal('200.00'), estoque=10)
+
+    def consolidado(self):
+        return {
+            linha.status: (linha.quantidade, linha.receita)
+            for linha in VendaDiaria.objects.filter(produto=self.produto).exclude(quantidade=0)
+        }
+
+    def test_checkout_e_mudanca_de_status_atualizam_a_consolidacao(self):
+        pedido = finalizar_pedido(self.cliente, {self.produto.pk: 3})
+        tarefas.processar_pendentes()
+        self.assertEqual(self.consolidado(), {'aguardando_pagamento': (3, Decimal('600.00'))})
+
+        self.client.force_login(criar_empresa())
+        self.client.post(reverse('update_pedido_status', args=[pedido.pk]), {'status': 'processando'})
+        tarefas.processar_pendentes()
+        self.assertEqual(self.consolidado(), {'processando': (3, Decimal('600.00'))})
+
+    def test_mudanca_de_status_antes_do_worker_nao_conta_duas_vezes(self):
+        pedido = finalizar_pedido(self.cliente, {self.produto.pk: 2})
+        pedidos.alterar_status(pedido, 'processando')
+        tarefas.processar_pendentes()
+        self.assertEqual(self.consolidado(), {'processando': (2, Decimal('400.00'))})
+
+    def test_excluir_pedido_tira_da_consolidacao(self):
+        pedido = finalizar_pedido(self.cliente, {self.produto.pk: 3})
+        finalizar_pedido(self.cliente, {self.produto.pk: 1})
+        tarefas.processar_pendentes()
+
+        self.client.force_login(criar_empresa())
+        self.client.post(reverse('pedido_delete', args=[pedido.pk]))
+        self.assertEqual(self.consolidado(), {'aguardando_pagamento': (1, Decimal('200.00'))})
+
+    def test_excluir_pedido_com_tarefas_pendentes(self):
+        nao_registrado = finalizar_pedido(self.cliente, {self.produto.pk: 1})
+        nao_registrado.delete()
+        movido = finalizar_pedido(self.cliente, {self.produto.pk: 2})
+        tarefas.processar_pendentes()
+        pedidos.alterar_status(movido, 'processando')
+        movido.delete()
+
+        tarefas.processar_pendentes()
+        self.assertEqual(self.consolidado(), {})
+
+    def test_recalcular_reproduz_a_consolidacao_incremental(self):
+        finalizar_pedido(self.cliente, {self.produto.pk: 1})
+        finalizar_pedido(self.cliente, {self.produto.pk: 2})
+        tarefas.processar_pendentes()
+        esperado = self.consolidado()
+
+        vendas.recalcular(tamanho_lote=1)
+        self.assertEqual(self.consolidado(), esperado)
+
+    def test_dashboard_le_apenas_a_consolidacao(self):
+        finalizar_pedido(self.cliente, {self.produto.pk: 1})
+        tarefas.processar_pendentes()
+        self.client.force_login(criar_empresa())
+        resposta = self.client.get(reverse('dashboard_vendas'))
+        self.assertContains(resposta, 'Teclado')
+        self.assertEqual(resposta.context['totais']['receita'], Decimal('200.00'))
+
+
+class StatusPedidoTests(TestCase):
+    def setUp(self):
+        self.cliente = criar_cliente()
+        self.produto = Produto.objects.create(nome='Mouse', descricao='-', preco=Decimal('50.00'), estoque=10)
+        self.empresa = criar_empresa()
+
+    def criar_pedidos(self, quantidade, status='processando'):
+        criados = [finalizar_pedido(self.cliente, {self.produto.pk: 1}) for _ in range(quantidade)]
+        Pedido.objects.filter(pk__in=[pedido.pk for pedido in criados]).update(status=status)
+        return criados
+
+    def test_transicao_invalida_nao_altera_o_pedido(self):
+        [pedido] = self.criar_pedidos(1, status='entregue')
+        with self.assertRaises(pedidos.TransicaoInvalida):
+            pedidos.alterar_status(pedido, 'processando')
+
+        self.client.force_login(self.empresa)
+        resposta = self.client.post(reverse('update_pedido_status', args=[pedido.pk]), {'status': 'qualquer'}, follow=True)
+        self.assertContains(resposta, 'Escolha um status válido.')
+        self.assertEqual(Pedido.objects.get().status, 'entregue')
+        self.assertFalse(HistoricoStatusPedido.objects.exists())
+
+    def test_lote_move_apenas_os_pedidos_com_origem_permitida(self):
+        processando = self.criar_pedidos(3)
+        [entregue] = self.criar_pedidos(1, status='entregue')
+
+        # leitura + UPDATE condicional + histórico + enfileiramento das tarefas + resumo dos clientes
+        with self.assertNumQueries(7):
+            alterados = pedidos.alterar_status_em_lote(Pedido.objects.all(), 'enviado', usuario=self.empresa)
+
+        self.assertEqual(sorted(alterados), [pedido.pk for pedido in processando])
+        self.assertEqual(Pedido.objects.get(pk=entregue.pk).status, 'entregue')
+        self.assertEqual(
+            list(HistoricoStatusPedido.objects.values_list('status_anterior', 'novo_status', 'usuario').distinct()),
+            [('processando', 'enviado', self.empresa.pk)],
+        )
+
+    def test_cancelamento_devolve_o_estoque(self):
+        self.criar_pedidos(2, status='aguardando_pagamento')
+        self.assertEqual(Produto.objects.get().estoque, 8)
+
+        self.client.force_login(self.empresa)
+        self.client.post(reverse('pedido_status_lote'), {'status': 'cancelado', 'todos': '1', 'filtros': 'status=aguardando_pagamento'})
+
+        self.assertEqual(Produto.objects.get().estoque, 10)
+        self.assertEqual(Pedido.objects.filter(status='cancelado').count(), 2)
+
+    def test_todos_exige_filtro_valido(self):
+        self.criar_pedidos(2)
+        self.criar_pedidos(1, status='aguardando_pagamento')
+        self.client.force_login(self.empresa)
+        url = reverse('pedido_status_lote')
+        for filtros in ('status=processando&data_inicio=31/02/2026', '', 'ordem=maior_valor'):
+            with self.subTest(filtros=filtros):
+                self.client.post(url, {'status': 'cancelado', 'todos': '1', 'filtros': filtros})
+                self.assertFalse(Pedido.objects.filter(status='cancelado').exists())
+        self.assertEqual(Produto.objects.get().estoque, 7)
+
+
+class HistoricoClienteTests(TestCase):
+    def setUp(self):
+        self.cliente = criar_cliente()
+        self.produto = Produto.objects.create(nome='Cabo', descricao='-', preco=Decimal('10.00'), estoque=100)
+        self.client.force_login(self.cliente.user)
+
+    def resumo(self):
+        return ResumoCliente.objects.values_list('quantidade_pedidos', 'total_gasto').get(cliente=self.cliente)
+
+    def test_resumo_acompanha_checkout_cancelamento_e_exclusao(self):
+        primeiro = finalizar_pedido(self.cliente, {self.produto.pk: 2})
+        segundo = finalizar_pedido(self.cliente, {self.produto.pk: 1})
+        self.assertEqual(self.resumo(), (2, Decimal('30.00')))
+
+        pedidos.alterar_status(primeiro, 'cancelado')
+        self.assertEqual(self.resumo(), (1, Decimal('10.00')))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            segundo.delete()
+        self.assertEqual(self.resumo(), (0, Decimal('0.00')))
+
+    def test_ultimo_pedido_ignora_os_cancelados(self):
+        primeiro = finalizar_pedido(self.cliente, {self.produto.pk: 1})
+        segundo = finalizar_pedido(self.cliente, {self.produto.pk: 1})
+        pedidos.alterar_status(segundo, 'cancelado')
+        resumo = ResumoCliente.objects.get(cliente=self.cliente)
+        self.assertEqual(resumo.ultimo_pedido_em, primeiro.data_pedido)
+
+        pedidos.alterar_status(primeiro, 'cancelado')
+        self.assertIsNone(ResumoCliente.objects.get(cliente=self.cliente).ultimo_pedido_em)
+
+    def test_pagina_por_cursor_com_consultas_constantes(self):
+        for _ in range(12):
+            finalizar_pedido(self.cliente, {self.produto.pk: 1})
+        url = reverse('meus_pedidos')
+        self.client.get(url)
+
+        # sessão + usuário + ETag (resumo) + página de pedidos + itens com produtos + resumo
+        with self.assertNumQueries(6):
+            resposta = self.client.get(url)
+        pagina = resposta.context['pagina']
+        self.assertEqual(len(pagina), 10)
+        self.assertEqual(resposta.context['resumo'].quantidade_pedidos, 12)
+
+        resposta = self.client.get(url, {'cursor': pagina.proximo_cursor})
+        self.assertEqual(len(resposta.context['pagina']), 2)
+        self.assertFalse(resposta.context['pagina'].tem_proxima)
+        self.assertEqual(self.client.get(url, {'cursor': 'invalido'}).status_code, 404)
+
+    def test_mudanca_de_status_muda_o_etag(self):
+        pedido = finalizar_pedido(self.cliente, {self.produto.pk: 1})
+        url = reverse('meus_pedidos')
+        etag = self.client.get(url)['ETag']
+        pedidos.alterar_status(pedido, 'processando')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pedido_criado_pela_equipe_entra_no_resumo(self):
+        finalizar_pedido(self.cliente, {self.produto.pk: 1})
+        url = reverse('meus_pedidos')
+        etag = self.client.get(url)['ETag']
+
+        equipe = self.client_class()
+        equipe.force_login(criar_empresa())
+        equipe.post(reverse('pedido_create'), {'cliente': self.cliente.pk, 'status': 'aguardando_pagamento'})
+
+        self.assertEqual(self.resumo(), (2, Decimal('10.00')))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class HistoricoProdutoTests(TestCase):
+    def setUp(self):
+        self.produto = Produto.objects.create(sku='M1', nome='Monitor', descricao='-', preco=Decimal('900.00'), estoque=10)
+        self.cliente = criar_cliente()
+
+    def estados(self):
+        return list(HistoricoProduto.objects.order_by('id').values_list('preco', 'estoque', 'origem'))
+
+    def test_registra_so_as_alteracoes_de_preco_e_estoque(self):
+        produto = Produto.objects.get()
+        produto.nome = 'Monitor 24"'
+        produto.save()
+        produto.preco = Decimal('850.00')
+        produto.save()
+        pedido = finalizar_pedido(self.cliente, {produto.pk: 3})
+        pedidos.alterar_status(pedido, 'cancelado')
+        importacao.importar_produtos([(1, {'sku': 'M1', 'nome': 'Monitor', 'descricao': '-', 'preco': '850.00', 'estoque': '10'})])
+
+        self.assertEqual(self.estados(), [
+            (Decimal('900.00'), 10, 'edicao'),
+            (Decimal('850.00'), 10, 'edicao'),
+            (Decimal('850.00'), 7, 'checkout'),
+            (Decimal('850.00'), 10, 'devolucao'),
+        ])
+
+    def test_estado_no_instante_e_compactacao_diaria(self):
+        inicio = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=100)
+        HistoricoProduto.objects.all().delete()
+        HistoricoProduto.objects.bulk_create([
+            HistoricoProduto(produto=self.produto, registrado_em=inicio + timedelta(hours=horas), preco=Decimal('900.00'),
+                             estoque=estoque, origem='checkout')
+            for horas, estoque in [(0, 10), (1, 9), (2, 8), (24, 7), (25, 6), (24 * 99, 5)]
+        ])
+        self.assertEqual(historico_produtos.no_instante(self.produto.pk, inicio + timedelta(minutes=90)).estoque, 9)
+        self.assertIsNone(historico_produtos.no_instante(self.produto.pk, inicio - timedelta(days=1)))
+
+        self.assertEqual(historico_produtos.compactar(timezone.now() - timedelta(days=90)), 3)
+        self.assertEqual(
+            [(linha.estoque, linha.origem) for linha in HistoricoProduto.objects.order_by('registrado_em')],
+            [(8, 'diario'), (6, 'diario'), (5, 'checkout')],
+        )
+        # O fim de cada dia continua exato
+        self.assertEqual(historico_produtos.no_instante(self.produto.pk, inicio + timedelta(hours=30)).estoque, 6)
+
+    def test_api_de_instante_e_serie(self):
+        url = reverse('api_produto_historico', args=[self.produto.pk])
+        self.client.force_login(self.cliente.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(criar_empresa())
+        antes = timezone.now()
+        for estoque in (9, 8, 7):
+            Produto.objects.filter(pk=self.produto.pk).update(estoque=estoque)
+            historico_produtos.registrar_produtos([self.produto.pk], 'edicao')
+
+        resposta = self.client.get(url, {'em': antes.isoformat()}).json()
+        self.assertEqual(resposta['estado']['estoque'], 10)
+
+        pagina = self.client.get(url, {'inicio': antes.isoformat(), 'tamanho': 2}).json()
+        self.assertEqual(pagina['inicial']['estoque'], 10)
+        self.assertEqual([linha['estoque'] for linha in pagina['resultados']], [9, 8])
+        pagina = self.client.get(url, {'inicio': antes.isoformat(), 'cursor': pagina['proximo_cursor']}).json()
+        self.assertEqual([linha['estoque'] for linha in pagina['resultados']], [7])
+        self.assertNotIn('inicial', pagina)
+        self.assertEqual(self.client.get(url, {'em': 'ontem'}).status_code, 400)
+
+class ImportacaoExportacaoTests(TestCase):
+    def test_importa_em_lotes_atualizando_pelo_sku_e_reportando_erros(self):
+        Produto.objects.create(sku='A1', nome='Antigo', descricao='-', preco=Decimal('1.00'), estoque=1)
+        arquivo = io.StringIO(
+            'sku,nome,descricao,preco,estoque\n'
+            'A1,Cabo USB,Cabo de 1 metro,19.90,50\n'
+            'B2,Carregador,Turbo,abc,10\n'
+            'C3,Capinha,Silicone,25.00,5\n'
+        )
+        resultado = importacao.importar_produtos(importacao.ler_linhas(arquivo, 'csv'), tamanho_lote=1)
+
+        self.assertEqual((resultado.lidas, resultado.gravadas, resultado.total_erros), (3, 2, 1))
+        self.assertEqual(resultado.erros[0][0], 3)
+        self.assertEqual(Produto.objects.get(sku='A1').nome, 'Cabo USB')
+        self.assertEqual(Produto.objects.count(), 2)
+        self.assertEqual(busca.buscar_produtos('capinha'), [Produto.objects.get(sku='C3')])
+
+    def test_arquivo_fora_do_utf8_vira_erro_de_linha(self):
+        conteudo = 'sku,nome,descricao,preco,estoque\nA1,Cabo,-,1.00,1\nB2,Cartão,-,2.00,2\n'.encode('latin-1')
+        self.client.force_login(criar_empresa())
+        resposta = self.client.post(reverse('produto_import'), {
+            'arquivo': SimpleUploadedFile('produtos.csv', conteudo, content_type='text/csv'),
+        })
+
+        self.assertEqual(resposta.status_code, 200)
+        resultado = resposta.context['resultado']
+        self.assertEqual(resultado.total_erros, 1)
+        self.assertIn('UTF-8', resultado.erros[0][1])
+
+    def test_exportacao_em_streaming(self):
+        Produto.objects.create(sku='A1', nome='Cabo', descricao='-', preco=Decimal('9.90'), estoque=3)
+        self.client.force_login(criar_empresa())
+        resposta = self.client.get(reverse('produto_export'), {'formato': 'jsonl'})
+
+        self.assertTrue(resposta.streaming)
+        linhas = b''.join(resposta.streaming_content).decode().splitlines()
+        self.assertEqual(json.loads(linhas[0])['sku'], 'A1')
+
+
+class ExportacaoPedidosTests(TestCase):
+    def setUp(self):
+        cliente = criar_cliente()
+        produtos = [Produto.objects.create(sku=f'P{i}', nome=f'Produto {i}', descricao='-', preco=Decimal('2.50'), estoque=10)
+                    for i in range(3)]
+        self.pedido = finalizar_pedido(cliente, {produtos[0].pk: 2, produtos[1].pk: 1})
+        self.cancelado = finalizar_pedido(cliente, {produtos[2].pk: 1})
+        Pedido.objects.filter(pk=self.cancelado.pk).update(status='cancelado')
+        self.client.force_login(criar_empresa())
+
+    def exportar(self, **parametros):
+        resposta = self.client.get(reverse('pedido_export'), {'formato': 'jsonl', **parametros})
+        self.assertTrue(resposta.streaming)
+        return [json.loads(linha) for linha in b''.join(resposta.streaming_content).decode().splitlines()]
+
+    def test_uma_linha_por_item_com_pedido_e_cliente_em_uma_consulta(self):
+        # sessão + usuário + uma única consulta com os joins
+        with self.assertNumQueries(3):
+            linhas = self.exportar(status='aguardando_pagamento')
+        self.assertEqual([(linha['pedido_id'], linha['sku'], linha['subtotal']) for linha in linhas],
+                         [(self.pedido.pk, 'P0', '5.00'), (self.pedido.pk, 'P1', '2.50')])
+        self.assertEqual(linhas[0]['cliente'], 'cliente')
+
+    def test_retoma_depois_do_ultimo_id_recebido(self):
+        primeira, *resto = self.exportar()
+        self.assertEqual(self.exportar(apos=primeira['id']), resto)
+        self.assertEqual(self.client.get(reverse('pedido_export'), {'apos': 'x'}).status_code, 400)
+
+    def test_vendas_em_csv(self):
+        vendas.registrar_pedidos([self.pedido.pk, self.cancelado.pk])
+        resposta = self.client.get(reverse('vendas_export'), {'status': 'cancelado'})
+        linhas = b''.join(resposta.streaming_content).decode().splitlines()
+        self.assertEqual(linhas[0], 'id,dia,status,produto_id,sku,produto_nome,quantidade,receita')
+        self.assertEqual(len(linhas), 2)
+        self.assertIn(',cancelado,', linhas[1])
+
+
+@override_settings(IMAGENS_THREADS=0, CLOUDINARY_ATIVO=False)
+class ImagemProdutoTests(TestCase):
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.pasta)
+        armazenamentos = {**settings.STORAGES, 'derivados': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': self.pasta, 'base_url': '/media/derivados/'},
+        }, 'imagens': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': self.pasta, 'base_url': '/media/'},
+        }}
+        contexto = override_settings(STORAGES=armazenamentos)
+        contexto.enable()
+        self.addCleanup(contexto.disable)
+        caches['catalogo'].clear()
+
+    def imagem_png(self, largura=1000, altura=600):
+        saida = io.BytesIO()
+        Image.new('RGB', (largura, altura), 'blue').save(saida, format='PNG')
+        return SimpleUploadedFile('foto.png', saida.getvalue(), content_type='image/png')
+
+    def test_upload_gera_miniaturas_e_catalogo_usa_srcset(self):
+        self.client.force_login(criar_empresa())
+        self.client.post(reverse('produto_create'), {
+            'nome': 'Monitor', 'descricao': '-', 'preco': '900.00', 'estoque': 2, 'imagem': self.imagem_png(),
+        })
+
+        produto = Produto.objects.get(nome='Monitor')
+        self.assertTrue(imagens.prontos(produto.imagem_hash))
+        # Sem Cloudinary, a original fica no armazenamento local
+        self.assertEqual(produto.imagem.url, '/media/produtos/foto.png')
+        with Image.open(os.path.join(self.pasta, produto.imagem_hash, '400.webp')) as miniatura:
+            self.assertEqual(miniatura.size, (400, 240))
+
+        resposta = self.client.get(reverse('loja_produtos'))
+        self.assertContains(resposta, f'/media/derivados/{produto.imagem_hash}/800.webp 800w')
+
+    @override_settings(CLOUDINARY_STORAGE={'CLOUD_NAME': 'loja', 'API_KEY': 'k', 'API_SECRET': 's'})
+    def test_cloudinary_le_os_nomes_gravados_pelo_campo_antigo(self):
+        with mock.patch.object(armazenamento, '_configurado', False):
+            url = armazenamento.CloudinaryStorage().url('image/upload/v1700000000/produtos/abc.jpg')
+        self.assertEqual(url, 'https://res.cloudinary.com/loja/image/upload/v1700000000/produtos/abc.jpg')
+
+    def test_remover_imagem_esquece_as_miniaturas(self):
+        self.client.force_login(criar_empresa())
+        self.client.post(reverse('produto_create'), {
+            'nome': 'Monitor', 'descricao': '-', 'preco': '900.00', 'estoque': 2, 'imagem': self.imagem_png(),
+        })
+        produto = Produto.objects.get(nome='Monitor')
+
+        self.client.post(reverse('produto_update', args=[produto.pk]), {
+            'nome': 'Monitor', 'descricao': '-', 'preco': '900.00', 'estoque': 2, 'imagem-clear': 'on',
+        })
+
+        produto.refresh_from_db()
+        self.assertFalse(produto.imagem)
+        self.assertEqual(produto.imagem_hash, '')
+
+    def test_gerar_miniaturas_preenche_produtos_antigos(self):
+        # Produto de antes das miniaturas: só a imagem original, sem hash
+        produto = Produto.objects.create(nome='Monitor', descricao='-', preco=1, estoque=1, imagem=self.imagem_png())
+        self.assertEqual(produto.imagem_hash, '')
+
+        call_command('gerar_miniaturas', stdout=io.StringIO())
+
+        produto.refresh_from_db()
+        self.assertEqual(produto.imagem_hash, imagens.hash_do_conteudo(self.imagem_png().read()))
+        self.assertTrue(imagens.prontos(produto.imagem_hash))
+
+    def test_mesma_imagem_nao_e_processada_duas_vezes(self):
+        conteudo = self.imagem_png().read()
+        hash_imagem = imagens.agendar_derivados(conteudo)
+        with mock.patch.object(imagens, 'gerar_derivados') as gerar:
+            self.assertEqual(imagens.agendar_derivados(conteudo), hash_imagem)
+        gerar.assert_not_called()
+
+
+class TarefaTests(TestCase):
+    def test_checkout_envia_confirmacao_pelo_worker(self):
+        cliente = criar_cliente()
+        CustomUser.objects.filter(pk=cliente.user.pk).update(email='cliente@example.com')
+        produto = Produto.objects.create(nome='Cabo', descricao='-', preco=Decimal('10.00'), estoque=5)
+        pedido = finalizar_pedido(cliente, {produto.pk: 1})
+        self.assertEqual(len(mail.outbox), 0)
+
+        tarefas.processar_pendentes()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(f'#{pedido.pk}', mail.outbox[0].subject)
+        self.assertFalse(Tarefa.objects.exclude(status='concluida').exists())
+
+    def test_chave_de_idempotencia_evita_duplicidade(self):
+        tarefas.enfileirar('teste.falha', chave='unica')
+        tarefas.enfileirar('teste.falha', chave='unica')
+        self.assertEqual(Tarefa.objects.count(), 1)
+
+    def test_falha_reagenda_com_espera_e_desiste_apos_o_limite(self):
+        chamadas = []
+
+        @tarefas.tarefa('teste.falha')
+        def falhar():
+            chamadas.append(1)
+            raise RuntimeError('indisponível')
+
+        tarefas.enfileirar('teste.falha', max_tentativas=2)
+        tarefas.processar_pendentes()
+        tarefa = Tarefa.objects.get()
+        self.assertEqual((tarefa.status, tarefa.tentativas), ('pendente', 1))
+        self.assertGreater(tarefa.executar_apos, tarefa.criada_em)
+        self.assertIn('indisponível', tarefa.ultimo_erro)
+
+        # Ainda não chegou a hora da nova tentativa
+        self.assertEqual(tarefas.processar_pendentes(), 0)
+
+        Tarefa.objects.update(executar_apos=tarefa.criada_em)
+        tarefas.processar_pendentes()
+        self.assertEqual(Tarefa.objects.get().status, 'falhou')
+        self.assertEqual(len(chamadas), 2)
+
+    def test_worker_lento_nao_conclui_tarefa_liberada(self):
+        @tarefas.tarefa('teste.contar')
+        def contar(falhar=False):
+            Produto.objects.create(nome='Efeito', descricao='-', preco=1)
+            if falhar:
+                raise RuntimeError('falhou')
+
+        for falhar in (False, True):
+            with self.subTest(falhar=falhar):
+                Tarefa.objects.all().delete()
+                Produto.objects.all().delete()
+                tarefas.enfileirar('teste.contar', {'falhar': falhar})
+                [lenta] = tarefas.reservar('lento')
+                # O worker lento passou do tempo limite e a tarefa foi para outro worker
+                tarefas.liberar_abandonadas(tempo_limite=-1)
+                [nova] = tarefas.reservar('rapido')
+
+                self.assertFalse(tarefas.executar(lenta))
+                self.assertFalse(Produto.objects.exists())
+                self.assertEqual(Tarefa.objects.values_list('status', 'travada_por').get(), ('executando', 'rapido'))
+
+                if not falhar:
+                    self.assertTrue(tarefas.executar(nova))
+                    self.assertEqual(Produto.objects.count(), 1)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.cliente = criar_cliente()
+        self.produtos = [
+            Produto.objects.create(nome=f'Produto {i}', descricao='-', preco=Decimal('2.50'), estoque=5)
+            for i in range(3)
+        ]
+
+    def test_lista_de_produtos_com_campos_e_cursor(self):
+        self.client.force_login(self.cliente.user)
+        url = reverse('api_produtos')
+
+        with CaptureQueriesContext(connection) as consultas:
+            dados = self.client.get(url, {'fields': 'id,preco', 'tamanho': 2}).json()
+        self.assertEqual(dados['resultados'], [
+            {'id': self.produtos[0].pk, 'preco': '2.50'},
+            {'id': self.produtos[1].pk, 'preco': '2.50'},
+        ])
+        sql = consultas.captured_queries[-1]['sql']
+        self.assertIn('"preco"', sql)
+        self.assertNotIn('"descricao"', sql)
+
+        dados = self.client.get(url, {'fields': 'id', 'tamanho': 2, 'cursor': dados['proximo_cursor']}).json()
+        self.assertEqual(dados, {'resultados': [{'id': self.produtos[2].pk}], 'proximo_cursor': None})
+
+    def test_campo_desconhecido_e_cursor_invalido(self):
+        self.client.force_login(self.cliente.user)
+        self.assertEqual(self.client.get(reverse('api_produtos'), {'fields': 'senha'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_produtos'), {'cursor': 'xx'}).status_code, 400)
+
+    def test_exige_login_e_empresa_para_escrever(self):
+        url = reverse('api_produtos')
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        self.client.force_login(self.cliente.user)
+        corpo = {'nome': 'Novo', 'descricao': '-', 'preco': '1.00', 'estoque': 1}
+        self.assertEqual(self.client.post(url, corpo, content_type='application/json').status_code, 403)
+
+        self.client.force_login(criar_empresa())
+        resposta = self.client.post(url, corpo, content_type='application/json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(resposta.json()['nome'], 'Novo')
+
+        produto_id = resposta.json()['id']
+        resposta = self.client.patch(reverse('api_produto', args=[produto_id]), {'estoque': 9}, content_type='application/json')
+        self.assertEqual((resposta.json()['nome'], resposta.json()['estoque']), ('Novo', 9))
+
+    def test_pedidos_com_itens_aninhados_em_numero_fixo_de_consultas(self):
+        for quantidade in (1, 3):
+            finalizar_pedido(self.cliente, {produto.pk: 1 for produto in self.produtos[:quantidade]})
+        self.client.force_login(self.cliente.user)
+
+        # sessão + usuário + cliente + pedidos + itens com produtos
+        with self.assertNumQueries(5):
+            dados = self.client.get(reverse('api_pedidos'), {'fields': 'id,total,itens.quantidade,itens.produto.nome'}).json()
+        self.assertEqual([len(pedido['itens']) for pedido in dados['resultados']], [3, 1])
+        self.assertEqual(dados['resultados'][0]['total'], '7.50')
+        self.assertEqual(dados['resultados'][0]['itens'][0], {'quantidade': 1, 'produto': {'nome': 'Produto 0'}})
+
+    def test_cria_pedido_a_partir_do_carrinho(self):
+        self.client.force_login(self.cliente.user)
+        resposta = self.client.post(reverse('api_carrinho'), {'produto': self.produtos[0].pk, 'quantidade': 2},
+                                    content_type='application/json')
+        self.assertEqual(resposta.json()['total'], '5.00')
+
+        resposta = self.client.post(reverse('api_pedidos'), {}, content_type='application/json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(resposta.json()['quantidade_itens'], 2)
+        self.assertEqual(Carrinho.do_usuario(self.cliente.user).quantidades(), {})
+        self.assertFalse(ReservaEstoque.objects.exists())
+
+    def test_estoque_insuficiente_responde_409(self):
+        self.client.force_login(self.cliente.user)
+        resposta = self.client.post(reverse('api_pedidos'), {'itens': [{'produto': self.produtos[0].pk, 'quantidade': 6}]},
+                                    content_type='application/json')
+        self.assertEqual(resposta.status_code, 409)
+        self.assertFalse(Pedido.objects.exists())
+
+    def test_resposta_nao_depende_do_orjson(self):
+        from . import api
+
+        dados = {'quando': timezone.now(), 'dia': timezone.now().date(), 'preco': Decimal('2.50')}
+        com_orjson = api.resposta_json(dados).content
+        with mock.patch.object(api, 'orjson', None):
+            sem_orjson = api.resposta_json(dados).content
+        self.assertEqual(json.loads(com_orjson), json.loads(sem_orjson))
+        self.assertTrue(json.loads(com_orjson)['quando'].endswith('Z'))
+
+    def test_pedido_com_itens_mantem_as_reservas_do_carrinho(self):
+        self.client.force_login(self.cliente.user)
+        reservas.adicionar_ao_carrinho(Carrinho.do_usuario(self.cliente.user), self.produtos[0], 2)
+        resposta = self.client.post(reverse('api_pedidos'), {'itens': [{'produto': self.produtos[0].pk, 'quantidade': 1}]},
+                                    content_type='application/json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(Carrinho.do_usuario(self.cliente.user).quantidades(), {self.produtos[0].pk: 2})
+        self.assertEqual(ReservaEstoque.objects.get().quantidade, 2)
+
+
+@override_settings(PERFIL_AMOSTRAGEM=1)
+class PerfilTests(TestCase):
+    def setUp(self):
+        perfil.limpar()
+        self.addCleanup(perfil.limpar)
+
+    def test_coleta_detecta_consultas_repetidas(self):
+        produtos = [Produto.objects.create(nome=f'P{i}', descricao='-', preco=1, estoque=1) for i in range(3)]
+        with perfil.Coleta() as coleta:
+            for produto in produtos:
+                Produto.objects.get(pk=produto.pk)
+            Cliente.objects.count()
+
+        self.assertEqual(coleta.consultas, 4)
+        [(sql, vezes)] = coleta.repetidas()
+        self.assertEqual(vezes, 3)
+        self.assertIn('ecommerce_produto', sql)
+
+    def test_middleware_publica_server_timing_e_metricas(self):
+        self.client.force_login(criar_empresa())
+        resposta = self.client.get(reverse('loja_produtos'))
+        self.assertIn('db;dur=', resposta['Server-Timing'])
+        self.assertIn('tpl;dur=', resposta['Server-Timing'])
+
+        metricas = self.client.get(reverse('metricas_perfil')).json()['urls']
+        self.assertEqual(metricas['loja_produtos']['amostras'], 1)
+        self.assertGreater(metricas['loja_produtos']['bytes_media'], 0)
+        self.assertGreater(metricas['loja_produtos']['consultas_max'], 0)
+
+    def test_server_timing_so_para_a_empresa(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('loja_produtos')))
+        self.client.force_login(criar_cliente().user)
+        self.assertNotIn('Server-Timing', self.client.get(reverse('loja_produtos')))
+        # A requisição continua entrando nas métricas
+        self.assertEqual(perfil.metricas()['loja_produtos']['amostras'], 2)
+
+    def test_middlewares_rodam_como_corrotina_sob_asgi(self):
+        from asgiref.sync import iscoroutinefunction
+
+        async def get_response(request):
+            return HttpResponse()
+
+        for classe in (clientes.ClienteMiddleware, perfil.PerfilMiddleware):
+            with self.subTest(middleware=classe.__name__):
+                self.assertTrue(iscoroutinefunction(classe(get_response)))
+                self.assertFalse(iscoroutinefunction(classe(lambda request: HttpResponse())))
+
+    @override_settings(ROOT_URLCONF=UrlsAssincronas)
+    async def test_mede_views_async(self):
+        await self.async_client.aforce_login(await sync_to_async(criar_empresa)())
+        resposta = await self.async_client.get(reverse('loja_produtos'))
+        self.assertIn('db;dur=', resposta['Server-Timing'])
+        self.assertGreater(perfil.metricas()['loja_produtos']['consultas_max'], 0)
+
+    @override_settings(PERFIL_AMOSTRAGEM=0)
+    def test_desligado_sem_amostragem(self):
+        resposta = self.client.get(reverse('loja_produtos'))
+        self.assertNotIn('Server-Timing', resposta)
+        self.assertEqual(perfil.metricas(), {})
+
+    def test_requisicao_sem_usuario_nao_quebra(self):
+        # O Host inválido é rejeitado antes de o AuthenticationMiddleware rodar
+        resposta = self.client.get(reverse('loja_produtos'), HTTP_HOST='evil.com')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertNotIn('Server-Timing', resposta)
+
+    @override_settings(ROOT_URLCONF=UrlsAssincronas)
+    async def test_requisicao_async_sem_usuario_nao_quebra(self):
+        resposta = await self.async_client.get(reverse('loja_produtos'), headers={'host': 'evil.com'})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertNotIn('Server-Timing', resposta)
+
+
+@override_settings(LIMITES={
+    'carrinho': {'capacidade': 2, 'por_segundo': 1},
+    'checkout': {'capacidade': 1, 'por_segundo': 0.01},
+})
+class LimitesTests(TestCase):
+    def setUp(self):
+        limites.limpar()
+        self.addCleanup(limites.limpar)
+        self.produto = Produto.objects.create(nome='Fone', descricao='-', preco=Decimal('80.00'), estoque=50)
+
+    def test_baldes_reabastecem_com_o_tempo(self):
+        relogio = mock.Mock(time=mock.Mock(return_value=1000.0), monotonic=mock.Mock(return_value=1000.0))
+        for nome in ('memoria', 'cache'):
+            with self.subTest(armazenamento=nome), override_settings(LIMITES_ARMAZENAMENTO=nome), \
+                    mock.patch.object(limites, 'time', relogio):
+                caches['limites'].clear()
+                balde = limites.armazenamento()
+                aceitas = [balde.consumir('teste', 3, 2).permitido for _ in range(4)]
+                self.assertEqual(aceitas, [True, True, True, False])
+                self.assertAlmostEqual(balde.consumir('teste', 3, 2).espera, 0.5, places=2)
+
+                relogio.time.return_value = relogio.monotonic.return_value = 1001.0
+                self.assertEqual([balde.consumir('teste', 3, 2).permitido for _ in range(3)], [True, True, False])
+                relogio.time.return_value = relogio.monotonic.return_value = 1000.0
+
+    def test_rejeita_antes_de_consultar_o_banco(self):
+        url = reverse('adicionar_ao_carrinho', args=[self.produto.pk])
+        self.client.get(url)
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 429)
+        self.assertEqual(resposta['Retry-After'], '1')
+
+        # Cada IP tem o seu balde
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.2').status_code, 302)
+
+    def test_baldes_por_usuario_e_metricas(self):
+        cliente = criar_cliente()
+        self.client.force_login(cliente.user)
+        self.assertEqual(self.client.get(reverse('checkout_pedido')).status_code, 302)
+        with self.assertNumQueries(1):  # só a sessão, para saber o usuário
+            self.assertEqual(self.client.get(reverse('checkout_pedido')).status_code, 429)
+        resposta = self.client.post(reverse('api_pedidos'), {}, content_type='application/json')
+        self.assertEqual(resposta.status_code, 429)
+        self.assertIn('tentar_em', resposta.json())
+        # A leitura da API não consome fichas
+        self.assertEqual(self.client.get(reverse('api_pedidos')).status_code, 200)
+
+        self.client.force_login(criar_empresa())
+        self.assertEqual(self.client.get(reverse('checkout_pedido')).status_code, 302)
+        metricas = self.client.get(reverse('metricas_limites')).json()['requisicoes']
+        self.assertEqual(metricas['checkout'], {'permitidas': 2, 'rejeitadas': 2})
+
+
+class BenchmarkLojaTests(TestCase):
+    def test_comando_roda_de_ponta_a_ponta(self):
+        # Em outro processo: o comando cria e destrói o próprio banco de testes.
+        # Seis checkouts seguidos passam da rajada padrão do limite 'checkout'
+        processo = subprocess.run(
+            [sys.executable, 'manage.py', 'benchmark_loja', '--escalas', '20', '--repeticoes', '6'],
+            capture_output=True, text=True, cwd=settings.BASE_DIR,
+        )
+        self.assertEqual(processo.returncode, 0, processo.stderr)
+        paginas = json.loads(processo.stdout)['escalas']['20']
+        self.assertEqual(set(paginas), {'loja_produtos', 'carrinho', 'checkout_pedido', 'pedido_list', 'pedido_detail', 'meus_pedidos'})
+
+    def test_comparacao_acusa_mais_consultas_e_tempo_acima_da_tolerancia(self):
+        from .management.commands.benchmark_loja import Command
+
+        referencia = {'escalas': {'1000': {
+            'carrinho': {'consultas': 5, 'p50_ms': 10.0},
+            'meus_pedidos': {'consultas': 4, 'p50_ms': 10.0},
+            'loja_produtos': {'consultas': 3, 'p50_ms': 1.0},
+        }}}
+        atual = {'escalas': {'1000': {
+            'carrinho': {'consultas': 6, 'p50_ms': 11.0},
+            'meus_pedidos': {'consultas': 4, 'p50_ms': 20.0},
+            # Acima de 25%, mas dentro da folga absoluta
+            'loja_produtos': {'consultas': 3, 'p50_ms': 2.5},
+        }}}
+
+        regressoes = Command()._regressoes(referencia, atual, tolerancia_tempo=0.25, folga_ms=2.0)
+
+        self.assertEqual(
+            [(r['pagina'], r['medida']) for r in regressoes],
+            [('carrinho', 'consultas'), ('meus_pedidos', 'p50_ms')],
+        )
+
+
+class ConfiguracaoBancoTests(TestCase):
+    def test_postgres_com_pool_a_partir_da_url(self):
+        from core import banco
+
+        with mock.patch.dict(os.environ, {'DATABASE_URL': 'postgres://loja:s%40nha@db:5433/loja?sslmode=require'}):
+            config = banco.configurar_banco('db.sqlite3')
+        self.assertEqual((config['NAME'], config['USER'], config['PASSWORD'], config['PORT']), ('loja', 'loja', 's@nha', '5433'))
+        self.assertEqual(config['OPTIONS']['sslmode'], 'require')
+        self.assertEqual(config['OPTIONS']['pool']['max_size'], 10)
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+
+        with mock.patch.dict(os.environ, {'DATABASE_URL': 'postgres://db/loja', 'BANCO_POOL': '0'}):
+            config = banco.configurar_banco('db.sqlite3')
+        self.assertNotIn('pool', config['OPTIONS'])
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+
+    def test_sqlite_com_wal(self):
+        from core import banco
+
+        with mock.patch.dict(os.environ, {'DATABASE_URL': ''}):
+            config = banco.configurar_banco('db.sqlite3')
+        self.assertEqual(config['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertIn('PRAGMA journal_mode=WAL', config['OPTIONS']['init_command'])
+        self.assertIn('PRAGMA synchronous=NORMAL', config['OPTIONS']['init_command'])
+
+
+class InicializacaoTests(TestCase):
+    # Cada teste sobe o Django em outro processo, com as variáveis de ambiente do caso
+    def test_inicializacao_nao_importa_o_sdk_do_cloudinary(self):
+        codigo = "import sys, django; django.setup(); import ecommerce.urls; print('cloudinary' in sys.modules)"
+        saida = subprocess.run([sys.executable, '-c', codigo], capture_output=True, text=True, cwd=settings.BASE_DIR,
+                               env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'core.settings'})
+        self.assertEqual(saida.stdout.strip(), 'False', saida.stderr)
+
+    def test_estaticos_invalido_lista_os_valores_aceitos(self):
+        saida = subprocess.run([sys.executable, '-c', 'import django; django.setup()'], capture_output=True, text=True,
+                               cwd=settings.BASE_DIR,
+                               env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'core.settings', 'ESTATICOS': 'cdn'})
+        self.assertIn("ImproperlyConfigured: ESTATICOS='cdn' inválido; use um destes: local, hash.", saida.stderr)
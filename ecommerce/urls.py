@@ -2,11 +2,14 @@ from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from . import api
 from .views import (
     ProdutoListView,
     ProdutoCreateView,
     ProdutoUpdateView,
     ProdutoDeleteView,
+    importar_produtos,
+    exportar_produtos,
     ClienteListView,
     ClienteCreateView,
     ClienteUpdateView,
@@ -20,6 +23,7 @@ from .views import (
     LogoutView,
     home,
     loja_produtos,
+    buscar_produtos,
     adicionar_ao_carrinho,
     remover_do_carrinho,  # Importe a nova view
     carrinho,
@@ -27,9 +31,19 @@ from .views import (
     checkout_pedido,
     pedido_confirmacao,
     meus_pedidos,
-    update_pedido_status
+    update_pedido_status,
+    alterar_status_pedidos,
+    exportar_pedidos,
+    exportar_vendas,
+    dashboard_vendas,
+    metricas_perfil,
+    metricas_limites,
 )
 
+# Sob ASGI (uvicorn), as views mais acessadas da loja usam as versões async
+if settings.VIEWS_ASSINCRONAS:
+    from .views_async import loja_produtos, adicionar_ao_carrinho, carrinho, meus_pedidos
+
 urlpatterns = [
     # URLs para a página inicial e autenticação
     path('', home, name='home'),
@@ -42,6 +56,8 @@ urlpatterns = [
     path('produtos/novo/', ProdutoCreateView.as_view(), name='produto_create'),
     path('produtos/<int:pk>/editar/', ProdutoUpdateView.as_view(), name='produto_update'),
     path('produtos/<int:pk>/excluir/', ProdutoDeleteView.as_view(), name='produto_delete'),
+    path('produtos/importar/', importar_produtos, name='produto_import'),
+    path('produtos/exportar/', exportar_produtos, name='produto_export'),
     
     # URLs para o CRUD de Clientes (Painel Administrativo)
     path('clientes/', ClienteListView.as_view(), name='cliente_list'),
@@ -55,9 +71,14 @@ urlpatterns = [
     path('pedidos/<int:pk>/', PedidoDetailView.as_view(), name='pedido_detail'),
     path('pedidos/<int:pk>/excluir/', PedidoDeleteView.as_view(), name='pedido_delete'),
     path('pedidos/<int:pk>/update_status/', update_pedido_status, name='update_pedido_status'),
+    path('pedidos/status/', alterar_status_pedidos, name='pedido_status_lote'),
+    path('pedidos/exportar/', exportar_pedidos, name='pedido_export'),
+    path('pedidos/dashboard/', dashboard_vendas, name='dashboard_vendas'),
+    path('pedidos/dashboard/exportar/', exportar_vendas, name='vendas_export'),
     
     # URLs para a Loja do Cliente (Público)
     path('loja/', loja_produtos, name='loja_produtos'),
+    path('loja/busca/', buscar_produtos, name='buscar_produtos'),
     path('loja/adicionar/<int:produto_id>/', adicionar_ao_carrinho, name='adicionar_ao_carrinho'),
     path('loja/remover/<int:produto_id>/', remover_do_carrinho, name='remover_do_carrinho'), # Nova URL para remover item
     path('loja/carrinho/', carrinho, name='carrinho'),
@@ -65,6 +86,18 @@ urlpatterns = [
     path('loja/checkout/', checkout_pedido, name='checkout_pedido'),
     path('loja/checkout/confirmacao/<int:pedido_id>/', pedido_confirmacao, name='pedido_confirmacao'),
     path('meus-pedidos/', meus_pedidos, name='meus_pedidos'),
+
+    path('metricas/perfil/', metricas_perfil, name='metricas_perfil'),
+    path('metricas/limites/', metricas_limites, name='metricas_limites'),
+
+    # API JSON (ver ecommerce/api.py)
+    path('api/produtos/', api.produtos, name='api_produtos'),
+    path('api/produtos/<int:pk>/', api.produto, name='api_produto'),
+    path('api/produtos/<int:pk>/historico/', api.produto_historico, name='api_produto_historico'),
+    path('api/pedidos/', api.pedidos, name='api_pedidos'),
+    path('api/pedidos/<int:pk>/', api.pedido, name='api_pedido'),
+    path('api/carrinho/', api.carrinho, name='api_carrinho'),
+    path('api/carrinho/itens/<int:produto_id>/', api.carrinho_item, name='api_carrinho_item'),
 ]
 
 # Configuração para servir arquivos de mídia durante o desenvolvimento
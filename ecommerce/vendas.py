@@ -0,0 +1,128 @@
+"""
+Manutenção incremental da tabela VendaDiaria.
+
+Cada pedido contribui com (quantidade, receita) na linha do seu dia, produto e status.
+Quando o status muda, a contribuição sai da linha do status antigo e entra na do novo.
+As atualizações rodam como tarefas assíncronas (ver ecommerce/tarefas.py).
+"""
+from django.db import connection, transaction
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+
+from .models import ItemPedido, Pedido, Tarefa, VendaDiaria
+from .tarefas import tarefa
+
+
+# Mantém cada INSERT abaixo do limite de parâmetros do SQLite
+LINHAS_POR_INSERT = 500
+
+
+def _agregar(itens):
+    """
+    Agrupa itens de pedido por dia, produto e status do pedido, com uma única query.
+    """
+    return (
+        itens
+        .annotate(dia=TruncDate('pedido__data_pedido'), status=F('pedido__status'))
+        .values('dia', 'produto_id', 'status')
+        .annotate(
+            total_quantidade=Sum('quantidade'),
+            total_receita=Sum(F('preco') * F('quantidade'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        )
+        .order_by()
+    )
+
+
+def _somar(linhas, sinal=1, status=None):
+    """
+    Soma as linhas agregadas na VendaDiaria com um upsert
+    (INSERT ... ON CONFLICT DO UPDATE), suportado pelo SQLite e pelo PostgreSQL.
+    """
+    parametros = [
+        (
+            linha['dia'],
+            linha['produto_id'],
+            status or linha['status'],
+            sinal * linha['total_quantidade'],
+            sinal * linha['total_receita'],
+        )
+        for linha in linhas
+    ]
+    if not parametros:
+        return
+    tabela = VendaDiaria._meta.db_table
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(parametros), LINHAS_POR_INSERT):
+            lote = parametros[inicio:inicio + LINHAS_POR_INSERT]
+            valores = ', '.join(['(%s, %s, %s, %s, %s)'] * len(lote))
+            cursor.execute(
+                f"INSERT INTO {tabela} (dia, produto_id, status, quantidade, receita) "
+                f"VALUES {valores} "
+                "ON CONFLICT (dia, produto_id, status) DO UPDATE SET "
+                f"quantidade = {tabela}.quantidade + EXCLUDED.quantidade, "
+                f"receita = {tabela}.receita + EXCLUDED.receita",
+                [valor for linha in lote for valor in linha],
+            )
+
+
+@tarefa('vendas.registrar_pedidos')
+def registrar_pedidos(pedido_ids, status=None):
+    """
+    Soma os itens dos pedidos informados na consolidação, no `status` que eles tinham ao
+    ser enfileirados. Se o status mudar antes de a tarefa rodar, a tarefa mover_status
+    enfileirada pela mudança é que leva a contribuição para o novo status.
+    Sem `status`, usa o status atual de cada pedido.
+    """
+    _somar(_agregar(ItemPedido.objects.filter(pedido_id__in=pedido_ids)), status=status)
+
+
+@tarefa('vendas.mover_status')
+def mover_status(pedido_ids, status_anterior, novo_status):
+    """
+    Move a contribuição dos pedidos do status anterior para o novo status.
+    """
+    if status_anterior == novo_status:
+        return
+    linhas = list(_agregar(ItemPedido.objects.filter(pedido_id__in=pedido_ids)))
+    with transaction.atomic():
+        _somar(linhas, sinal=-1, status=status_anterior)
+        _somar(linhas, status=novo_status)
+
+
+def remover_pedido(pedido):
+    """
+    Tira a contribuição do pedido da consolidação; chamada antes de os itens serem apagados.
+    As tarefas ainda pendentes do pedido não vão achar os itens, então a contribuição sai
+    do status em que ela está de fato: nenhum, se o registro ainda não rodou, ou o status
+    anterior da primeira mudança ainda não processada.
+    """
+    pendentes = Tarefa.objects.filter(status__in=('pendente', 'executando'))
+    if pendentes.filter(chave_idempotencia=f'vendas:pedido:{pedido.pk}').exists():
+        return
+    movimentos = pendentes.filter(tipo='vendas.mover_status').order_by('criada_em', 'id').values_list('dados', flat=True)
+    status = next(
+        (dados['status_anterior'] for dados in movimentos if pedido.pk in dados['pedido_ids']),
+        pedido.status,
+    )
+    _somar(_agregar(ItemPedido.objects.filter(pedido_id=pedido.pk)), sinal=-1, status=status)
+
+
+def recalcular(tamanho_lote=5000):
+    """
+    Apaga e reconstrói toda a consolidação, processando os pedidos em lotes por faixa de id.
+    Deve rodar fora do horário de vendas: pedidos criados durante o processo podem ser contados duas vezes.
+    Retorna a quantidade de lotes processados.
+    """
+    VendaDiaria.objects.all().delete()
+    ultimo_id = 0
+    lotes = 0
+    while True:
+        ids = list(
+            Pedido.objects.filter(id__gt=ultimo_id).order_by('id').values_list('id', flat=True)[:tamanho_lote]
+        )
+        if not ids:
+            return lotes
+        with transaction.atomic():
+            _somar(_agregar(ItemPedido.objects.filter(pedido_id__gte=ids[0], pedido_id__lte=ids[-1])))
+        ultimo_id = ids[-1]
+        lotes += 1
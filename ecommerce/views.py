@@ -1,16 +1,30 @@
+import io
+from datetime import timedelta
+
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView
 from django.contrib.messages.views import SuccessMessageMixin
 from django.contrib.auth.views import LoginView, LogoutView
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.utils.decorators import method_decorator
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Prefetch, Sum
 from django.contrib import messages
-from django.http import Http404
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, QueryDict
+from django.utils import timezone
+from django.utils.safestring import mark_safe
 
-from .models import Produto, Cliente, Pedido, ItemPedido, CustomUser
-from .forms import PedidoForm, CadastroForm
+from .models import Produto, Cliente, Pedido, ItemPedido, CustomUser, Carrinho, VendaDiaria
+from .forms import PedidoForm, CadastroForm, PedidoFiltroForm, ImportacaoProdutosForm
+from .checkout import finalizar_pedido, EstoqueInsuficiente, ProdutoIndisponivel
+from .paginacao import paginar_keyset, CursorInvalido
+from .pedidos import TRANSICOES, TransicaoInvalida, alterar_status, alterar_status_em_lote, historico
+from .catalogo import grade_produtos
+from . import busca, exportacao, imagens, importacao, limites, perfil, reservas
+from .limites import limitar
+from .condicional import get_condicional, itens_no_carrinho, validadores_loja, validadores_meus_pedidos, validadores_pedido
 
 
 # Decorator customizado para checar se o usuário é do tipo 'empresa'
@@ -27,18 +41,33 @@ class ProdutoListView(ListView):
     template_name = 'ecommerce/produto_list.html'
     context_object_name = 'produtos'
 
+class ImagemProdutoMixin:
+    """
+    Agenda a geração das miniaturas locais quando uma imagem é enviada e
+    esquece as miniaturas quando a imagem é removida.
+    """
+    def form_valid(self, form):
+        arquivo = self.request.FILES.get('imagem')
+        if arquivo:
+            form.instance.imagem_hash = imagens.agendar_derivados(arquivo.read())
+            arquivo.seek(0)
+        elif form.cleaned_data.get('imagem') is False:
+            # Marcou "Limpar" no ClearableFileInput
+            form.instance.imagem_hash = ''
+        return super().form_valid(form)
+
 @method_decorator(empresa_required, name='dispatch')
-class ProdutoCreateView(CreateView):
+class ProdutoCreateView(ImagemProdutoMixin, CreateView):
     model = Produto
     template_name = 'ecommerce/produto_form.html'
-    fields = ['nome', 'descricao', 'preco', 'estoque', 'imagem']
+    fields = ['sku', 'nome', 'descricao', 'preco', 'estoque', 'imagem']
     success_url = reverse_lazy('produto_list')
 
 @method_decorator(empresa_required, name='dispatch')
-class ProdutoUpdateView(UpdateView):
+class ProdutoUpdateView(ImagemProdutoMixin, UpdateView):
     model = Produto
     template_name = 'ecommerce/produto_form.html'
-    fields = ['nome', 'descricao', 'preco', 'estoque', 'imagem']
+    fields = ['sku', 'nome', 'descricao', 'preco', 'estoque', 'imagem']
     success_url = reverse_lazy('produto_list')
 
 @method_decorator(empresa_required, name='dispatch')
@@ -47,6 +76,31 @@ class ProdutoDeleteView(DeleteView):
     template_name = 'ecommerce/produto_confirm_delete.html'
     success_url = reverse_lazy('produto_list')
 
+@empresa_required
+def importar_produtos(request):
+    resultado = None
+    if request.method == 'POST':
+        form = ImportacaoProdutosForm(request.POST, request.FILES)
+        if form.is_valid():
+            arquivo = form.cleaned_data['arquivo']
+            texto = io.TextIOWrapper(arquivo.file, encoding='utf-8-sig', newline='')
+            resultado = importacao.importar_produtos(
+                importacao.ler_linhas(texto, importacao.formato_do_arquivo(arquivo.name))
+            )
+            messages.success(request, f'{resultado.gravadas} produtos importados.')
+    else:
+        form = ImportacaoProdutosForm()
+    return render(request, 'ecommerce/produto_import.html', {'form': form, 'resultado': resultado})
+
+@empresa_required
+def exportar_produtos(request):
+    formato = request.GET.get('formato', 'csv')
+    if formato not in exportacao.FORMATOS:
+        raise Http404('Formato de exportação inválido.')
+    campos = ['sku', 'nome', 'descricao', 'preco', 'estoque']
+    registros = Produto.objects.order_by('id').values(*campos).iterator(chunk_size=2000)
+    return exportacao.resposta_exportacao(registros, campos, formato, 'produtos')
+
 # Views para o CRUD de Clientes (Área da Empresa)
 @method_decorator(empresa_required, name='dispatch')
 class ClienteListView(ListView):
@@ -80,17 +134,55 @@ class PedidoListView(ListView):
     model = Pedido
     template_name = 'ecommerce/pedido_list.html'
     context_object_name = 'pedidos'
+    itens_por_pagina = 25
+
+    def get_queryset(self):
+        self.filtro_form = PedidoFiltroForm(self.request.GET or None)
+        self.ordenacao = self.filtro_form.ordenacao()
+        queryset = Pedido.objects.select_related('cliente__user')
+        return self.filtro_form.filtrar(queryset)
+
+    def get_context_data(self, **kwargs):
+        # Paginação por cursor: cada página custa uma única query, sem COUNT nem OFFSET
+        try:
+            pagina = paginar_keyset(
+                self.object_list,
+                self.ordenacao,
+                cursor=self.request.GET.get('cursor'),
+                tamanho=self.itens_por_pagina,
+            )
+        except CursorInvalido:
+            raise Http404('Página inválida.')
+
+        parametros = self.request.GET.copy()
+        parametros.pop('cursor', None)
+        kwargs['object_list'] = pagina.itens
+        context = super().get_context_data(**kwargs)
+        context['pagina'] = pagina
+        context['filtro_form'] = self.filtro_form
+        context['filtros_query'] = parametros.urlencode()
+        return context
 
 @method_decorator(empresa_required, name='dispatch')
+@method_decorator(get_condicional(validadores_pedido), name='dispatch')
 class PedidoDetailView(DetailView):
     model = Pedido
     template_name = 'ecommerce/pedido_detail.html'
     context_object_name = 'pedido'
     
+    def get_queryset(self):
+        # Uma query para o pedido (com cliente) e uma para todos os itens com seus produtos,
+        # qualquer que seja o número de itens
+        subtotal = ExpressionWrapper(F('preco') * F('quantidade'), output_field=DecimalField(max_digits=12, decimal_places=2))
+        itens = ItemPedido.objects.select_related('produto').annotate(subtotal=subtotal).order_by('id')
+        return Pedido.objects.select_related('cliente__user').prefetch_related(Prefetch('itens', queryset=itens))
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Obter os itens do pedido para exibir
-        context['itens_pedido'] = ItemPedido.objects.filter(pedido=self.object)
+        context['itens_pedido'] = self.object.itens.all()
+        nomes = dict(Pedido.STATUS_CHOICES)
+        context['proximos_status'] = [(status, nomes[status]) for status, _ in Pedido.STATUS_CHOICES
+                                      if status in TRANSICOES[self.object.status]]
         return context
 
 @method_decorator(empresa_required, name='dispatch')
@@ -128,96 +220,94 @@ class CadastroView(SuccessMessageMixin, CreateView):
 def home(request):
     return render(request, 'ecommerce/home.html')
 
+@get_condicional(validadores_loja)
 def loja_produtos(request):
-    produtos = Produto.objects.all()
-    return render(request, 'ecommerce/loja_produtos.html', {'produtos': produtos})
-
+    # A grade de produtos vem do cache do catálogo; só o cabeçalho é por usuário
+    html = grade_produtos(request.GET.get('page'))
+    return render(request, 'ecommerce/loja_produtos.html', {
+        'grade_produtos': mark_safe(html),
+        # Já contado pelos validadores do ETag, exceto quando há mensagens pendentes
+        'itens_no_carrinho': itens_no_carrinho(request),
+    })
+
+def buscar_produtos(request):
+    termo = request.GET.get('q', '').strip()
+    produtos = busca.buscar_produtos(termo) if termo else []
+    return render(request, 'ecommerce/busca_produtos.html', {'produtos': produtos, 'termo': termo})
+
+@limitar('carrinho')
 @login_required
 def adicionar_ao_carrinho(request, produto_id):
-    carrinho = request.session.get('carrinho', {})
     produto = get_object_or_404(Produto, id=produto_id)
-
-    if str(produto_id) in carrinho:
-        # Se o produto já está no carrinho, aumenta a quantidade
-        carrinho[str(produto_id)]['quantidade'] += 1
+    # Se o produto já está no carrinho, a quantidade é incrementada no banco e a reserva renovada
+    try:
+        reservas.adicionar_ao_carrinho(Carrinho.do_usuario(request.user), produto)
+    except EstoqueInsuficiente:
+        messages.error(request, f'O produto "{produto.nome}" não tem mais unidades disponíveis.')
     else:
-        # Adiciona o produto ao carrinho
-        carrinho[str(produto_id)] = {
-            'nome': produto.nome,
-            'preco': str(produto.preco),
-            'quantidade': 1,
-            'imagem_url': produto.imagem.url if produto.imagem else None
-        }
-
-    request.session['carrinho'] = carrinho
-    messages.success(request, f'O produto "{produto.nome}" foi adicionado ao seu carrinho!')
+        messages.success(request, f'O produto "{produto.nome}" foi adicionado ao seu carrinho!')
     return redirect('loja_produtos')
 
 @login_required
 def remover_do_carrinho(request, produto_id):
-    carrinho = request.session.get('carrinho', {})
-    produto_id_str = str(produto_id)
-
-    if produto_id_str in carrinho:
-        del carrinho[produto_id_str]
-        request.session['carrinho'] = carrinho
+    carrinho = Carrinho.do_usuario(request.user)
+    with transaction.atomic():
+        removido = carrinho.remover(produto_id)
+        reservas.liberar(carrinho, [produto_id])
+    if removido:
         messages.success(request, 'Produto removido do carrinho com sucesso!')
 
     return redirect('carrinho')
 
 @login_required
 def carrinho(request):
-    carrinho_itens = request.session.get('carrinho', {})
-    total = sum(float(item['preco']) * item['quantidade'] for item in carrinho_itens.values())
-    return render(request, 'ecommerce/carrinho.html', {'carrinho_itens': carrinho_itens, 'total': total})
+    carrinho = Carrinho.do_usuario(request.user)
+    carrinho_itens = carrinho.itens.select_related('produto').order_by('id')
+    return render(request, 'ecommerce/carrinho.html', {'carrinho_itens': carrinho_itens, 'total': carrinho.total()})
 
 @login_required
 def limpar_carrinho(request):
-    if 'carrinho' in request.session:
-        del request.session['carrinho']
+    carrinho = Carrinho.do_usuario(request.user)
+    with transaction.atomic():
+        limpo = carrinho.limpar()
+        reservas.liberar(carrinho)
+    if limpo:
         messages.info(request, 'Seu carrinho foi esvaziado.')
     return redirect('loja_produtos')
 
+@limitar('checkout')
 @login_required
 def checkout_pedido(request):
+    # Perfil do usuário logado, resolvido pelo ClienteMiddleware (em cache por usuário)
+    cliente = request.cliente
+    if not cliente:
+        messages.error(request, 'Erro: Cliente não encontrado. Por favor, complete seu cadastro.')
+        return redirect('cadastro')
+
     try:
-        # Obter o cliente a partir do usuário logado
-        cliente = Cliente.objects.get(user=request.user)
-        carrinho_itens = request.session.get('carrinho', {})
-
-        if not carrinho_itens:
-            messages.error(request, 'Seu carrinho está vazio.')
-            return redirect('carrinho')
-
-        # Criar um novo pedido
-        novo_pedido = Pedido.objects.create(cliente=cliente)
-
-        # Adicionar os itens do carrinho ao pedido
-        for produto_id, item in carrinho_itens.items():
-            produto = get_object_or_404(Produto, pk=produto_id)
-            ItemPedido.objects.create(
-                pedido=novo_pedido,
-                produto=produto,
-                quantidade=item['quantidade'],
-                preco=item['preco']  # Corrigido aqui: trocado 'preco_unitario' por 'preco'
-            )
-            # Atualiza o estoque do produto
-            produto.estoque -= item['quantidade']
-            produto.save()
+        carrinho = Carrinho.do_usuario(request.user)
+        # Cria o pedido, os itens, baixa o estoque e limpa o carrinho em uma única transação;
+        # os itens são lidos dentro dela para que nada adicionado no meio seja apagado sem ser pedido
+        with transaction.atomic():
+            quantidades = carrinho.quantidades()
+            if not quantidades:
+                messages.error(request, 'Seu carrinho está vazio.')
+                return redirect('carrinho')
+            novo_pedido = finalizar_pedido(cliente, quantidades, carrinho=carrinho)
+            carrinho.limpar()
 
-        # Limpa o carrinho
-        del request.session['carrinho']
         messages.success(request, 'Seu pedido foi realizado com sucesso!')
         return redirect('pedido_confirmacao', pedido_id=novo_pedido.id)
 
-    except Cliente.DoesNotExist:
-        messages.error(request, 'Erro: Cliente não encontrado. Por favor, complete seu cadastro.')
-        return redirect('cadastro')
+    except (EstoqueInsuficiente, ProdutoIndisponivel) as e:
+        messages.error(request, f'Não foi possível finalizar o pedido: {e}')
+        return redirect('carrinho')
     except Exception as e:
         messages.error(request, f'Ocorreu um erro ao finalizar o pedido: {e}')
         return redirect('carrinho')
 
 @login_required
+@get_condicional(validadores_pedido)
 def pedido_confirmacao(request, pedido_id):
     """
     Exibe a página de confirmação do pedido.
@@ -230,23 +320,206 @@ def update_pedido_status(request, pk):
     if request.method == 'POST':
         pedido = get_object_or_404(Pedido, pk=pk)
         novo_status = request.POST.get('status')
-        if novo_status:
-            pedido.status = novo_status
-            pedido.save()
-            messages.success(request, f'O status do pedido #{pedido.id} foi atualizado para \"{novo_status}\".')
+        if novo_status not in dict(Pedido.STATUS_CHOICES):
+            messages.error(request, 'Escolha um status válido.')
+        elif novo_status != pedido.status:
+            try:
+                alterar_status(pedido, novo_status, usuario=request.user)
+            except TransicaoInvalida as erro:
+                messages.error(request, str(erro))
+            else:
+                messages.success(request, f'O status do pedido #{pedido.id} foi atualizado para \"{pedido.get_status_display()}\".')
     return redirect('pedido_detail', pk=pk)
 
+@empresa_required
+def alterar_status_pedidos(request):
+    """
+    Ação em lote da lista de pedidos: muda o status dos pedidos selecionados ou,
+    com "todos", de todos os pedidos do filtro atual (ex.: processando -> enviado).
+    """
+    if request.method != 'POST':
+        return redirect('pedido_list')
+    filtros = QueryDict(request.POST.get('filtros', ''))
+    voltar = f"{reverse('pedido_list')}?{filtros.urlencode()}"
+    novo_status = request.POST.get('status')
+    if novo_status not in dict(Pedido.STATUS_CHOICES):
+        messages.error(request, 'Escolha um status válido.')
+        return redirect(voltar)
+
+    if request.POST.get('todos'):
+        form = PedidoFiltroForm(filtros)
+        # Um filtro inválido ou vazio alteraria todos os pedidos da tabela
+        if not form.is_valid():
+            messages.error(request, 'Os filtros são inválidos; corrija-os antes de alterar todos os pedidos do filtro.')
+            return redirect(voltar)
+        if not any(valor not in (None, '') for campo, valor in form.cleaned_data.items() if campo != 'ordem'):
+            messages.error(request, 'Filtre os pedidos antes de alterar todos de uma vez.')
+            return redirect(voltar)
+        pedidos = form.filtrar(Pedido.objects.all())
+    else:
+        pedidos = Pedido.objects.filter(pk__in=[pk for pk in request.POST.getlist('pedidos') if pk.isdigit()])
+    alterados = alterar_status_em_lote(pedidos, novo_status, usuario=request.user)
+    nome = dict(Pedido.STATUS_CHOICES)[novo_status]
+    if alterados:
+        messages.success(request, f'{len(alterados)} pedido(s) atualizado(s) para "{nome}".')
+    else:
+        messages.warning(request, f'Nenhum dos pedidos pode passar para "{nome}".')
+    return redirect(voltar)
+
 @login_required
+@get_condicional(validadores_meus_pedidos)
 def meus_pedidos(request):
     """
     Exibe a lista de pedidos do cliente logado.
     """
-    # Obter o cliente a partir do usuário logado
+    # Se o usuário não tem um perfil de cliente, retorna uma lista vazia
+    pagina = resumo = None
+    if request.cliente:
+        try:
+            pagina, resumo = historico(request.cliente, cursor=request.GET.get('cursor'))
+        except CursorInvalido:
+            raise Http404('Página inválida.')
+
+    return render(request, 'ecommerce/meus_pedidos.html', {'pagina': pagina, 'resumo': resumo})
+
+
+@empresa_required
+def dashboard_vendas(request):
+    """
+    Painel de vendas da empresa. Lê apenas a consolidação diária (VendaDiaria),
+    nunca os itens de pedido, então o custo não cresce com o número de pedidos.
+    """
     try:
-        cliente = Cliente.objects.get(user=request.user)
-        pedidos = Pedido.objects.filter(cliente=cliente).order_by('-data_pedido')
-    except Cliente.DoesNotExist:
-        # Se o usuário não tem um perfil de cliente, retorna uma lista vazia
-        pedidos = None
-    
-    return render(request, 'ecommerce/meus_pedidos.html', {'pedidos': pedidos})
+        dias = min(max(int(request.GET.get('dias', 30)), 1), 365)
+    except ValueError:
+        dias = 30
+    inicio = timezone.localdate() - timedelta(days=dias - 1)
+    vendas_periodo = VendaDiaria.objects.filter(dia__gte=inicio)
+    validas = vendas_periodo.exclude(status='cancelado')
+
+    totais = validas.aggregate(quantidade=Sum('quantidade'), receita=Sum('receita'))
+    status_nomes = dict(Pedido.STATUS_CHOICES)
+    por_status = [
+        {**linha, 'nome': status_nomes.get(linha['status'], linha['status'])}
+        for linha in vendas_periodo.values('status').annotate(
+            quantidade_total=Sum('quantidade'), receita_total=Sum('receita')
+        ).order_by('status')
+    ]
+    top_produtos = (
+        validas.values('produto_id', 'produto__nome')
+        .annotate(quantidade_total=Sum('quantidade'), receita_total=Sum('receita'))
+        .order_by('-receita_total')[:10]
+    )
+    por_dia = (
+        validas.values('dia')
+        .annotate(quantidade_total=Sum('quantidade'), receita_total=Sum('receita'))
+        .order_by('-dia')
+    )
+    return render(request, 'ecommerce/dashboard_vendas.html', {
+        'dias': dias,
+        'inicio': inicio,
+        'opcoes_dias': [7, 30, 90, 365],
+        'totais': totais,
+        'por_status': por_status,
+        'top_produtos': top_produtos,
+        'por_dia': por_dia,
+    })
+
+
+def _exportar(request, nome_arquivo, campos, registros, completar=None):
+    """
+    Parte comum das exportações de pedidos e vendas: formato, filtros de status e
+    período e ?apos=<id> para retomar depois do último registro recebido.
+    `registros(filtro)` devolve o queryset de valores (.values()) a exportar;
+    `completar(linha)`, se informado, acrescenta colunas calculadas a cada linha.
+    """
+    formato = request.GET.get('formato', 'csv')
+    if formato not in exportacao.FORMATOS:
+        raise Http404('Formato de exportação inválido.')
+    filtro = PedidoFiltroForm(request.GET)
+    if not filtro.is_valid():
+        return HttpResponseBadRequest('Filtros inválidos.')
+    try:
+        consulta = exportacao.continuar_apos(registros(filtro), request.GET.get('apos'))
+    except ValueError:
+        return HttpResponseBadRequest('O parâmetro "apos" deve ser um id.')
+    # iterator(): as linhas são lidas do banco em blocos enquanto a resposta é enviada
+    linhas = consulta.iterator(chunk_size=2000)
+    if completar is not None:
+        linhas = map(completar, linhas)
+    return exportacao.resposta_exportacao(linhas, campos, formato, nome_arquivo)
+
+
+@empresa_required
+def exportar_pedidos(request):
+    """
+    Exporta uma linha por item de pedido, com os dados do pedido e do cliente.
+    """
+    campos = [
+        'id', 'pedido_id', 'data_pedido', 'status', 'cliente_id', 'cliente', 'email',
+        'sku', 'produto_nome', 'quantidade', 'preco', 'subtotal',
+    ]
+
+    def registros(filtro):
+        return filtro.filtrar(ItemPedido.objects.all(), prefixo='pedido__').values(
+            'id', 'pedido_id', 'quantidade', 'preco',
+            data_pedido=F('pedido__data_pedido'),
+            status=F('pedido__status'),
+            cliente_id=F('pedido__cliente_id'),
+            cliente=F('pedido__cliente__user__username'),
+            email=F('pedido__cliente__user__email'),
+            sku=F('produto__sku'),
+            produto_nome=F('produto__nome'),
+        )
+
+    def completar(linha):
+        # Em Python: no SQLite o produto calculado no banco perde as casas decimais
+        linha['subtotal'] = linha['quantidade'] * linha['preco']
+        return linha
+    return _exportar(request, 'pedidos', campos, registros, completar)
+
+
+@empresa_required
+def exportar_vendas(request):
+    """
+    Exporta a consolidação diária de vendas (VendaDiaria) por produto e status.
+    """
+    campos = ['id', 'dia', 'status', 'produto_id', 'sku', 'produto_nome', 'quantidade', 'receita']
+
+    def registros(filtro):
+        vendas = VendaDiaria.objects.all()
+        if filtro.cleaned_data['status']:
+            vendas = vendas.filter(status=filtro.cleaned_data['status'])
+        if filtro.cleaned_data['data_inicio']:
+            vendas = vendas.filter(dia__gte=filtro.cleaned_data['data_inicio'])
+        if filtro.cleaned_data['data_fim']:
+            vendas = vendas.filter(dia__lte=filtro.cleaned_data['data_fim'])
+        return vendas.values(
+            'id', 'dia', 'status', 'produto_id', 'quantidade', 'receita',
+            sku=F('produto__sku'),
+            produto_nome=F('produto__nome'),
+        )
+    return _exportar(request, 'vendas', campos, registros)
+
+
+@empresa_required
+def metricas_perfil(request):
+    """
+    Métricas do PerfilMiddleware deste processo, por nome de URL.
+    """
+    return JsonResponse({
+        'amostragem': settings.PERFIL_AMOSTRAGEM,
+        'urls': perfil.metricas(),
+    })
+
+
+@empresa_required
+def metricas_limites(request):
+    """
+    Requisições aceitas e rejeitadas pelos limites deste processo.
+    """
+    return JsonResponse({
+        'armazenamento': settings.LIMITES_ARMAZENAMENTO,
+        'limites': settings.LIMITES,
+        'requisicoes': limites.metricas(),
+    })
@@ -0,0 +1,85 @@
+"""
+Versões async das views da loja, para rodar sob ASGI (uvicorn).
+
+Fazem o mesmo que as views de views.py, mas usam o ORM async do Django, então
+uma requisição esperando o banco não ocupa uma thread do servidor. Ficam ativas
+quando VIEWS_ASSINCRONAS está ligado (ver ecommerce/urls.py).
+
+Os templates não podem consultar o banco dentro de uma view async: o usuário é
+carregado com request.auser() e as listas são materializadas antes do render().
+"""
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import Http404
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.utils.safestring import mark_safe
+
+from . import reservas
+from .catalogo import agrade_produtos
+from .condicional import aitens_no_carrinho, get_condicional, validadores_loja, validadores_meus_pedidos
+from .limites import limitar
+from .checkout import EstoqueInsuficiente
+from .models import Carrinho, Produto
+from .paginacao import CursorInvalido
+from .pedidos import historico
+
+
+async def _carregar_usuario(request):
+    # O context processor de auth lê request.user de forma síncrona;
+    # trocando o objeto preguiçoso pelo usuário já carregado, o template não vai ao banco.
+    request.user = await request.auser()
+    return request.user
+
+
+@get_condicional(validadores_loja)
+async def loja_produtos(request):
+    html = await agrade_produtos(request.GET.get('page'))
+    await _carregar_usuario(request)
+    return render(request, 'ecommerce/loja_produtos.html', {
+        'grade_produtos': mark_safe(html),
+        'itens_no_carrinho': await aitens_no_carrinho(request),
+    })
+
+
+@limitar('carrinho')
+@login_required
+async def adicionar_ao_carrinho(request, produto_id):
+    user = await _carregar_usuario(request)
+    produto = await aget_object_or_404(Produto, id=produto_id)
+    carrinho = await Carrinho.ado_usuario(user)
+    # A reserva de estoque precisa de uma transação, que o ORM async não abre
+    try:
+        await sync_to_async(reservas.adicionar_ao_carrinho)(carrinho, produto)
+    except EstoqueInsuficiente:
+        messages.error(request, f'O produto "{produto.nome}" não tem mais unidades disponíveis.')
+    else:
+        messages.success(request, f'O produto "{produto.nome}" foi adicionado ao seu carrinho!')
+    return redirect('loja_produtos')
+
+
+@login_required
+async def carrinho(request):
+    user = await _carregar_usuario(request)
+    carrinho = await Carrinho.ado_usuario(user)
+    carrinho_itens = [item async for item in carrinho.itens.select_related('produto').order_by('id')]
+    return render(request, 'ecommerce/carrinho.html', {'carrinho_itens': carrinho_itens, 'total': await carrinho.atotal()})
+
+
+@login_required
+@get_condicional(validadores_meus_pedidos)
+async def meus_pedidos(request):
+    """
+    Exibe a lista de pedidos do cliente logado.
+    """
+    await _carregar_usuario(request)
+    cliente = await request.acliente()
+    pagina = resumo = None
+    if cliente:
+        try:
+            # A página já vem materializada, com os itens pré-carregados
+            pagina, resumo = await sync_to_async(historico)(cliente, cursor=request.GET.get('cursor'))
+        except CursorInvalido:
+            raise Http404('Página inválida.')
+
+    return render(request, 'ecommerce/meus_pedidos.html', {'pagina': pagina, 'resumo': resumo})